@@ -1,38 +1,27 @@
-from flask import Blueprint, request, jsonify
-import requests
-import os
-from jose import jwt
+from flask import Blueprint, Response, current_app, g, request, jsonify, stream_with_context
+import httpx
+import json
+from concurrent.futures import ThreadPoolExecutor
+from .auth import public
+from .provider_clients import get_provider_client
+from . import call_policy
+from . import documents
+from . import profiling
+from . import response_cache
+from . import routing
+from . import singleflight
+from . import tokens
+from .summarizer import single_prompt
 
 ai_bp = Blueprint("ai", __name__)
 
-# JWT Configuration
-SECRET_KEY = os.environ.get('SECRET_KEY', 'your-secret-key-here')
-ALGORITHM = "HS256"
-
-def verify_token():
-    """Verify JWT token from request"""
-    auth_header = request.headers.get('Authorization')
-    if not auth_header or not auth_header.startswith('Bearer '):
-        return None, jsonify({"error": "Authorization header missing or invalid"}), 401
-    
-    token = auth_header.split(' ')[1]
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id = payload.get("sub")
-        if user_id is None:
-            return None, jsonify({"error": "Invalid token"}), 401
-        return user_id, None, None
-    except jwt.JWTError:
-        return None, jsonify({"error": "Invalid token"}), 401
+# Every route here requires a bearer token; auth.authenticate sets g.user_id.
+# The stats routes describe every user's traffic, so they take the admin
+# token (X-Profile-Token) instead
 
 @ai_bp.route("/ai/generate", methods=["POST"])
 def generate_content():
     try:
-        # Verify authentication
-        user_id, error_response, status_code = verify_token()
-        if error_response:
-            return error_response, status_code
-
         data = request.get_json()
         if not data:
             return jsonify({"error": "No data provided"}), 400
@@ -46,52 +35,143 @@ def generate_content():
         if not all([model, prompt, api_key, provider]):
             return jsonify({"error": "Missing required parameters"}), 400
 
-        # Route to appropriate provider
-        if provider == 'openai':
-            result = call_openai_api(model, prompt, api_key, options)
-        elif provider == 'google':
-            result = call_google_api(model, prompt, api_key, options)
-        elif provider == 'perplexity':
-            result = call_perplexity_api(model, prompt, api_key, options)
-        else:
+        if provider not in PROVIDER_FUNCTIONS:
             return jsonify({"error": "Unsupported provider"}), 400
 
+        prompt, error_response = document_prompt(data, prompt)
+        if error_response:
+            return error_response
+
+        fallback, hedge, error = parse_routing(data, PROVIDER_FUNCTIONS)
+        if error:
+            return jsonify({"error": error}), 400
+
+        result = call_provider(provider, model, prompt, api_key, options, fallback, hedge)
+
         if result.get('error'):
-            return jsonify({"error": result['error']}), 400
+            return jsonify({"error": result['error'], "tokens": result['tokens']}), error_status(result)
 
         return jsonify({
             "success": True,
             "content": result.get('content', ''),
-            "model": model,
-            "provider": provider
+            "model": result.get('model', model),
+            "provider": result.get('provider', provider),
+            "cached": result.get('cached', False),
+            "fallback": result.get('fallback', False),
+            "hedged": result.get('hedged', False),
+            "tokens": result['tokens']
         }), 200
 
     except Exception as e:
         return jsonify({"error": f"Generation failed: {str(e)}"}), 500
 
+def document_prompt(data, prompt):
+    """``prompt`` followed by the text of the stored document named by ``documentId``, if any.
+
+    Returns ``(prompt, None)`` or ``(None, (response, status))``.
+    """
+    document, error_response = documents.resolve_document(data, g.user_id)
+    if error_response:
+        return None, error_response
+    if document is None:
+        return prompt, None
+    return single_prompt(prompt, documents.text_of(document)), None
+
+def parse_routing(data, provider_functions):
+    """Read the optional routing policy of a generate request; returns (fallback, hedge, error)"""
+    hedge = bool(data.get('hedge', current_app.config['AI_HEDGE']))
+    fallback = data.get('fallback')
+    if not fallback:
+        return None, hedge, None
+    if not isinstance(fallback, dict) or not all([fallback.get('provider'), fallback.get('model')]):
+        return None, hedge, "Fallback needs a provider and model"
+    if fallback['provider'] not in provider_functions:
+        return None, hedge, "Unsupported fallback provider"
+    api_key = fallback.get('apiKey') or (data.get('apiKey') if fallback['provider'] == data.get('provider') else None)
+    if not api_key:
+        return None, hedge, "Fallback needs an apiKey"
+    return routing.Target(fallback['provider'], fallback['model'], api_key), hedge, None
+
+def build_openai_request(model, prompt, api_key, options, stream=False):
+    """Build the OpenAI chat completions request (url, headers, payload)"""
+    return _chat_completions_request(
+        f"{current_app.config['OPENAI_BASE_URL']}/chat/completions", model, prompt, api_key, options, stream
+    )
+
+def build_perplexity_request(model, prompt, api_key, options, stream=False):
+    """Build the Perplexity chat completions request (url, headers, payload)"""
+    return _chat_completions_request(
+        f"{current_app.config['PERPLEXITY_BASE_URL']}/chat/completions", model, prompt, api_key, options, stream
+    )
+
+def _chat_completions_request(url, model, prompt, api_key, options, stream):
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json"
+    }
+
+    # Optimized data payload with better defaults
+    data = {
+        "model": model,
+        "messages": [{"role": "user", "content": prompt}],
+        "max_tokens": options.get('maxTokens', 1000),
+        "temperature": options.get('temperature', 0.7),
+        "stream": stream,  # Token deltas are only requested by the streaming route
+        "top_p": 1.0,     # Default top_p for consistent results
+        "frequency_penalty": 0.0,  # No frequency penalty
+        "presence_penalty": 0.0    # No presence penalty
+    }
+    return url, headers, data
+
+def build_google_request(model, prompt, api_key, options, stream=False):
+    """Build the Gemini generateContent request (url, headers, payload)"""
+    base_url = f"{current_app.config['GOOGLE_BASE_URL']}/models/{model}"
+    if stream:
+        url = f"{base_url}:streamGenerateContent?alt=sse"
+    else:
+        url = f"{base_url}:generateContent"
+    headers = {
+        "Content-Type": "application/json",
+        "X-goog-api-key": api_key
+    }
+
+    data = {
+        "contents": [{
+            "parts": [{"text": prompt}]
+        }],
+        "generationConfig": {
+            "maxOutputTokens": options.get('maxTokens', 1000),
+            "temperature": options.get('temperature', 0.7),
+            "topP": 1.0,
+            "topK": 40
+        },
+        "safetySettings": [
+            {
+                "category": "HARM_CATEGORY_HARASSMENT",
+                "threshold": "BLOCK_MEDIUM_AND_ABOVE"
+            }
+        ]
+    }
+    return url, headers, data
+
+def http_error_result(provider_name, e):
+    """Error result for an httpx error; timeouts, connection errors, 429 and 5xx are marked transient"""
+    status = e.response.status_code if isinstance(e, httpx.HTTPStatusError) else None
+    return {
+        "error": f"{provider_name} API error: {str(e)}",
+        "transient": status is None or status == 429 or status >= 500
+    }
+
 def call_openai_api(model, prompt, api_key, options):
     """Call OpenAI API with optimized settings"""
     try:
-        url = "https://api.openai.com/v1/chat/completions"
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
-        
-        # Optimized data payload with better defaults
-        data = {
-            "model": model,
-            "messages": [{"role": "user", "content": prompt}],
-            "max_tokens": options.get('maxTokens', 1000),
-            "temperature": options.get('temperature', 0.7),
-            "stream": False,  # Disable streaming for better performance
-            "top_p": 1.0,     # Default top_p for consistent results
-            "frequency_penalty": 0.0,  # No frequency penalty
-            "presence_penalty": 0.0    # No presence penalty
-        }
-
-        # Reduced timeout for better responsiveness
-        response = requests.post(url, headers=headers, json=data, timeout=20)
+        url, headers, data = build_openai_request(model, prompt, api_key, options)
+
+        # Pooled keep-alive client; rate limiting, retries and the deadline come from call_policy
+        client = get_provider_client(url)
+        response = call_policy.send(
+            url, api_key, lambda timeout: client.post(url, headers=headers, json=data, timeout=timeout)
+        )
         response.raise_for_status()
         
         result = response.json()
@@ -104,10 +184,10 @@ def call_openai_api(model, prompt, api_key, options):
         
         return {"content": content}
         
-    except requests.exceptions.Timeout:
-        return {"error": "OpenAI API request timed out"}
-    except requests.exceptions.RequestException as e:
-        return {"error": f"OpenAI API error: {str(e)}"}
+    except httpx.TimeoutException:
+        return {"error": "OpenAI API request timed out", "transient": True}
+    except httpx.HTTPError as e:
+        return http_error_result("OpenAI", e)
     except KeyError as e:
         return {"error": f"Unexpected response format from OpenAI: {str(e)}"}
     except Exception as e:
@@ -116,32 +196,13 @@ def call_openai_api(model, prompt, api_key, options):
 def call_google_api(model, prompt, api_key, options):
     """Call Google Gemini API with optimized settings"""
     try:
-        url = f"https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent"
-        headers = {
-            "Content-Type": "application/json",
-            "X-goog-api-key": api_key
-        }
-        
-        data = {
-            "contents": [{
-                "parts": [{"text": prompt}]
-            }],
-            "generationConfig": {
-                "maxOutputTokens": options.get('maxTokens', 1000),
-                "temperature": options.get('temperature', 0.7),
-                "topP": 1.0,
-                "topK": 40
-            },
-            "safetySettings": [
-                {
-                    "category": "HARM_CATEGORY_HARASSMENT",
-                    "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-                }
-            ]
-        }
-
-        # Reduced timeout for better responsiveness
-        response = requests.post(url, headers=headers, json=data, timeout=20)
+        url, headers, data = build_google_request(model, prompt, api_key, options)
+
+        # Pooled keep-alive client; rate limiting, retries and the deadline come from call_policy
+        client = get_provider_client(url)
+        response = call_policy.send(
+            url, api_key, lambda timeout: client.post(url, headers=headers, json=data, timeout=timeout)
+        )
         response.raise_for_status()
         
         result = response.json()
@@ -154,10 +215,10 @@ def call_google_api(model, prompt, api_key, options):
         
         return {"content": content}
         
-    except requests.exceptions.Timeout:
-        return {"error": "Google API request timed out"}
-    except requests.exceptions.RequestException as e:
-        return {"error": f"Google API error: {str(e)}"}
+    except httpx.TimeoutException:
+        return {"error": "Google API request timed out", "transient": True}
+    except httpx.HTTPError as e:
+        return http_error_result("Google", e)
     except KeyError as e:
         return {"error": f"Unexpected response format from Google: {str(e)}"}
     except Exception as e:
@@ -166,25 +227,13 @@ def call_google_api(model, prompt, api_key, options):
 def call_perplexity_api(model, prompt, api_key, options):
     """Call Perplexity API with optimized settings"""
     try:
-        url = "https://api.perplexity.ai/chat/completions"
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
-        
-        data = {
-            "model": model,
-            "messages": [{"role": "user", "content": prompt}],
-            "max_tokens": options.get('maxTokens', 1000),
-            "temperature": options.get('temperature', 0.7),
-            "stream": False,  # Disable streaming for better performance
-            "top_p": 1.0,     # Default top_p for consistent results
-            "frequency_penalty": 0.0,  # No frequency penalty
-            "presence_penalty": 0.0    # No presence penalty
-        }
-
-        # Reduced timeout for better responsiveness
-        response = requests.post(url, headers=headers, json=data, timeout=20)
+        url, headers, data = build_perplexity_request(model, prompt, api_key, options)
+
+        # Pooled keep-alive client; rate limiting, retries and the deadline come from call_policy
+        client = get_provider_client(url)
+        response = call_policy.send(
+            url, api_key, lambda timeout: client.post(url, headers=headers, json=data, timeout=timeout)
+        )
         response.raise_for_status()
         
         result = response.json()
@@ -197,24 +246,334 @@ def call_perplexity_api(model, prompt, api_key, options):
         
         return {"content": content}
         
-    except requests.exceptions.Timeout:
-        return {"error": "Perplexity API request timed out"}
-    except requests.exceptions.RequestException as e:
-        return {"error": f"Perplexity API error: {str(e)}"}
+    except httpx.TimeoutException:
+        return {"error": "Perplexity API request timed out", "transient": True}
+    except httpx.HTTPError as e:
+        return http_error_result("Perplexity", e)
     except KeyError as e:
         return {"error": f"Unexpected response format from Perplexity: {str(e)}"}
     except Exception as e:
         return {"error": f"Perplexity error: {str(e)}"}
 
+PROVIDER_FUNCTIONS = {
+    'openai': call_openai_api,
+    'google': call_google_api,
+    'perplexity': call_perplexity_api,
+}
+
+def call_provider(provider, model, prompt, api_key, options, fallback=None, hedge=False):
+    """Call the provider adapter, serving deterministic generations from the response cache.
+
+    Prompts over the token budget are rejected locally (``tooLarge``) instead
+    of after a round trip; identical requests already in flight are coalesced
+    into one call; ``fallback``/``hedge`` enable the routing policy; every
+    result carries the token estimate.
+    """
+    estimate, error = tokens.check_request(provider, model, prompt, options)
+    if error:
+        return {"error": error, "tokens": estimate, "tooLarge": True}
+
+    primary = routing.Target(provider, model, api_key)
+    result = singleflight.coalesce(
+        response_cache.cache_key(provider, model, prompt, options), api_key,
+        lambda: response_cache.cached_call(
+            provider, model, prompt, options,
+            lambda: routing.call(primary, prompt, options, PROVIDER_FUNCTIONS, fallback, hedge)
+        )
+    )
+    return {**result, "tokens": estimate}
+
+def error_status(result):
+    """HTTP status for a failed provider result"""
+    if result.get('tooLarge'):
+        return 413
+    return 503 if result.get('circuitOpen') else 400
+
+def parse_batch(data):
+    """Validate the prompts of a batch request; returns (prompts, concurrency, error)"""
+    prompts = data.get('prompts')
+    if not isinstance(prompts, list) or not prompts:
+        return None, None, "prompts must be a non-empty list"
+    if not all(isinstance(prompt, str) and prompt for prompt in prompts):
+        return None, None, "Every prompt must be a non-empty string"
+    max_items = current_app.config['AI_BATCH_MAX_ITEMS']
+    if len(prompts) > max_items:
+        return None, None, f"A batch can hold at most {max_items} prompts"
+    try:
+        concurrency = int(data.get('concurrency') or current_app.config['AI_BATCH_CONCURRENCY'])
+    except (TypeError, ValueError):
+        return None, None, "concurrency must be an integer"
+    return prompts, max(1, min(concurrency, current_app.config['AI_BATCH_CONCURRENCY'])), None
+
+def batch_response(prompts, results, model, provider):
+    """Ordered per-item results for a batch; ``results`` maps each distinct prompt to its result"""
+    items = []
+    for index, prompt in enumerate(prompts):
+        result = results[prompt]
+        if result.get('error'):
+            items.append({
+                "index": index,
+                "success": False,
+                "error": result['error'],
+                "status": error_status(result),
+                "tokens": result['tokens']
+            })
+        else:
+            items.append({
+                "index": index,
+                "success": True,
+                "content": result.get('content', ''),
+                "cached": result.get('cached', False),
+                "tokens": result['tokens']
+            })
+    succeeded = sum(1 for item in items if item['success'])
+    return {
+        "success": True,
+        "model": model,
+        "provider": provider,
+        "results": items,
+        "succeeded": succeeded,
+        "failed": len(items) - succeeded,
+        "calls": len(results)
+    }
+
+@ai_bp.route("/ai/batch", methods=["POST"])
+def generate_batch():
+    """Run several prompts with shared model/provider/options, at most ``concurrency`` at once"""
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({"error": "No data provided"}), 400
+
+        model = data.get('model')
+        api_key = data.get('apiKey')
+        provider = data.get('provider')
+        options = data.get('options', {})
+
+        if not all([model, api_key, provider]):
+            return jsonify({"error": "Missing required parameters"}), 400
+
+        if provider not in PROVIDER_FUNCTIONS:
+            return jsonify({"error": "Unsupported provider"}), 400
+
+        prompts, concurrency, error = parse_batch(data)
+        if error:
+            return jsonify({"error": error}), 400
+
+        # Repeated prompts (e.g. the same card in two decks) share one upstream call
+        distinct = list(dict.fromkeys(prompts))
+        app = current_app._get_current_object()
+
+        def run_one(prompt):
+            with app.app_context():
+                return call_provider(provider, model, prompt, api_key, options)
+
+        with ThreadPoolExecutor(max_workers=min(concurrency, len(distinct))) as executor:
+            results = dict(zip(distinct, executor.map(run_one, distinct)))
+
+        return jsonify(batch_response(prompts, results, model, provider)), 200
+
+    except Exception as e:
+        return jsonify({"error": f"Batch generation failed: {str(e)}"}), 500
+
+@ai_bp.route("/ai/routing/stats", methods=["GET"])
+@public
+def routing_stats():
+    """Circuit breaker states and observed latencies used for hedging"""
+    denied = profiling.require_admin()
+    if denied:
+        return denied
+    return jsonify(routing.stats()), 200
+
+@ai_bp.route("/ai/cache/stats", methods=["GET"])
+@public
+def cache_stats():
+    """Hit/miss counters for the AI response cache and in-flight coalescing"""
+    denied = profiling.require_admin()
+    if denied:
+        return denied
+    return jsonify({**response_cache.get_response_cache().stats(), "singleflight": singleflight.stats()}), 200
+
+def _chat_completion_delta(chunk):
+    choices = chunk.get('choices') or []
+    if not choices:
+        return ''
+    return (choices[0].get('delta') or {}).get('content') or ''
+
+def _gemini_delta(chunk):
+    candidates = chunk.get('candidates') or []
+    if not candidates:
+        return ''
+    parts = (candidates[0].get('content') or {}).get('parts') or []
+    return ''.join(part.get('text', '') for part in parts)
+
+def _iter_sse_data(response):
+    """Yield the ``data:`` payloads of a server-sent-events response"""
+    for line in response.iter_lines():
+        if not line.startswith('data:'):
+            continue
+        payload = line[5:].strip()
+        if payload == '[DONE]':
+            return
+        if payload:
+            yield payload
+
+class DeltaStream:
+    """Iterator over a streaming provider response's deltas.
+
+    ``close()`` releases the pooled connection even when the body was never
+    iterated (e.g. the client went away before the first chunk).
+    """
+
+    def __init__(self, response, deltas):
+        self._response = response
+        self._deltas = deltas
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._deltas)
+
+    def close(self):
+        self._deltas.close()
+        self._response.close()
+
+def _open_stream(provider_name, url, headers, data, extract_delta, api_key):
+    """Open a streaming provider call.
+
+    Returns ``(deltas, None)`` once the provider has accepted the request, or
+    ``(None, {"error": ...})`` so callers can still answer with a normal JSON
+    error before any streamed bytes are sent. ``deltas`` is a DeltaStream the
+    caller must close.
+    """
+    client = get_provider_client(url)
+    try:
+        # Retries only cover opening the stream; nothing has been sent to the client yet
+        response = call_policy.send(url, api_key, lambda timeout: client.send(
+            client.build_request("POST", url, headers=headers, json=data, timeout=timeout), stream=True
+        ))
+    except httpx.TimeoutException:
+        return None, {"error": f"{provider_name} API request timed out"}
+    except httpx.HTTPError as e:
+        return None, {"error": f"{provider_name} API error: {str(e)}"}
+
+    if response.is_error:
+        response.read()
+        response.close()
+        try:
+            response.raise_for_status()
+        except httpx.HTTPStatusError as e:
+            return None, {"error": f"{provider_name} API error: {str(e)}"}
+
+    def deltas():
+        try:
+            for payload in _iter_sse_data(response):
+                delta = extract_delta(json.loads(payload))
+                if delta:
+                    yield delta
+        finally:
+            response.close()
+
+    return DeltaStream(response, deltas()), None
+
+def stream_openai_api(model, prompt, api_key, options):
+    """Stream OpenAI token deltas; returns (deltas, error)"""
+    url, headers, data = build_openai_request(model, prompt, api_key, options, stream=True)
+    return _open_stream("OpenAI", url, headers, data, _chat_completion_delta, api_key)
+
+def stream_google_api(model, prompt, api_key, options):
+    """Stream Google Gemini token deltas; returns (deltas, error)"""
+    url, headers, data = build_google_request(model, prompt, api_key, options, stream=True)
+    return _open_stream("Google", url, headers, data, _gemini_delta, api_key)
+
+def stream_perplexity_api(model, prompt, api_key, options):
+    """Stream Perplexity token deltas; returns (deltas, error)"""
+    url, headers, data = build_perplexity_request(model, prompt, api_key, options, stream=True)
+    return _open_stream("Perplexity", url, headers, data, _chat_completion_delta, api_key)
+
+STREAM_FUNCTIONS = {
+    'openai': stream_openai_api,
+    'google': stream_google_api,
+    'perplexity': stream_perplexity_api,
+}
+
+def _sse_event(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+@ai_bp.route("/ai/generate/stream", methods=["POST"])
+def generate_content_stream():
+    """Stream generated content to the client as server-sent events"""
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({"error": "No data provided"}), 400
+
+        model = data.get('model')
+        prompt = data.get('prompt')
+        api_key = data.get('apiKey')
+        provider = data.get('provider')
+        options = data.get('options', {})
+
+        if not all([model, prompt, api_key, provider]):
+            return jsonify({"error": "Missing required parameters"}), 400
+
+        stream_function = STREAM_FUNCTIONS.get(provider)
+        if stream_function is None:
+            return jsonify({"error": "Unsupported provider"}), 400
+
+        prompt, error_response = document_prompt(data, prompt)
+        if error_response:
+            return error_response
+
+        estimate, error = tokens.check_request(provider, model, prompt, options)
+        if error:
+            return jsonify({"error": error, "tokens": estimate}), 413
+
+        cache_key, cached_content = response_cache.lookup(provider, model, prompt, options)
+        if cached_content is not None:
+            deltas = iter([cached_content])
+        else:
+            deltas, result = stream_function(model, prompt, api_key, options)
+            if result:
+                return jsonify({"error": result['error']}), 400
+
+        def event_stream():
+            parts = []
+            try:
+                for delta in deltas:
+                    parts.append(delta)
+                    yield _sse_event("delta", {"content": delta})
+            except Exception as e:
+                yield _sse_event("error", {"error": f"Generation failed: {str(e)}"})
+                return
+            if cached_content is None:
+                response_cache.store(cache_key, provider, model, ''.join(parts))
+            yield _sse_event("done", {
+                "success": True,
+                "model": model,
+                "provider": provider,
+                "cached": cached_content is not None,
+                "tokens": estimate
+            })
+
+        response = Response(
+            stream_with_context(event_stream()),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+        if cached_content is None:
+            # The generator's own cleanup only runs once iteration has started
+            response.call_on_close(deltas.close)
+        return response
+
+    except Exception as e:
+        return jsonify({"error": f"Generation failed: {str(e)}"}), 500
+
 @ai_bp.route("/ai/test", methods=["POST"])
 def test_connection():
     """Test AI model connection"""
     try:
-        # Verify authentication
-        user_id, error_response, status_code = verify_token()
-        if error_response:
-            return error_response, status_code
-
         data = request.get_json()
         if not data:
             return jsonify({"error": "No data provided"}), 400
@@ -229,15 +588,12 @@ def test_connection():
         # Test with a simple prompt
         test_prompt = "Hello, this is a test message. Please respond with 'Connection successful'."
         
-        if provider == 'openai':
-            result = call_openai_api(model, test_prompt, api_key, {})
-        elif provider == 'google':
-            result = call_google_api(model, test_prompt, api_key, {})
-        elif provider == 'perplexity':
-            result = call_perplexity_api(model, test_prompt, api_key, {})
-        else:
+        if provider not in PROVIDER_FUNCTIONS:
             return jsonify({"error": "Unsupported provider"}), 400
 
+        # Connection tests always go to the provider, never to the cache
+        result = PROVIDER_FUNCTIONS[provider](model, test_prompt, api_key, {})
+
         if result.get('error'):
             return jsonify({"error": result['error']}), 400
 
@@ -0,0 +1,336 @@
+"""ASGI entry point.
+
+The slow, provider-bound routes (/api/ai/generate, /api/ai/batch,
+/api/ai/test and /api/pdf/summarize) are served natively on the event loop with the async
+provider adapters, so one process can hold hundreds of in-flight provider
+calls. Every other request is handed to the regular Flask app, and so is a
+request to one of those routes that asks to be profiled (X-Profile-Token):
+the profiler samples a request thread, which only the Flask path has.
+Sampled profiling (PROFILE_SAMPLE_RATE) does not cover the native routes.
+"""
+import asyncio
+import hmac
+import json
+import time
+
+from asgiref.wsgi import WsgiToAsgi
+from flask import current_app
+
+from . import create_app
+from . import documents
+from . import tokens
+from .ai_routes import batch_response, error_status, parse_batch, parse_routing
+from .auth import verify_authorization_header
+from . import compression
+from .compression import BodyTooLarge
+from .metrics import HTTP_REQUEST_SECONDS
+from .async_providers import ASYNC_PROVIDER_FUNCTIONS, acall_provider
+from .pdf_routes import submit_summary_job
+from .provider_clients import aclose_provider_clients
+from .startup import start_jobs
+from .summarizer import asummarize_document, single_prompt
+from .uploads import body_too_large_message
+
+TEST_PROMPT = "Hello, this is a test message. Please respond with 'Connection successful'."
+
+
+async def _resolve_document(data, user_id):
+    """``documents.resolve_document`` off the loop; returns ``(document, None)`` or ``(None, (payload, status))``"""
+    document, error_response = await asyncio.to_thread(documents.resolve_document, data, user_id)
+    if error_response:
+        response, status = error_response
+        return None, (response.get_json(), status)
+    return document, None
+
+
+async def generate_content(data, user_id):
+    model = data.get('model')
+    prompt = data.get('prompt')
+    api_key = data.get('apiKey')
+    provider = data.get('provider')
+    options = data.get('options', {})
+
+    if not all([model, prompt, api_key, provider]):
+        return {"error": "Missing required parameters"}, 400
+
+    if provider not in ASYNC_PROVIDER_FUNCTIONS:
+        return {"error": "Unsupported provider"}, 400
+
+    document, error_response = await _resolve_document(data, user_id)
+    if error_response:
+        return error_response
+    if document is not None:
+        prompt = single_prompt(prompt, await asyncio.to_thread(documents.text_of, document))
+
+    fallback, hedge, error = parse_routing(data, ASYNC_PROVIDER_FUNCTIONS)
+    if error:
+        return {"error": error}, 400
+
+    result = await acall_provider(provider, model, prompt, api_key, options, fallback, hedge)
+
+    if result.get('error'):
+        return {"error": result['error'], "tokens": result['tokens']}, error_status(result)
+
+    return {
+        "success": True,
+        "content": result.get('content', ''),
+        "model": result.get('model', model),
+        "provider": result.get('provider', provider),
+        "cached": result.get('cached', False),
+        "fallback": result.get('fallback', False),
+        "hedged": result.get('hedged', False),
+        "tokens": result['tokens']
+    }, 200
+
+
+async def generate_batch(data, user_id):
+    model = data.get('model')
+    api_key = data.get('apiKey')
+    provider = data.get('provider')
+    options = data.get('options', {})
+
+    if not all([model, api_key, provider]):
+        return {"error": "Missing required parameters"}, 400
+
+    if provider not in ASYNC_PROVIDER_FUNCTIONS:
+        return {"error": "Unsupported provider"}, 400
+
+    prompts, concurrency, error = parse_batch(data)
+    if error:
+        return {"error": error}, 400
+
+    distinct = list(dict.fromkeys(prompts))
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_one(prompt):
+        async with semaphore:
+            return await acall_provider(provider, model, prompt, api_key, options)
+
+    results = dict(zip(distinct, await asyncio.gather(*[run_one(prompt) for prompt in distinct])))
+    return batch_response(prompts, results, model, provider), 200
+
+
+async def test_connection(data, user_id):
+    model = data.get('model')
+    api_key = data.get('apiKey')
+    provider = data.get('provider')
+
+    if not all([model, api_key, provider]):
+        return {"error": "Missing required parameters"}, 400
+
+    if provider not in ASYNC_PROVIDER_FUNCTIONS:
+        return {"error": "Unsupported provider"}, 400
+
+    result = await ASYNC_PROVIDER_FUNCTIONS[provider](model, TEST_PROMPT, api_key, {})
+
+    if result.get('error'):
+        return {"error": result['error']}, 400
+
+    return {
+        "success": True,
+        "message": "Connection successful",
+        "response": result.get('content', '')
+    }, 200
+
+
+async def summarize_pdf(data, user_id):
+    text = data.get('text')
+    prompt = data.get('prompt', 'Summarize this document:')
+    model = data.get('model')
+    api_key = data.get('apiKey')
+    provider = data.get('provider')
+    options = data.get('options', {})
+
+    # ``documentId`` (from /pdf/extract) can stand in for ``text``
+    if not all([text or data.get('documentId'), model, api_key, provider]):
+        return {"error": "Missing required parameters"}, 400
+
+    if provider not in ASYNC_PROVIDER_FUNCTIONS:
+        return {"error": "Unsupported provider"}, 400
+
+    document, error_response = await _resolve_document(data, user_id)
+    if error_response:
+        return error_response
+
+    if data.get('async'):
+        # Queueing touches the database, so keep it off the loop
+        return await asyncio.to_thread(submit_summary_job, user_id, data, document=document)
+
+    if document is not None:
+        text = await asyncio.to_thread(documents.text_of, document)
+
+    result = await asummarize_document(
+        text, prompt,
+        lambda stage_prompt: acall_provider(provider, model, stage_prompt, api_key, options),
+        chunk_tokens=tokens.chunk_budget(provider, model, options, prompt),
+        estimate=lambda chunk: tokens.estimate_tokens(chunk, provider, model)
+    )
+
+    if result.get('error'):
+        return {"error": result['error'], "tokens": result['tokens']}, error_status(result)
+
+    return {
+        "success": True,
+        "summary": result.get('content', ''),
+        "model": model,
+        "provider": provider,
+        "wordCount": len(text.split()),
+        "summaryWordCount": len(result.get('content', '').split()),
+        "cached": result['cached'],
+        "chunks": result['chunks'],
+        "stages": result['stages'],
+        "tokens": result['tokens']
+    }, 200
+
+
+# (path, handler, message prefix used by the Flask route for unexpected errors, Flask blueprint)
+ASYNC_ROUTES = {
+    "/api/ai/generate": (generate_content, "Generation failed", "ai"),
+    "/api/ai/batch": (generate_batch, "Batch generation failed", "ai"),
+    "/api/ai/test": (test_connection, "Test failed", "ai"),
+    "/api/pdf/summarize": (summarize_pdf, "Summarization failed", "pdf"),
+}
+
+
+async def _read_body(receive, limit):
+    """The request body; raises BodyTooLarge past ``limit`` bytes (MAX_JSON_LENGTH, as on the Flask routes)"""
+    body = bytearray()
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get("body", b"")
+        if limit and len(body) > limit:
+            raise BodyTooLarge()
+        more_body = message.get("more_body", False)
+    return bytes(body)
+
+
+async def _send_json(send, payload, status, accept_encoding=None):
+    """Send ``payload``; compressed like the Flask responses when ``accept_encoding`` is given"""
+    body = json.dumps(payload).encode("utf-8")
+    headers = [(b"content-type", b"application/json"), (b"access-control-allow-origin", b"*")]
+    if accept_encoding is not None:
+        headers.append((b"vary", b"Accept-Encoding"))
+        encoding = compression.choose_encoding(accept_encoding)
+        if encoding is not None and len(body) >= current_app.config['COMPRESS_MIN_BYTES']:
+            body = await asyncio.to_thread(compression.compress, body, encoding)
+            headers.append((b"content-encoding", encoding.encode("ascii")))
+    headers.append((b"content-length", str(len(body)).encode("ascii")))
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+class StudyKaroASGI:
+    """Serve the provider-bound routes on the event loop, everything else through Flask"""
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.wsgi_app = WsgiToAsgi(flask_app)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+
+        route = ASYNC_ROUTES.get(scope.get("path")) if scope["type"] == "http" else None
+        if route is None or scope["method"] != "POST" or self._profile_requested(scope):
+            await self.wsgi_app(scope, receive, send)
+            return
+
+        if not self.flask_app.config['METRICS_ENABLED']:
+            await self._serve(route, scope, receive, send)
+            return
+
+        # Timed like the Flask routes (init_metrics), which these requests never reach
+        started = time.perf_counter()
+        response_status = []
+
+        async def send_timed(message):
+            if message["type"] == "http.response.start":
+                response_status.append(message["status"])
+            await send(message)
+
+        try:
+            await self._serve(route, scope, receive, send_timed)
+        finally:
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - started, scope["method"], scope["path"], response_status[0] if response_status else 500
+            )
+
+    def _profile_requested(self, scope):
+        token = self.flask_app.config['PROFILE_ADMIN_TOKEN']
+        if not token:
+            return False
+        supplied = next((value for key, value in scope["headers"] if key.lower() == b"x-profile-token"), None)
+        return supplied is not None and hmac.compare_digest(supplied, token.encode("latin-1"))
+
+    async def _serve(self, route, scope, receive, send):
+        handler, failure_message, blueprint = route
+        headers = {key.decode("latin-1").lower(): value.decode("latin-1") for key, value in scope["headers"]}
+        with self.flask_app.app_context():
+            compressed = compression.applies(blueprint)
+            accept_encoding = headers.get("accept-encoding", "") if compressed else None
+
+            async def respond(payload, status):
+                await _send_json(send, payload, status, accept_encoding)
+
+            try:
+                user_id, error = verify_authorization_header(headers.get("authorization"))
+                if error:
+                    await respond({"error": error}, 401)
+                    return
+
+                content_encoding = headers.get("content-encoding", "").strip().lower() if compressed else ""
+                if content_encoding == "identity":
+                    content_encoding = ""
+                unsupported = compression.unsupported_encoding(content_encoding) if content_encoding else None
+                if unsupported:
+                    await respond({"error": unsupported}, 415)
+                    return
+
+                limit = self.flask_app.config['MAX_JSON_LENGTH']
+                try:
+                    content_length = int(headers.get("content-length") or 0)
+                except ValueError:
+                    await respond({"error": "Invalid Content-Length header"}, 400)
+                    return
+                try:
+                    if limit and content_length > limit:
+                        raise BodyTooLarge()
+                    body = await _read_body(receive, limit)
+                except BodyTooLarge:
+                    await respond({"error": body_too_large_message(limit)}, 413)
+                    return
+                if content_encoding:
+                    body, error = await asyncio.to_thread(compression.decode_body, body, content_encoding, limit)
+                    if error:
+                        await respond({"error": error[0]}, error[1])
+                        return
+                try:
+                    data = json.loads(body) if body else None
+                except ValueError:
+                    data = None
+                if not data:
+                    await respond({"error": "No data provided"}, 400)
+                    return
+
+                payload, status = await handler(data, user_id)
+            except Exception as e:
+                payload, status = {"error": f"{failure_message}: {str(e)}"}, 500
+            await respond(payload, status)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await asyncio.to_thread(start_jobs, self.flask_app)
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                with self.flask_app.app_context():
+                    await aclose_provider_clients()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+def create_asgi_app(flask_app=None):
+    return StudyKaroASGI(flask_app or create_app())
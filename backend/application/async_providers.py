@@ -0,0 +1,120 @@
+import asyncio
+
+import httpx
+from flask import current_app
+
+from . import ai_routes
+from . import call_policy
+from . import db
+from . import response_cache
+from . import routing
+from . import singleflight
+from . import tokens
+from .provider_clients import get_async_provider_client
+
+
+def _chat_completion_content(result):
+    if 'choices' not in result or not result['choices']:
+        return None
+    return result['choices'][0]['message']['content']
+
+
+def _gemini_content(result):
+    if 'candidates' not in result or not result['candidates']:
+        return None
+    return result['candidates'][0]['content']['parts'][0]['text']
+
+
+async def _call(provider_name, build_request, extract_content, model, prompt, api_key, options):
+    """Async twin of the ``call_*_api`` adapters in ai_routes, with the same error shapes"""
+    try:
+        url, headers, data = build_request(model, prompt, api_key, options)
+
+        client = get_async_provider_client(url)
+        response = await call_policy.asend(
+            url, api_key, lambda timeout: client.post(url, headers=headers, json=data, timeout=timeout)
+        )
+        response.raise_for_status()
+
+        content = extract_content(response.json())
+        if content is None:
+            return {"error": f"No response from {provider_name} API"}
+
+        return {"content": content}
+
+    except httpx.TimeoutException:
+        return {"error": f"{provider_name} API request timed out", "transient": True}
+    except httpx.HTTPError as e:
+        return ai_routes.http_error_result(provider_name, e)
+    except KeyError as e:
+        return {"error": f"Unexpected response format from {provider_name}: {str(e)}"}
+    except Exception as e:
+        return {"error": f"{provider_name} error: {str(e)}"}
+
+
+async def acall_openai_api(model, prompt, api_key, options):
+    """Call OpenAI API without blocking the event loop"""
+    return await _call("OpenAI", ai_routes.build_openai_request, _chat_completion_content,
+                       model, prompt, api_key, options)
+
+
+async def acall_google_api(model, prompt, api_key, options):
+    """Call Google Gemini API without blocking the event loop"""
+    return await _call("Google", ai_routes.build_google_request, _gemini_content,
+                       model, prompt, api_key, options)
+
+
+async def acall_perplexity_api(model, prompt, api_key, options):
+    """Call Perplexity API without blocking the event loop"""
+    return await _call("Perplexity", ai_routes.build_perplexity_request, _chat_completion_content,
+                       model, prompt, api_key, options)
+
+
+ASYNC_PROVIDER_FUNCTIONS = {
+    'openai': acall_openai_api,
+    'google': acall_google_api,
+    'perplexity': acall_perplexity_api,
+}
+
+
+async def _cache_op(function, *args):
+    # The persistent cache tier talks to the database, so keep it off the loop
+    if not response_cache.get_response_cache().persistent:
+        return function(*args)
+    app = current_app._get_current_object()
+
+    def run():
+        # db.session is scoped to the app context, and concurrent calls of one request
+        # (batch prompts, map stages) would otherwise share the request's session across
+        # threads; a context of its own gets a session that is removed when it is popped
+        with app.app_context():
+            try:
+                return function(*args)
+            finally:
+                db.session.remove()
+
+    return await asyncio.to_thread(run)
+
+
+async def acall_provider(provider, model, prompt, api_key, options, fallback=None, hedge=False):
+    """Async counterpart of ``ai_routes.call_provider`` (same token budget, cache, coalescing and routing)"""
+    estimate, error = tokens.check_request(provider, model, prompt, options)
+    if error:
+        return {"error": error, "tokens": estimate, "tooLarge": True}
+
+    async def cached_call():
+        key, content = await _cache_op(response_cache.lookup, provider, model, prompt, options)
+        if content is not None:
+            return {"content": content, "cached": True}
+
+        result = await routing.acall(
+            routing.Target(provider, model, api_key), prompt, options, ASYNC_PROVIDER_FUNCTIONS, fallback, hedge
+        )
+        if not result.get('error') and not result.get('fallback'):
+            await _cache_op(response_cache.store, key, provider, model, result.get('content', ''))
+        return result
+
+    result = await singleflight.acoalesce(
+        response_cache.cache_key(provider, model, prompt, options), api_key, cached_call
+    )
+    return {**result, "tokens": estimate}
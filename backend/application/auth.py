@@ -0,0 +1,136 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, g, jsonify, request
+
+from .database import read_session
+from .metrics import AUTH_TOKEN_LOOKUPS, JWT_DECODE_SECONDS
+from .model import User
+
+# JWT Configuration
+SECRET_KEY = os.environ.get('SECRET_KEY', 'your-secret-key-here')
+ALGORITHM = "HS256"
+
+
+class TTLCache:
+    """Bounded LRU whose entries also expire at a per-entry deadline"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, expires_at):
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# Verified tokens by SHA-256 digest (the raw token is never kept), valid until the token's exp
+_tokens = TTLCache(4096)
+# Public user fields by id, for a few seconds; dropped on profile updates
+_users = TTLCache(4096)
+
+
+def public(view):
+    """Mark a view as reachable without a bearer token"""
+    view.public = True
+    return view
+
+
+def verify_authorization_header(auth_header):
+    """Verify a bearer Authorization header; returns (user_id, error message)"""
+    if not auth_header or not auth_header.startswith('Bearer '):
+        return None, "Authorization header missing or invalid"
+
+    token = auth_header.split(' ')[1]
+    digest = hashlib.sha256(token.encode('utf-8')).hexdigest()
+    user_id = _tokens.get(digest)
+    if user_id is not None:
+        AUTH_TOKEN_LOOKUPS.inc('hit')
+        return user_id, None
+    AUTH_TOKEN_LOOKUPS.inc('miss')
+
+    # python-jose pulls in its cryptography backends; import it on first use, not at startup
+    from jose import jwt
+    try:
+        with JWT_DECODE_SECONDS.time():
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except jwt.JWTError:
+        return None, "Invalid token"
+    user_id = payload.get("sub")
+    if user_id is None:
+        return None, "Invalid token"
+    # jwt.decode has already rejected expired tokens, so exp is in the future here
+    _tokens.set(digest, user_id, payload.get("exp") or time.time() + 60)
+    return user_id, None
+
+
+def authenticate():
+    """before_request hook: every non-public /api view gets ``g.user_id`` or a 401"""
+    g.user_id = None
+    if request.method == 'OPTIONS' or request.endpoint is None:
+        return None
+    view = current_app.view_functions.get(request.endpoint)
+    if getattr(view, 'public', False):
+        return None
+
+    user_id, error = verify_authorization_header(request.headers.get('Authorization'))
+    if error:
+        return jsonify({"error": error}), 401
+    g.user_id = user_id
+    return None
+
+
+def user_dict(user):
+    return {"id": user.id, "name": user.name, "email": user.email}
+
+
+def get_user(user_id):
+    """Public fields of a user, served from a short-lived cache; None if there is no such user"""
+    key = str(user_id)
+    cached = _users.get(key)
+    if cached is not None:
+        return cached
+    with read_session() as session:
+        user = session.get(User, int(user_id))
+        if user is None:
+            return None
+        cached = user_dict(user)
+    _users.set(key, cached, time.time() + current_app.config['AUTH_USER_TTL'])
+    return cached
+
+
+def invalidate_user(user_id):
+    _users.pop(str(user_id))
+
+
+def init_auth(app):
+    _tokens.max_entries = app.config['AUTH_TOKEN_CACHE_SIZE']
+    _users.max_entries = app.config['AUTH_USER_CACHE_SIZE']
+    app.before_request(authenticate)
@@ -0,0 +1,185 @@
+"""Outbound call policy shared by the provider adapters.
+
+Every provider request goes through a client-side token bucket per
+(provider host, API key). The buckets live in each worker process, so
+workers sharing a key each get the full AI_RATE_PER_SECOND: set it to the
+provider's limit divided by the number of worker processes. Calls are
+retried on 429, 5xx and errors raised before the request went out
+(connection failures, pool timeouts), with jittered exponential backoff
+that honors Retry-After; a read timeout is not retried, since the provider
+may already be generating (and billing) the answer. Throttling and retries
+all happen inside one overall AI_CALL_DEADLINE.
+"""
+import asyncio
+import hashlib
+import random
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+import httpx
+from flask import current_app
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Transport errors that mean the request never reached the provider
+RETRY_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+# Least recently used buckets beyond this are dropped; an idle key's bucket is full anyway
+MAX_BUCKETS = 4096
+
+
+class ThrottledError(httpx.HTTPError):
+    """The API key's rate limit leaves no room for this call before the deadline"""
+
+
+class TokenBucket:
+    """Token bucket where callers reserve a token and wait for it, so queued calls
+    are served in arrival order"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, max_wait):
+        """Take a token; returns seconds to wait for it, or None (nothing taken) if over ``max_wait``"""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            wait = max(0.0, (1 - self.tokens) / self.rate)
+            if wait > max_wait:
+                return None
+            self.tokens -= 1
+            return wait
+
+
+_buckets = OrderedDict()
+_buckets_lock = threading.Lock()
+
+
+def _bucket(url, api_key):
+    config = current_app.config
+    if config['AI_RATE_PER_SECOND'] <= 0:
+        return None
+    key = (urlsplit(url).netloc, hashlib.sha256(api_key.encode('utf-8')).hexdigest())
+    with _buckets_lock:
+        bucket = _buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(config['AI_RATE_PER_SECOND'], max(1, config['AI_RATE_BURST']))
+            _buckets[key] = bucket
+            while len(_buckets) > MAX_BUCKETS:
+                _buckets.popitem(last=False)
+        else:
+            _buckets.move_to_end(key)
+        return bucket
+
+
+def retry_after(response):
+    """Seconds from a Retry-After header (delta-seconds or HTTP date), or None"""
+    value = response.headers.get('retry-after')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff(attempt, response=None):
+    """Delay before retry number ``attempt`` (1-based): Retry-After when given,
+    otherwise full-jitter exponential backoff"""
+    config = current_app.config
+    hinted = retry_after(response) if response is not None else None
+    if hinted is not None:
+        return hinted
+    return random.uniform(0, min(config['AI_RETRY_MAX_DELAY'], config['AI_RETRY_BASE_DELAY'] * 2 ** (attempt - 1)))
+
+
+def _attempt_timeout(remaining):
+    config = current_app.config
+    return httpx.Timeout(
+        max(0.001, min(config['PROVIDER_TIMEOUT'], remaining)),
+        connect=max(0.001, min(config['PROVIDER_CONNECT_TIMEOUT'], remaining))
+    )
+
+
+def _throttled(url):
+    return ThrottledError(f"Rate limit for this API key on {urlsplit(url).netloc} leaves no room before the deadline")
+
+
+def send(url, api_key, send_once):
+    """Run ``send_once(timeout) -> httpx.Response`` under the call policy.
+
+    Returns the last response, which may still be an error status for the
+    caller's ``raise_for_status``. Connection errors are re-raised once the
+    retries or the deadline run out, any other transport error right away.
+    """
+    config = current_app.config
+    deadline = time.monotonic() + config['AI_CALL_DEADLINE']
+    bucket = _bucket(url, api_key)
+    attempt = 0
+    while True:
+        attempt += 1
+        if bucket is not None:
+            wait = bucket.reserve(deadline - time.monotonic())
+            if wait is None:
+                raise _throttled(url)
+            time.sleep(wait)
+
+        try:
+            response = send_once(_attempt_timeout(deadline - time.monotonic()))
+            if response.status_code not in RETRY_STATUSES:
+                return response
+        except RETRY_ERRORS:
+            if attempt > config['AI_RETRY_MAX']:
+                raise
+            delay = backoff(attempt)
+            if time.monotonic() + delay >= deadline:
+                raise
+        else:
+            delay = backoff(attempt, response)
+            if attempt > config['AI_RETRY_MAX'] or time.monotonic() + delay >= deadline:
+                return response
+            response.close()
+        time.sleep(delay)
+
+
+async def asend(url, api_key, send_once):
+    """Async counterpart of ``send``; ``send_once(timeout)`` is a coroutine function"""
+    config = current_app.config
+    deadline = time.monotonic() + config['AI_CALL_DEADLINE']
+    bucket = _bucket(url, api_key)
+    attempt = 0
+    while True:
+        attempt += 1
+        if bucket is not None:
+            wait = bucket.reserve(deadline - time.monotonic())
+            if wait is None:
+                raise _throttled(url)
+            await asyncio.sleep(wait)
+
+        try:
+            response = await send_once(_attempt_timeout(deadline - time.monotonic()))
+            if response.status_code not in RETRY_STATUSES:
+                return response
+        except RETRY_ERRORS:
+            if attempt > config['AI_RETRY_MAX']:
+                raise
+            delay = backoff(attempt)
+            if time.monotonic() + delay >= deadline:
+                raise
+        else:
+            delay = backoff(attempt, response)
+            if attempt > config['AI_RETRY_MAX'] or time.monotonic() + delay >= deadline:
+                return response
+            await response.aclose()
+        await asyncio.sleep(delay)
@@ -0,0 +1,173 @@
+"""gzip/brotli for the large text bodies of the PDF, AI and document blueprints.
+
+Responses of at least COMPRESS_MIN_BYTES are compressed when the client
+accepts it: brotli when the ``brotli`` package is installed and asked for,
+gzip otherwise. Streamed responses (NDJSON pages, server-sent events) pass
+through untouched, since buffering them would undo the streaming. Request
+bodies sent with ``Content-Encoding: gzip`` (or ``br``) are decompressed
+before the view reads them, up to the request's body limit (MAX_JSON_LENGTH
+for JSON) in decompressed bytes. The ASGI app applies the same rules to the
+routes it serves without Flask.
+"""
+import functools
+import gzip
+import importlib
+import io
+import zlib
+
+from flask import current_app, jsonify, request
+
+# Output drained per call by brotli >= 1.2; older versions are fed input slices this small instead
+_BROTLI_OUTPUT_CHUNK = 64 * 1024
+_BROTLI_INPUT_SLICE = 256
+
+
+class BodyTooLarge(Exception):
+    pass
+
+
+@functools.cache
+def _brotli():
+    try:
+        return importlib.import_module('brotli')
+    except ImportError:
+        return None
+
+
+def applies(blueprint):
+    return blueprint in current_app.config['COMPRESS_BLUEPRINTS']
+
+
+def _accepted_encodings(header):
+    encodings = {}
+    for part in header.split(','):
+        name, _, params = part.strip().partition(';')
+        quality = 1.0
+        if params.strip().startswith('q='):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            encodings[name.strip().lower()] = quality
+    return encodings
+
+
+def choose_encoding(accept_encoding):
+    """'br', 'gzip' or None for an Accept-Encoding header value"""
+    accepted = _accepted_encodings(accept_encoding)
+    if accepted.get('br', 0) > 0 and _brotli() is not None:
+        return 'br'
+    if accepted.get('gzip', 0) > 0:
+        return 'gzip'
+    return None
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return _brotli().compress(data, quality=current_app.config['COMPRESS_BROTLI_QUALITY'])
+    return gzip.compress(data, compresslevel=current_app.config['COMPRESS_GZIP_LEVEL'], mtime=0)
+
+
+def decompress(data, encoding, limit):
+    """Decompressed ``data``; raises BodyTooLarge past ``limit`` bytes and ValueError for bad input"""
+    if encoding == 'br':
+        return _brotli_decompress(data, limit)
+
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    try:
+        body = decompressor.decompress(data, limit + 1 if limit else 0)
+    except zlib.error as e:
+        raise ValueError(str(e)) from e
+    if limit and len(body) > limit:
+        raise BodyTooLarge()
+    if not decompressor.eof:
+        raise ValueError("truncated gzip body")
+    return body
+
+
+def _brotli_decompress(data, limit):
+    decompressor = _brotli().Decompressor()
+    output = io.BytesIO()
+    try:
+        chunk = decompressor.process(data, output_buffer_limit=_BROTLI_OUTPUT_CHUNK)
+    except TypeError:
+        # No output bound before brotli 1.2: small slices keep one call from expanding far past the limit
+        for start in range(0, len(data), _BROTLI_INPUT_SLICE):
+            output.write(decompressor.process(data[start:start + _BROTLI_INPUT_SLICE]))
+            if limit and output.tell() > limit:
+                raise BodyTooLarge()
+        return output.getvalue()
+    while chunk:
+        output.write(chunk)
+        if limit and output.tell() > limit:
+            raise BodyTooLarge()
+        chunk = decompressor.process(b"", output_buffer_limit=_BROTLI_OUTPUT_CHUNK)
+    return output.getvalue()
+
+
+def unsupported_encoding(encoding):
+    """Error message for a Content-Encoding that cannot be decoded, or None"""
+    if encoding not in ('gzip', 'br') or (encoding == 'br' and _brotli() is None):
+        return f"Unsupported Content-Encoding: {encoding}"
+    return None
+
+
+def decode_body(data, encoding, limit):
+    """``data`` decompressed; returns ``(body, None)`` or ``(None, (error message, status))``"""
+    try:
+        return decompress(data, encoding, limit), None
+    except BodyTooLarge:
+        return None, ("Decompressed request body is too large", 413)
+    except Exception:
+        return None, ("Request body could not be decompressed", 400)
+
+
+def _decompress_request():
+    encoding = request.headers.get('Content-Encoding', '').strip().lower()
+    if not encoding or encoding == 'identity' or not applies(request.blueprint):
+        return None
+    unsupported = unsupported_encoding(encoding)
+    if unsupported:
+        return jsonify({"error": unsupported}), 415
+
+    body, error = decode_body(request.get_data(cache=False), encoding, request.max_content_length)
+    if error:
+        return jsonify({"error": error[0]}), error[1]
+
+    # Swap in the plain body before anything parses the form or JSON
+    environ = request.environ
+    environ['wsgi.input'] = io.BytesIO(body)
+    environ['CONTENT_LENGTH'] = str(len(body))
+    environ.pop('HTTP_CONTENT_ENCODING', None)
+    request.__dict__.pop('stream', None)
+    return None
+
+
+def _compress_response(response):
+    if (
+        not applies(request.blueprint)
+        or response.is_streamed
+        or response.direct_passthrough
+        or response.status_code < 200
+        or response.status_code in (204, 304)
+        or 'Content-Encoding' in response.headers
+    ):
+        return response
+    response.vary.add('Accept-Encoding')
+    data = response.get_data()
+    if len(data) < current_app.config['COMPRESS_MIN_BYTES']:
+        return response
+    encoding = choose_encoding(request.headers.get('Accept-Encoding', ''))
+    if encoding is None:
+        return response
+    response.set_data(compress(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def init_compression(app):
+    if not app.config['COMPRESS_BLUEPRINTS']:
+        return
+    app.before_request(_decompress_request)
+    app.after_request(_compress_response)
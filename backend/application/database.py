@@ -0,0 +1,102 @@
+import os
+import time
+from contextlib import contextmanager
+from datetime import timezone
+
+from flask import current_app
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import QueuePool
+
+from . import _env_flag, db
+from .metrics import DB_CHECKOUT_WAIT_SECONDS
+
+REPLICA_BIND = 'replica'
+
+
+def _is_sqlite(url):
+    return make_url(url).get_backend_name() == 'sqlite'
+
+
+def aware(value):
+    """A DateTime(timezone=True) value as an aware datetime.
+
+    SQLite hands back naive (UTC) datetimes for timezone-aware columns, while
+    PostgreSQL returns them in the session's time zone; only the former
+    needs a time zone attached.
+    """
+    return value.replace(tzinfo=timezone.utc) if value is not None and value.tzinfo is None else value
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waits for a connection"""
+
+    bind = "primary"
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_CHECKOUT_WAIT_SECONDS.observe(time.perf_counter() - started, self.bind)
+
+
+class TimedReplicaPool(TimedQueuePool):
+    bind = REPLICA_BIND
+
+
+def engine_options(url, poolclass=TimedQueuePool):
+    """SQLAlchemy engine options for ``url`` from the DB_* environment settings"""
+    options = {"pool_pre_ping": _env_flag('DB_POOL_PRE_PING', True)}
+    if _is_sqlite(url):
+        # SQLite uses its own single-connection pools; sizing options do not apply
+        return options
+
+    options.update({
+        "poolclass": poolclass,
+        "pool_size": int(os.environ.get('DB_POOL_SIZE', 10)),
+        "max_overflow": int(os.environ.get('DB_MAX_OVERFLOW', 20)),
+        "pool_timeout": float(os.environ.get('DB_POOL_TIMEOUT', 30)),
+        # Recycle before server or proxy idle timeouts close connections under us
+        "pool_recycle": int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+    })
+    statement_timeout = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 0))
+    if statement_timeout and make_url(url).get_backend_name() == 'postgresql':
+        options["connect_args"] = {"options": f"-c statement_timeout={statement_timeout}"}
+    return options
+
+
+def configure(app, url):
+    """Set the primary and optional read-replica (DATABASE_REPLICA_URL) engines on ``app``"""
+    app.config['SQLALCHEMY_DATABASE_URI'] = url
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(url)
+    replica_url = os.environ.get('DATABASE_REPLICA_URL')
+    if replica_url:
+        app.config['SQLALCHEMY_BINDS'] = {REPLICA_BIND: {"url": replica_url, **engine_options(replica_url, TimedReplicaPool)}}
+
+
+@contextmanager
+def read_session():
+    """Session for read-only lookups: the replica when one is configured, else the primary.
+
+    Replica reads can lag behind writes, so only use it where a slightly
+    stale answer is harmless (writes still go through ``db.session``).
+    """
+    if REPLICA_BIND not in current_app.config.get('SQLALCHEMY_BINDS', {}):
+        yield db.session
+        return
+    with Session(db.engines[REPLICA_BIND]) as session:
+        yield session
+
+
+def pool_stats():
+    """Connection pool counters for every configured engine"""
+    stats = {}
+    for name, engine in db.engines.items():
+        pool = engine.pool
+        entry = {"pool": type(pool).__name__, "status": pool.status()}
+        for counter in ("size", "checkedin", "checkedout", "overflow"):
+            if hasattr(pool, counter):
+                entry[counter] = getattr(pool, counter)()
+        stats[name or "primary"] = entry
+    return stats
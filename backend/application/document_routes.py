@@ -0,0 +1,28 @@
+from flask import Blueprint, g, request, jsonify
+from . import documents
+
+document_bp = Blueprint("documents", __name__)
+
+# Every route here requires a bearer token; auth.authenticate sets g.user_id
+
+@document_bp.route("/documents", methods=["GET"])
+def list_documents():
+    """The caller's stored documents (metadata only), most recently used first"""
+    return jsonify({"documents": [documents.document_dict(d) for d in documents.list_documents(g.user_id)]}), 200
+
+@document_bp.route("/documents/<document_id>", methods=["GET"])
+def get_document(document_id):
+    """Metadata of a stored document; ``?text=true`` includes its text"""
+    document = documents.get(document_id, g.user_id, touch=False)
+    if document is None:
+        return jsonify({"error": "Document not found"}), 404
+    body = documents.document_dict(document)
+    if request.args.get('text', '').lower() in ('1', 'true', 'yes'):
+        body["text"] = documents.text_of(document)
+    return jsonify(body), 200
+
+@document_bp.route("/documents/<document_id>", methods=["DELETE"])
+def delete_document(document_id):
+    if not documents.delete(document_id, g.user_id):
+        return jsonify({"error": "Document not found"}), 404
+    return jsonify({"success": True}), 200
@@ -0,0 +1,213 @@
+"""Extracted documents kept server-side, so clients send a ``documentId`` instead of the text.
+
+Text is stored zlib-compressed. A document expires DOCUMENT_TTL_SECONDS
+after it was last used; each user keeps at most DOCUMENT_MAX_PER_USER
+documents and DOCUMENT_MAX_BYTES_PER_USER stored (compressed) bytes, and the
+least recently used go first. Expired rows are purged whenever a document
+is stored.
+"""
+import hashlib
+import uuid
+import zlib
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app, jsonify
+
+from . import db
+from .database import aware
+from .model import Document
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def _expiry(now):
+    return now + timedelta(seconds=current_app.config['DOCUMENT_TTL_SECONDS'])
+
+
+def document_dict(document):
+    return {
+        "id": document.id,
+        "filename": document.filename,
+        "engine": document.engine,
+        "pageCount": document.page_count,
+        "wordCount": document.word_count,
+        "textBytes": document.text_bytes,
+        "storedBytes": document.stored_bytes,
+        "createdAt": aware(document.created_at).isoformat(),
+        "lastUsedAt": aware(document.last_used_at).isoformat(),
+        "expiresAt": aware(document.expires_at).isoformat(),
+    }
+
+
+class DocumentWriter:
+    """Compresses and hashes text as it arrives, so streamed pages are never joined in memory.
+
+    Pages are joined the way ``join_pages`` joins them: newline separated,
+    stripped at both ends.
+    """
+
+    def __init__(self):
+        self._compressor = zlib.compressobj(current_app.config['DOCUMENT_COMPRESS_LEVEL'])
+        self._hash = hashlib.sha256()
+        self._chunks = []
+        self._pending = ""
+        self._pages = 0
+        self.text_bytes = 0
+        self.words = 0
+
+    def _write(self, text):
+        encoded = text.encode('utf-8')
+        self._hash.update(encoded)
+        self.text_bytes += len(encoded)
+        self._chunks.append(self._compressor.compress(encoded))
+
+    def add_page(self, text):
+        if self._pages:
+            text = "\n" + text
+        self._pages += 1
+        self.words += len(text.split())
+        combined = self._pending + text
+        if not self.text_bytes:
+            combined = combined.lstrip()
+        # Trailing whitespace is held back until more text follows it
+        written = combined.rstrip()
+        self._pending = combined[len(written):]
+        if written:
+            self._write(written)
+
+    def save(self, user_id, filename=None, engine=None, page_count=None, word_count=None):
+        """Store the text for ``user_id``; returns the Document, or None if it alone exceeds the quota.
+
+        Storing the same text again refreshes the existing document.
+        """
+        config = current_app.config
+        content_hash = self._hash.hexdigest()
+        now = _now()
+
+        document = Document.query.filter_by(user_id=int(user_id), content_hash=content_hash).first()
+        if document is not None and aware(document.expires_at) > now:
+            document.filename = filename or document.filename
+            document.last_used_at = now
+            document.expires_at = _expiry(now)
+            db.session.commit()
+            return document
+
+        compressed = b"".join([*self._chunks, self._compressor.flush()])
+        if len(compressed) > config['DOCUMENT_MAX_BYTES_PER_USER']:
+            return None
+
+        document = Document(
+            id=uuid.uuid4().hex,
+            user_id=int(user_id),
+            filename=filename,
+            engine=engine,
+            content_hash=content_hash,
+            page_count=page_count,
+            word_count=word_count if word_count is not None else self.words,
+            text_bytes=self.text_bytes,
+            stored_bytes=len(compressed),
+            text=compressed,
+            created_at=now,
+            last_used_at=now,
+            expires_at=_expiry(now)
+        )
+        db.session.add(document)
+        db.session.flush()
+        purge_expired(now)
+        _enforce_quota(int(user_id), document.id)
+        db.session.commit()
+        return document
+
+
+def store(user_id, text, filename=None, engine=None, page_count=None, word_count=None):
+    """Keep ``text`` for ``user_id``; see ``DocumentWriter.save``"""
+    writer = DocumentWriter()
+    writer.add_page(text)
+    return writer.save(user_id, filename, engine, page_count, word_count)
+
+
+def _enforce_quota(user_id, keep_id):
+    """Drop a user's least recently used documents beyond the count and byte quotas"""
+    config = current_app.config
+    rows = (
+        db.session.query(Document.id, Document.stored_bytes)
+        .filter(Document.user_id == user_id)
+        .order_by(Document.last_used_at.desc())
+        .all()
+    )
+    kept, total, evict = 0, 0, []
+    # The document just stored always stays
+    for row in sorted(rows, key=lambda row: row.id != keep_id):
+        if row.id == keep_id or (
+            kept < config['DOCUMENT_MAX_PER_USER']
+            and total + row.stored_bytes <= config['DOCUMENT_MAX_BYTES_PER_USER']
+        ):
+            kept += 1
+            total += row.stored_bytes
+        else:
+            evict.append(row.id)
+    if evict:
+        Document.query.filter(Document.id.in_(evict)).delete(synchronize_session=False)
+
+
+def purge_expired(now=None):
+    """Delete every expired document; returns how many there were"""
+    return Document.query.filter(Document.expires_at <= (now or _now())).delete(synchronize_session=False)
+
+
+def get(document_id, user_id, touch=True):
+    """A live document owned by ``user_id``, or None; using it pushes its expiry back.
+
+    A ``user_id`` of None skips the owner check (queued jobs were checked when submitted).
+    """
+    document = db.session.get(Document, document_id) if document_id else None
+    if document is None or (user_id is not None and str(document.user_id) != str(user_id)):
+        return None
+    now = _now()
+    if aware(document.expires_at) <= now:
+        return None
+    if touch:
+        document.last_used_at = now
+        document.expires_at = _expiry(now)
+        db.session.commit()
+    return document
+
+
+def text_of(document):
+    return zlib.decompress(document.text).decode('utf-8')
+
+
+def list_documents(user_id):
+    """A user's live documents, most recently used first"""
+    return (
+        Document.query
+        .filter(Document.user_id == int(user_id), Document.expires_at > _now())
+        .order_by(Document.last_used_at.desc())
+        .all()
+    )
+
+
+def delete(document_id, user_id):
+    document = get(document_id, user_id, touch=False)
+    if document is None:
+        return False
+    db.session.delete(document)
+    db.session.commit()
+    return True
+
+
+def resolve_document(data, user_id):
+    """The stored document a request names in ``documentId``.
+
+    Returns ``(document, None)``, ``(None, None)`` when it names none, or
+    ``(None, (response, status))`` when it is unknown or has expired.
+    """
+    document_id = data.get('documentId')
+    if not document_id:
+        return None, None
+    document = get(document_id, user_id)
+    if document is None:
+        return None, (jsonify({"error": "Document not found"}), 404)
+    return document, None
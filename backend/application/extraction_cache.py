@@ -0,0 +1,208 @@
+import functools
+import gzip
+import hashlib
+import json
+import mmap
+import os
+import tempfile
+import threading
+import time
+
+from flask import current_app
+
+from .pdf_engines import ENGINES
+from .pdf_extraction import extract_pages, join_pages
+
+# Bump when the shape of cached results or the extraction pipeline changes
+EXTRACTION_CACHE_VERSION = 1
+# Partial entries older than this belong to a writer that is gone
+STALE_TEMP_SECONDS = 3600
+
+_counters = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+_counters_lock = threading.Lock()
+_evict_lock = threading.Lock()
+
+
+def _count(name, amount=1):
+    with _counters_lock:
+        _counters[name] += amount
+
+
+def cache_stats():
+    with _counters_lock:
+        counters = dict(_counters)
+    lookups = counters["hits"] + counters["misses"]
+    counters["hitRate"] = round(counters["hits"] / lookups, 4) if lookups else 0.0
+    return counters
+
+
+@functools.lru_cache(maxsize=32)
+def engine_fingerprint(engine_names):
+    """Short digest of the cache version and the engines (with versions) in play"""
+    material = "|".join(
+        [f"v{EXTRACTION_CACHE_VERSION}"] + [f"{name}={ENGINES[name].version()}" for name in engine_names]
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()[:16]
+
+
+def _cache_dir():
+    return current_app.config['PDF_CACHE_DIR'] or os.path.join(current_app.instance_path, 'pdf_cache')
+
+
+def _entry_path(digest, engine_names):
+    return os.path.join(_cache_dir(), f"{digest}-{engine_fingerprint(tuple(engine_names))}.json.gz")
+
+
+def get(digest, engine_names):
+    """Return the cached extraction for the upload's SHA-256, or None"""
+    if not current_app.config['PDF_CACHE_ENABLED']:
+        return None
+    path = _entry_path(digest, engine_names)
+    try:
+        with gzip.open(path, 'rt', encoding='utf-8') as entry:
+            result = json.load(entry)
+        # Touch on read so eviction is least-recently-used, not oldest-written
+        os.utime(path)
+    except (OSError, ValueError):
+        _count("misses")
+        return None
+    _count("hits")
+    return result
+
+
+def put(digest, engine_names, result):
+    if not current_app.config['PDF_CACHE_ENABLED']:
+        return
+    directory = _cache_dir()
+    try:
+        os.makedirs(directory, exist_ok=True)
+        # Write then rename, so concurrent readers never see a partial entry
+        handle, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(handle, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=5) as entry:
+            entry.write(json.dumps(result).encode('utf-8'))
+        os.replace(temp_path, _entry_path(digest, engine_names))
+    except OSError:
+        current_app.logger.warning("Could not write PDF extraction cache entry", exc_info=True)
+        return
+    _count("stores")
+    _evict(directory, current_app.config['PDF_CACHE_MAX_BYTES'])
+
+
+def digest(source):
+    """SHA-256 of PDF bytes or of a file on disk (hashed through a memory map, not a copy)"""
+    if not isinstance(source, str):
+        return hashlib.sha256(source).hexdigest()
+    with open(source, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return hashlib.sha256(b'').hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return hashlib.sha256(mapped).hexdigest()
+
+
+def extract(source, requested_engine, engine_names):
+    """Extract a PDF (bytes or a path) through the cache; returns ``(pages, engine, word_count, cached)``"""
+    source_digest = digest(source)
+    cached = get(source_digest, engine_names)
+    if cached:
+        return cached['pages'], cached['engine'], cached['wordCount'], True
+
+    pages, engine = extract_pages(source, requested_engine)
+    word_count = len(join_pages(pages).split())
+    put(source_digest, engine_names, {
+        "pages": pages,
+        "engine": engine,
+        "pageCount": len(pages),
+        "wordCount": word_count
+    })
+    return pages, engine, word_count, False
+
+
+class CacheWriter:
+    """Write an entry page by page, so streamed extractions are cached without
+    holding the whole document in memory"""
+
+    def __init__(self, directory, path):
+        self.directory = directory
+        self.path = path
+        handle, self.temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        self._raw = os.fdopen(handle, 'wb')
+        self._entry = gzip.GzipFile(fileobj=self._raw, mode='wb', compresslevel=5)
+        self._entry.write(b'{"pages": [')
+        self._first = True
+
+    def add_page(self, text):
+        if not self._first:
+            self._entry.write(b', ')
+        self._entry.write(json.dumps(text).encode('utf-8'))
+        self._first = False
+
+    def commit(self, engine, page_count, word_count):
+        summary = json.dumps({"engine": engine, "pageCount": page_count, "wordCount": word_count})
+        self._entry.write(b'], ' + summary[1:].encode('utf-8'))
+        self._close()
+        os.replace(self.temp_path, self.path)
+        _count("stores")
+        _evict(self.directory, current_app.config['PDF_CACHE_MAX_BYTES'])
+
+    def abort(self):
+        self._close()
+        try:
+            os.remove(self.temp_path)
+        except OSError:
+            pass
+
+    def _close(self):
+        # Safe to repeat: GzipFile.close and file.close are no-ops once closed
+        self._entry.close()
+        self._raw.close()
+
+
+def writer(digest, engine_names):
+    """Return a CacheWriter for the upload, or None when caching is off or unavailable"""
+    if not current_app.config['PDF_CACHE_ENABLED']:
+        return None
+    directory = _cache_dir()
+    try:
+        os.makedirs(directory, exist_ok=True)
+        return CacheWriter(directory, _entry_path(digest, engine_names))
+    except OSError:
+        current_app.logger.warning("Could not open PDF extraction cache entry", exc_info=True)
+        return None
+
+
+def _evict(directory, max_bytes):
+    """Drop least recently used entries until the cache fits in ``max_bytes``"""
+    with _evict_lock:
+        entries = []
+        total = 0
+        stale_before = time.time() - STALE_TEMP_SECONDS
+        with os.scandir(directory) as scan:
+            for item in scan:
+                if item.name.endswith('.tmp'):
+                    # Left behind by a process that died mid-write
+                    try:
+                        if item.stat().st_mtime < stale_before:
+                            os.remove(item.path)
+                    except OSError:
+                        pass
+                    continue
+                if not item.name.endswith('.json.gz'):
+                    continue
+                try:
+                    stat = item.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, item.path))
+                total += stat.st_size
+
+        if total <= max_bytes:
+            return
+        for _, size, path in sorted(entries):
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            _count("evictions")
+            if total <= max_bytes:
+                return
@@ -0,0 +1,110 @@
+from flask import Blueprint, Response, current_app, g, request, jsonify, stream_with_context
+import json
+import time
+from . import db
+from . import documents
+from .model import Job
+from . import jobs
+from .pdf_routes import _get_pdf_upload, submit_summary_job
+
+job_bp = Blueprint("jobs", __name__)
+
+# Every route here requires a bearer token; auth.authenticate sets g.user_id
+
+# Comment line sent while a streamed job makes no progress, so proxies keep the connection
+KEEPALIVE_SECONDS = 15
+
+def _get_job(job_id, user_id):
+    job = db.session.get(Job, job_id)
+    if job is None or str(job.user_id) != str(user_id):
+        return None
+    return job
+
+@job_bp.route("/jobs/summarize", methods=["POST"])
+def submit_summarize_job():
+    """Queue a background summarization of JSON ``text`` or ``documentId``, or an uploaded ``pdf``"""
+    try:
+        upload = None
+        engine = None
+        if request.files:
+            file, engine, engine_names, error_response = _get_pdf_upload()
+            if error_response:
+                return error_response
+            upload = file
+            data = request.form.to_dict()
+            try:
+                data['options'] = json.loads(data.get('options') or '{}')
+            except ValueError:
+                return jsonify({"error": "options must be a JSON object"}), 400
+        else:
+            data = request.get_json(silent=True)
+            if not data:
+                return jsonify({"error": "No data provided"}), 400
+
+        if not all([data.get('text') or data.get('documentId') or upload, data.get('model'), data.get('apiKey'), data.get('provider')]):
+            return jsonify({"error": "Missing required parameters"}), 400
+
+        from . import ai_routes
+        if data.get('provider') not in ai_routes.PROVIDER_FUNCTIONS:
+            return jsonify({"error": "Unsupported provider"}), 400
+
+        document = None
+        if upload is None:
+            document, error_response = documents.resolve_document(data, g.user_id)
+            if error_response:
+                return error_response
+
+        body, status = submit_summary_job(g.user_id, data, upload, engine, document)
+        return jsonify(body), status
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": f"Could not queue job: {str(e)}"}), 500
+
+@job_bp.route("/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    """Status, progress and (once finished) the result of a background job"""
+    job = _get_job(job_id, g.user_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(jobs.job_dict(job)), 200
+
+def _sse_event(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+@job_bp.route("/jobs/<job_id>/stream", methods=["GET"])
+def stream_job(job_id):
+    """Server-sent events for a job: ``progress`` on every change, then ``done`` or ``error``"""
+    if _get_job(job_id, g.user_id) is None:
+        return jsonify({"error": "Job not found"}), 404
+
+    poll_seconds = current_app.config['JOB_STREAM_POLL']
+
+    def event_stream():
+        last = None
+        last_sent = time.monotonic()
+        while True:
+            # Start a fresh transaction so progress written by the worker is visible
+            db.session.rollback()
+            job = db.session.get(Job, job_id)
+            if job is None:
+                yield _sse_event("error", {"id": job_id, "error": "Job not found"})
+                return
+            if job.status in jobs.FINISHED:
+                yield _sse_event("done" if job.status == 'succeeded' else "error", jobs.job_dict(job))
+                return
+            state = (job.status, job.progress)
+            if state != last:
+                last = state
+                last_sent = time.monotonic()
+                yield _sse_event("progress", jobs.job_dict(job, include_result=False))
+            elif time.monotonic() - last_sent >= KEEPALIVE_SECONDS:
+                last_sent = time.monotonic()
+                yield ": keep-alive\n\n"
+            time.sleep(poll_seconds)
+
+    return Response(
+        stream_with_context(event_stream()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -0,0 +1,243 @@
+import itertools
+import json
+import os
+import queue
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app
+from sqlalchemy.exc import SQLAlchemyError
+
+from . import db
+from .database import aware
+from .model import Job
+
+FINISHED = ('succeeded', 'failed')
+
+# (priority, sequence, job id); smaller jobs run first, ties in submission order
+_queue = queue.PriorityQueue()
+_sequence = itertools.count()
+_workers = []
+_workers_lock = threading.Lock()
+# Process that last recovered jobs; recovery runs once per (forked) worker process
+_recovered_pid = None
+
+
+class QueueFull(Exception):
+    pass
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def job_dict(job, include_result=True):
+    """Public JSON shape of a job (never includes the payload, which holds the API key)"""
+    body = {
+        "id": job.id,
+        "type": job.kind,
+        "status": job.status,
+        "progress": json.loads(job.progress) if job.progress else None,
+        "createdAt": aware(job.created_at).isoformat(),
+        "startedAt": aware(job.started_at).isoformat() if job.started_at else None,
+        "finishedAt": aware(job.finished_at).isoformat() if job.finished_at else None,
+    }
+    if job.error:
+        body["error"] = job.error
+    if include_result and job.result:
+        body["result"] = json.loads(job.result)
+    return body
+
+
+def upload_dir():
+    return current_app.config['JOB_UPLOAD_DIR'] or os.path.join(current_app.instance_path, 'job_uploads')
+
+
+def submit(user_id, kind, payload, size, upload=None):
+    """Store a job and queue it; ``upload`` (an uploaded PDF file) is kept on disk until it finishes"""
+    app = current_app._get_current_object()
+    recover_once(app)
+    if Job.query.filter_by(status='queued').count() >= current_app.config['JOB_MAX_QUEUED']:
+        raise QueueFull()
+
+    job_id = uuid.uuid4().hex
+    if upload is not None:
+        os.makedirs(upload_dir(), exist_ok=True)
+        payload = {**payload, "upload": os.path.join(upload_dir(), f"{job_id}.pdf")}
+        upload.stream.seek(0)
+        upload.save(payload["upload"])
+
+    now = _now()
+    job = Job(
+        id=job_id,
+        user_id=int(user_id),
+        kind=kind,
+        status='queued',
+        priority=size,
+        payload=json.dumps(payload),
+        created_at=now,
+        updated_at=now
+    )
+    db.session.add(job)
+    db.session.commit()
+    _enqueue(app, job.id, job.priority)
+    return job
+
+
+def _enqueue(app, job_id, priority):
+    _start_workers(app)
+    _queue.put((priority, next(_sequence), job_id))
+
+
+def _start_workers(app):
+    with _workers_lock:
+        if _workers:
+            return
+        for index in range(app.config['JOB_WORKERS']):
+            worker = threading.Thread(target=_work, args=(app,), name=f"job-worker-{index}", daemon=True)
+            worker.start()
+            _workers.append(worker)
+
+
+def _work(app):
+    while True:
+        _, _, job_id = _queue.get()
+        with app.app_context():
+            try:
+                _run(job_id)
+            except Exception:
+                app.logger.exception("Job %s crashed", job_id)
+                _abandon(app, job_id)
+            finally:
+                db.session.remove()
+
+
+def _claim(job_id):
+    """Move a queued job to running; False if another worker or process got it first"""
+    now = _now()
+    claimed = Job.query.filter_by(id=job_id, status='queued').update(
+        {"status": 'running', "started_at": now, "updated_at": now}, synchronize_session=False
+    )
+    db.session.commit()
+    return claimed == 1
+
+
+def _update(job_id, **fields):
+    Job.query.filter_by(id=job_id).update({**fields, "updated_at": _now()}, synchronize_session=False)
+    db.session.commit()
+
+
+def _run(job_id):
+    if not _claim(job_id):
+        return
+    job = db.session.get(Job, job_id)
+    payload = json.loads(job.payload)
+
+    def report(stage, completed, total):
+        _update(job_id, progress=json.dumps({"stage": stage, "completed": completed, "total": total}))
+
+    try:
+        body, status = HANDLERS[job.kind](payload, report)
+    except Exception as e:
+        body, status = {"error": f"Job failed: {str(e)}"}, 500
+    _finish(job_id, payload, body, status)
+
+
+def _finish(job_id, payload, body, status):
+    # The API key only lives in the payload while the job can still run
+    payload.pop('apiKey', None)
+    upload = payload.pop('upload', None)
+    _update(
+        job_id,
+        status='succeeded' if status == 200 else 'failed',
+        result=json.dumps(body) if status == 200 else None,
+        error=body.get('error') if status != 200 else None,
+        payload=json.dumps(payload),
+        finished_at=_now()
+    )
+    if upload:
+        try:
+            os.remove(upload)
+        except OSError:
+            pass
+
+
+def _abandon(app, job_id):
+    """Fail a job whose run crashed before it could finish, so its API key is not left behind"""
+    try:
+        db.session.rollback()
+        job = db.session.get(Job, job_id)
+        if job is not None and job.status == 'running':
+            _finish(job_id, json.loads(job.payload), {"error": "Job failed unexpectedly"}, 500)
+    except Exception:
+        db.session.rollback()
+        app.logger.warning("Could not mark crashed job %s as failed", job_id, exc_info=True)
+
+
+def run_summarize(payload, report):
+    from . import documents
+    from .extraction_cache import extract
+    from .pdf_extraction import join_pages, resolve_engines
+    from .pdf_routes import EMPTY_PDF_ERROR, summarize_text
+
+    text = payload.get('text')
+    if payload.get('documentId'):
+        document = documents.get(payload['documentId'], None)
+        if document is None:
+            return {"error": "Document not found"}, 404
+        text = documents.text_of(document)
+    if payload.get('upload'):
+        report("extract", 0, 1)
+        pages, _, _, _ = extract(payload['upload'], payload.get('engine'), resolve_engines(payload.get('engine')))
+        text = join_pages(pages)
+        report("extract", 1, 1)
+        if not text:
+            return {"error": EMPTY_PDF_ERROR}, 400
+
+    return summarize_text(
+        text, payload['prompt'], payload['model'], payload['apiKey'], payload['provider'], payload['options'],
+        on_progress=report
+    )
+
+
+HANDLERS = {
+    'summarize': run_summarize,
+}
+
+
+def recover_jobs(app):
+    """Requeue jobs left by a previous run: queued ones, and running ones whose
+    worker stopped sending progress JOB_STALE_SECONDS ago (e.g. it was restarted)"""
+    with app.app_context():
+        try:
+            stale = _now() - timedelta(seconds=app.config['JOB_STALE_SECONDS'])
+            Job.query.filter(Job.status == 'running', Job.updated_at < stale).update(
+                {"status": 'queued', "updated_at": _now()}, synchronize_session=False
+            )
+            db.session.commit()
+            pending = Job.query.filter_by(status='queued').order_by(Job.priority, Job.created_at).all()
+        except SQLAlchemyError:
+            db.session.rollback()
+            app.logger.warning("Could not recover background jobs", exc_info=True)
+            return
+        for job in pending:
+            _enqueue(app, job.id, job.priority)
+
+
+def recover_once(app):
+    """Recover jobs the first time this process needs the queue.
+
+    Called by the server's worker startup hook (``startup.after_fork``, the
+    ASGI lifespan) and, as a fallback for servers without one, on the first
+    submission; never at import, so a gunicorn --preload master starts no
+    worker threads before it forks.
+    """
+    global _recovered_pid
+    if _recovered_pid == os.getpid():
+        return
+    with _workers_lock:
+        if _recovered_pid == os.getpid():
+            return
+        _recovered_pid = os.getpid()
+    recover_jobs(app)
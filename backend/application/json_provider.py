@@ -0,0 +1,70 @@
+"""JSON for requests and responses: orjson when it is installed, the stdlib otherwise.
+
+JSON_PROVIDER is "auto" (orjson if importable), "orjson" or "stdlib". Output
+matches Flask's default provider apart from non-ASCII text, which orjson
+writes as UTF-8 rather than \\u escapes. Dates still go out as HTTP dates,
+and values orjson cannot encode (integers beyond 64 bits, for example) fall
+back to the stdlib encoder.
+"""
+import importlib
+import importlib.util
+
+from flask.json.provider import DefaultJSONProvider
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    def __init__(self, app):
+        super().__init__(app)
+        self._orjson = importlib.import_module('orjson')
+        # Datetimes and dataclasses go through ``default`` so they serialize exactly as before
+        self._options = (
+            self._orjson.OPT_NON_STR_KEYS
+            | self._orjson.OPT_PASSTHROUGH_DATETIME
+            | self._orjson.OPT_PASSTHROUGH_DATACLASS
+        )
+
+    def _dump_bytes(self, obj, indent=False):
+        options = self._options
+        if self.sort_keys:
+            options |= self._orjson.OPT_SORT_KEYS
+        if indent:
+            options |= self._orjson.OPT_INDENT_2
+        return self._orjson.dumps(obj, default=self.default, option=options)
+
+    def dumps(self, obj, **kwargs):
+        # Keyword arguments are stdlib json options; only the defaults have an orjson equivalent
+        if not kwargs:
+            try:
+                return self._dump_bytes(obj).decode('utf-8')
+            except self._orjson.JSONEncodeError:
+                pass
+        return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return self._orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        # Encoded straight to bytes: no intermediate str for multi-megabyte documents
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        try:
+            body = self._dump_bytes(obj, indent=indent)
+        except self._orjson.JSONEncodeError:
+            return super().response(obj)
+        return self._app.response_class(body + b"\n", mimetype=self.mimetype)
+
+
+def _orjson_available():
+    return importlib.util.find_spec('orjson') is not None
+
+
+def init_json(app):
+    choice = app.config['JSON_PROVIDER']
+    if choice not in ('auto', 'orjson', 'stdlib'):
+        raise ValueError(f"Unknown JSON_PROVIDER {choice!r}; expected auto, orjson or stdlib")
+    if choice == 'orjson' or (choice == 'auto' and _orjson_available()):
+        app.json = OrjsonProvider(app)
+    else:
+        app.json = DefaultJSONProvider(app)
@@ -0,0 +1,247 @@
+"""In-process metrics in the Prometheus text exposition format (served on /api/metrics).
+
+Hot paths only take a lock and bump a few numbers; cache and pool figures are
+read from their own counters when the endpoint is scraped. Every process keeps
+its own registry, so under several gunicorn workers each scrape sees the
+worker that answered it.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import current_app, g, request
+
+from . import tokens
+
+# Seconds; covers sub-millisecond cache hits up to slow provider calls
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_metrics = []
+_collectors = []
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+        for name, value in pairs
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for label_values, value in sorted(values.items()):
+            yield self.name, _format_labels(self.labels, label_values), value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                # Per-bucket (not cumulative) counts, plus one for +Inf, then sum and count
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, *label_values):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *label_values)
+
+    def samples(self):
+        with self._lock:
+            series = {key: ([*counts], total, count) for key, (counts, total, count) in self._series.items()}
+        for label_values, (counts, total, count) in sorted(series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, float("inf")), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labels, label_values, [("le", _format_value(bound))])
+                yield f"{self.name}_bucket", labels, cumulative
+            labels = _format_labels(self.labels, label_values)
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, count
+
+
+def model_label(provider, model):
+    """The known model family (``tokens.MODEL_FAMILIES`` prefix) ``model`` belongs to, or "other";
+    model names come from clients, so they never become label values as-is"""
+    model = (model or '').lower()
+    prefixes = [
+        prefix for family_provider, prefix, _, _ in tokens.MODEL_FAMILIES
+        if family_provider == provider and prefix and model.startswith(prefix)
+    ]
+    return max(prefixes, key=len) if prefixes else "other"
+
+
+def collector(function):
+    """Register ``function`` to be called at scrape time; it returns
+    ``[(name, kind, help, [(label dict, value), ...]), ...]``"""
+    _collectors.append(function)
+    return function
+
+
+def render():
+    """All metrics in the Prometheus text format"""
+    lines = []
+    for metric in _metrics:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(f"{name}{labels} {_format_value(value)}" for name, labels, value in metric.samples())
+    for function in _collectors:
+        try:
+            families = function()
+        except Exception:
+            current_app.logger.warning("Metrics collector %s failed", function.__name__, exc_info=True)
+            continue
+        for name, kind, help, samples in families:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{_format_labels(labels.keys(), labels.values())} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Time to handle an API request, to the end of a streamed body",
+    ("method", "route", "status")
+)
+PROVIDER_CALL_SECONDS = Histogram(
+    "ai_provider_call_duration_seconds", "Provider generation calls, including retries, by model family",
+    ("provider", "model", "outcome")
+)
+PROVIDER_TTFB_SECONDS = Histogram(
+    "ai_provider_time_to_first_byte_seconds", "Time from sending a provider request to its response headers",
+    ("host",)
+)
+PDF_EXTRACTION_SECONDS = Histogram(
+    "pdf_extraction_duration_seconds", "Text extraction time per document (cache misses only)", ("engine",)
+)
+PDF_PAGES = Counter("pdf_pages_extracted_total", "Pages extracted; divide by the extraction seconds for pages/sec",
+                    ("engine",))
+PDF_BYTES = Counter("pdf_bytes_processed_total", "PDF bytes handed to an extraction engine", ("engine",))
+JWT_DECODE_SECONDS = Histogram(
+    "auth_jwt_decode_duration_seconds", "Signature checks of bearer tokens that missed the token cache",
+    buckets=(0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01)
+)
+AUTH_TOKEN_LOOKUPS = Counter("auth_token_cache_lookups_total", "Bearer token cache lookups", ("result",))
+DB_CHECKOUT_WAIT_SECONDS = Histogram(
+    "db_pool_checkout_wait_seconds", "Time spent waiting for a pooled database connection", ("bind",),
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30)
+)
+
+
+def _start_timer():
+    g.metrics_started = time.perf_counter()
+
+
+def _capture_status(response):
+    g.metrics_status = response.status_code
+    return response
+
+
+def _observe_request(error):
+    started = g.pop('metrics_started', None)
+    if started is None:
+        return
+    rule = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    status = g.pop('metrics_status', 500 if error else 200)
+    HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, request.method, rule, status)
+
+
+@collector
+def _cache_metrics():
+    from .extraction_cache import cache_stats
+    from .response_cache import get_response_cache
+    from .singleflight import stats as singleflight_stats
+
+    response = get_response_cache().stats()
+    extraction = cache_stats()
+    coalesced = singleflight_stats()
+    return [
+        ("ai_response_cache_lookups_total", "counter", "AI response cache lookups", [
+            ({"result": "hit"}, response["hits"]),
+            ({"result": "persistent_hit"}, response["persistentHits"]),
+            ({"result": "miss"}, response["misses"]),
+        ]),
+        ("ai_response_cache_hit_ratio", "gauge", "Share of AI response cache lookups served from the cache",
+         [({}, response["hitRate"])]),
+        ("ai_response_cache_bytes", "gauge", "Bytes held by the in-memory AI response cache",
+         [({}, response["bytes"])]),
+        ("pdf_extraction_cache_lookups_total", "counter", "PDF extraction cache lookups", [
+            ({"result": "hit"}, extraction["hits"]),
+            ({"result": "miss"}, extraction["misses"]),
+        ]),
+        ("pdf_extraction_cache_hit_ratio", "gauge", "Share of PDF extraction cache lookups served from disk",
+         [({}, extraction["hitRate"])]),
+        ("ai_singleflight_calls_total", "counter", "In-process coalescing of identical generations",
+         [({"role": role}, value) for role, value in sorted(coalesced.items())]),
+    ]
+
+
+@collector
+def _pool_metrics():
+    from .database import pool_stats
+
+    families = {
+        "checkedout": ("db_pool_checked_out_connections", "Connections currently checked out"),
+        "checkedin": ("db_pool_idle_connections", "Idle connections in the pool"),
+        "overflow": ("db_pool_overflow_connections", "Connections beyond pool_size (negative while the pool fills)"),
+        "size": ("db_pool_size", "Configured pool size"),
+    }
+    stats = pool_stats()
+    return [
+        (name, "gauge", help, [({"bind": bind}, entry[field]) for bind, entry in stats.items() if field in entry])
+        for field, (name, help) in families.items()
+    ]
+
+
+def init_metrics(app):
+    """Time every request by method, URL rule and status"""
+    if not app.config['METRICS_ENABLED']:
+        return
+    app.before_request(_start_timer)
+    app.after_request(_capture_status)
+    app.teardown_request(_observe_request)
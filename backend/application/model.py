@@ -9,4 +9,73 @@ class User(db.Model):
     password = db.Column(db.String(255), nullable=False)
     
     def __repr__(self):
-        return f'<User {self.email}>'
\ No newline at end of file
+        return f'<User {self.email}>'
+
+
+class CachedResponse(db.Model):
+    __tablename__ = 'ai_response_cache'
+    key = db.Column(db.String(64), primary_key=True)
+    provider = db.Column(db.String(50), nullable=False)
+    model = db.Column(db.String(255), nullable=False)
+    content = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime(timezone=True), nullable=False)
+    expires_at = db.Column(db.DateTime(timezone=True), nullable=False, index=True)
+
+    def __repr__(self):
+        return f'<CachedResponse {self.provider}/{self.model} {self.key[:12]}>'
+
+
+class InflightGeneration(db.Model):
+    __tablename__ = 'inflight_generations'
+    key = db.Column(db.String(64), primary_key=True)
+    owner = db.Column(db.String(64), nullable=False)
+    leader = db.Column(db.String(255), nullable=False)
+    status = db.Column(db.String(20), nullable=False)
+    result = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime(timezone=True), nullable=False)
+    expires_at = db.Column(db.DateTime(timezone=True), nullable=False, index=True)
+
+    def __repr__(self):
+        return f'<InflightGeneration {self.key[:12]} {self.status}>'
+
+
+class Job(db.Model):
+    __tablename__ = 'jobs'
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    kind = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(20), nullable=False, index=True)
+    priority = db.Column(db.BigInteger, nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    progress = db.Column(db.Text, nullable=True)
+    result = db.Column(db.Text, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime(timezone=True), nullable=False)
+    started_at = db.Column(db.DateTime(timezone=True), nullable=True)
+    finished_at = db.Column(db.DateTime(timezone=True), nullable=True)
+    updated_at = db.Column(db.DateTime(timezone=True), nullable=False)
+
+    def __repr__(self):
+        return f'<Job {self.id} {self.kind} {self.status}>'
+
+
+class Document(db.Model):
+    __tablename__ = 'documents'
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    filename = db.Column(db.String(255), nullable=True)
+    engine = db.Column(db.String(50), nullable=True)
+    content_hash = db.Column(db.String(64), nullable=False)
+    page_count = db.Column(db.Integer, nullable=True)
+    word_count = db.Column(db.Integer, nullable=False)
+    text_bytes = db.Column(db.Integer, nullable=False)
+    stored_bytes = db.Column(db.Integer, nullable=False)
+    text = db.Column(db.LargeBinary, nullable=False)  # zlib-compressed UTF-8
+    created_at = db.Column(db.DateTime(timezone=True), nullable=False)
+    last_used_at = db.Column(db.DateTime(timezone=True), nullable=False)
+    expires_at = db.Column(db.DateTime(timezone=True), nullable=False, index=True)
+
+    __table_args__ = (db.Index('ix_documents_user_id_content_hash', 'user_id', 'content_hash'),)
+
+    def __repr__(self):
+        return f'<Document {self.id} {self.filename}>'
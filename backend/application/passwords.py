@@ -0,0 +1,93 @@
+import hmac
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+from flask import current_app
+from werkzeug.security import check_password_hash, generate_password_hash
+
+# Hashing runs on a small pool. The calling request thread still blocks until
+# its hash is done, so this does not free request threads: it caps how many
+# hashes burn CPU at once (PASSWORD_HASH_WORKERS) and turns a login burst
+# beyond PASSWORD_HASH_QUEUE waiting hashes into Overloaded instead of an
+# unbounded backlog. Each hash occupies one of the worker's GUNICORN_THREADS,
+# so the queue only comes into play when threads exceed the hash workers.
+_executor = None
+_executor_lock = threading.Lock()
+_slots = None
+
+
+class Overloaded(Exception):
+    """More hashes are queued than PASSWORD_HASH_QUEUE allows"""
+
+
+def _method():
+    """werkzeug method string for the configured scheme and cost"""
+    config = current_app.config
+    scheme = config['PASSWORD_HASH_SCHEME']
+    if scheme == 'pbkdf2':
+        return f"pbkdf2:sha256:{config['PASSWORD_PBKDF2_ITERATIONS']}"
+    if scheme == 'scrypt':
+        return f"scrypt:{config['PASSWORD_SCRYPT_N']}:8:1"
+    raise ValueError(f"Unsupported password hash scheme: {scheme}")
+
+
+def hash_password_sync(password):
+    config = current_app.config
+    if config['PASSWORD_HASH_SCHEME'] == 'bcrypt':
+        salt = bcrypt.gensalt(rounds=config['PASSWORD_BCRYPT_ROUNDS'])
+        return bcrypt.hashpw(password.encode('utf-8'), salt).decode('ascii')
+    return generate_password_hash(password, method=_method())
+
+
+def verify_password_sync(stored, password):
+    """Check ``password`` against a bcrypt hash or any werkzeug (scrypt/pbkdf2) hash"""
+    if stored.startswith('$2'):
+        try:
+            return bcrypt.checkpw(password.encode('utf-8'), stored.encode('ascii'))
+        except ValueError:
+            return False
+    return check_password_hash(stored, password)
+
+
+def needs_rehash(stored):
+    """True when ``stored`` was made with another scheme or cost than the configured one"""
+    config = current_app.config
+    if config['PASSWORD_HASH_SCHEME'] == 'bcrypt':
+        if not stored.startswith('$2'):
+            return True
+        return int(stored.split('$')[2]) != config['PASSWORD_BCRYPT_ROUNDS']
+    return not hmac.compare_digest(stored.split('$', 1)[0], _method())
+
+
+def _submit(function, *args):
+    global _executor, _slots
+    with _executor_lock:
+        if _executor is None:
+            workers = current_app.config['PASSWORD_HASH_WORKERS']
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+            _slots = threading.BoundedSemaphore(workers + current_app.config['PASSWORD_HASH_QUEUE'])
+    # Admission control: refuse instead of queueing without bound
+    if not _slots.acquire(blocking=False):
+        raise Overloaded()
+    app = current_app._get_current_object()
+
+    def run():
+        try:
+            with app.app_context():
+                return function(*args)
+        finally:
+            _slots.release()
+
+    return _executor.submit(run).result()
+
+
+def hash_password(password):
+    """Hash on the bounded pool; raises Overloaded when it is saturated"""
+    return _submit(hash_password_sync, password)
+
+
+def verify_password(stored, password):
+    """Verify on the bounded pool; raises Overloaded when it is saturated"""
+    return _submit(verify_password_sync, stored, password)
+
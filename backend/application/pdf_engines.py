@@ -0,0 +1,173 @@
+import importlib
+import importlib.util
+import io
+import mmap
+
+
+def _as_stream(source):
+    """Engines accept either raw PDF bytes or a path to a PDF on disk.
+
+    Files are memory-mapped, so pure-Python parsers read them through the
+    page cache instead of from a copy on the heap.
+    """
+    if isinstance(source, str):
+        with open(source, 'rb') as f:
+            try:
+                return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Empty files cannot be mapped; let the parser report them as invalid
+                return io.BytesIO(b'')
+    return io.BytesIO(source)
+
+
+class PDFEngine:
+    """Text extraction backend. Subclasses wrap one PDF library."""
+
+    name = None
+    module = None
+    distribution_module = None
+
+    @classmethod
+    def is_available(cls):
+        return importlib.util.find_spec(cls.module) is not None
+
+    @classmethod
+    def version(cls):
+        module = importlib.import_module(cls.distribution_module or cls.module)
+        return str(getattr(module, '__version__', getattr(module, 'VERSION', 'unknown')))
+
+    def page_count(self, source):
+        raise NotImplementedError
+
+    def iter_range(self, source, start, stop):
+        """Yield the text of pages [start, stop) one page at a time"""
+        raise NotImplementedError
+
+    def extract_range(self, source, start, stop):
+        """Return the text of pages [start, stop) as a list of strings"""
+        return list(self.iter_range(source, start, stop))
+
+
+class PyMuPDFEngine(PDFEngine):
+    name = 'pymupdf'
+    module = 'fitz'
+    distribution_module = 'pymupdf'
+
+    def _open(self, source):
+        import fitz
+        if isinstance(source, str):
+            return fitz.open(source)
+        return fitz.open(stream=source, filetype='pdf')
+
+    def page_count(self, source):
+        with self._open(source) as document:
+            return document.page_count
+
+    def iter_range(self, source, start, stop):
+        with self._open(source) as document:
+            for index in range(start, stop):
+                yield document[index].get_text()
+
+
+class PdfiumEngine(PDFEngine):
+    name = 'pypdfium2'
+    module = 'pypdfium2'
+
+    def page_count(self, source):
+        import pypdfium2
+        document = pypdfium2.PdfDocument(source)
+        try:
+            return len(document)
+        finally:
+            document.close()
+
+    def iter_range(self, source, start, stop):
+        import pypdfium2
+        document = pypdfium2.PdfDocument(source)
+        try:
+            for index in range(start, stop):
+                page = document[index]
+                textpage = page.get_textpage()
+                text = textpage.get_text_bounded()
+                textpage.close()
+                page.close()
+                yield text
+        finally:
+            document.close()
+
+
+class PyPDF2Engine(PDFEngine):
+    name = 'pypdf2'
+    module = 'PyPDF2'
+
+    def page_count(self, source):
+        import PyPDF2
+        with _as_stream(source) as stream:
+            return len(PyPDF2.PdfReader(stream).pages)
+
+    def iter_range(self, source, start, stop):
+        import PyPDF2
+        with _as_stream(source) as stream:
+            reader = PyPDF2.PdfReader(stream)
+            for index in range(start, stop):
+                yield reader.pages[index].extract_text() or ''
+
+
+class PdfminerEngine(PDFEngine):
+    name = 'pdfminer'
+    module = 'pdfminer'
+
+    def page_count(self, source):
+        from pdfminer.pdfpage import PDFPage
+        with _as_stream(source) as stream:
+            return sum(1 for _ in PDFPage.get_pages(stream))
+
+    def iter_range(self, source, start, stop):
+        from pdfminer.high_level import extract_pages
+        from pdfminer.layout import LTTextContainer
+        # pdfminer's high-level API takes a path or a file object, not a memory map
+        with (open(source, 'rb') if isinstance(source, str) else io.BytesIO(source)) as stream:
+            for layout in extract_pages(stream, page_numbers=range(start, stop)):
+                yield ''.join(element.get_text() for element in layout if isinstance(element, LTTextContainer))
+
+
+class PdfplumberEngine(PDFEngine):
+    name = 'pdfplumber'
+    module = 'pdfplumber'
+
+    def page_count(self, source):
+        import pdfplumber
+        with pdfplumber.open(_as_stream(source)) as document:
+            return len(document.pages)
+
+    def iter_range(self, source, start, stop):
+        import pdfplumber
+        with pdfplumber.open(_as_stream(source)) as document:
+            for index in range(start, stop):
+                page = document.pages[index]
+                yield page.extract_text() or ''
+                # pdfplumber keeps every parsed page's objects alive unless closed
+                page.close()
+
+
+ENGINES = {
+    engine.name: engine
+    for engine in (PyMuPDFEngine, PdfiumEngine, PyPDF2Engine, PdfminerEngine, PdfplumberEngine)
+}
+
+# Fastest first; "auto" falls through this list until an engine yields text
+AUTO_ORDER = ['pymupdf', 'pypdfium2', 'pypdf2', 'pdfminer', 'pdfplumber']
+
+
+def get_engine(name):
+    """Instantiate the named engine; raises ValueError for unknown or missing backends"""
+    engine_class = ENGINES.get(name)
+    if engine_class is None:
+        raise ValueError(f"Unsupported PDF engine: {name}")
+    if not engine_class.is_available():
+        raise ValueError(f"PDF engine '{name}' is not installed")
+    return engine_class()
+
+
+def available_engines():
+    return [name for name in AUTO_ORDER if ENGINES[name].is_available()]
@@ -0,0 +1,172 @@
+import os
+import threading
+import time
+from collections import deque
+
+from flask import current_app
+
+from .metrics import PDF_BYTES, PDF_EXTRACTION_SECONDS, PDF_PAGES
+from .pdf_engines import available_engines, get_engine
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor(workers):
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                # Created (and multiprocessing imported) lazily so it is never inherited across a gunicorn fork
+                import multiprocessing
+                from concurrent.futures import ProcessPoolExecutor
+                # Never plain fork: this process runs job, hedge and hashing threads, and a child
+                # forked while one of them holds a lock can deadlock on it
+                method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+                _executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(method))
+    return _executor
+
+
+def _extract_page_range(engine_name, source, start, stop):
+    """Extract pages [start, stop) with the named engine (runs in a worker process)"""
+    return get_engine(engine_name).extract_range(source, start, stop)
+
+
+def _extract_with(engine, source):
+    workers = current_app.config['PDF_EXTRACT_WORKERS']
+    page_count = engine.page_count(source)
+
+    if workers <= 1 or page_count < current_app.config['PDF_PARALLEL_MIN_PAGES']:
+        return engine.extract_range(source, 0, page_count)
+
+    chunk_size = -(-page_count // workers)
+    executor = _get_executor(workers)
+    futures = [
+        executor.submit(_extract_page_range, engine.name, source, start, min(start + chunk_size, page_count))
+        for start in range(0, page_count, chunk_size)
+    ]
+
+    pages = []
+    for future in futures:
+        pages.extend(future.result())
+    return pages
+
+
+def resolve_engines(requested=None):
+    """Engine names to try, in order, for a request (falls back to PDF_ENGINE).
+
+    Raises ValueError for an unknown or uninstalled engine.
+    """
+    name = (requested or current_app.config['PDF_ENGINE']).lower()
+    if name == 'auto':
+        names = available_engines()
+        if not names:
+            raise ValueError("No PDF engine is installed")
+        return names
+    get_engine(name)
+    return [name]
+
+
+def extract_pages(source, engine=None):
+    """Return ``(pages, engine_name)`` for the PDF in ``source`` (bytes or a path).
+
+    Documents with at least PDF_PARALLEL_MIN_PAGES pages are split into one
+    contiguous page range per worker process; smaller ones are extracted
+    inline, where process start-up and pickling would cost more than they save.
+    In "auto" mode engines are tried fastest first, moving on when one fails
+    or returns no text at all.
+    """
+    names = resolve_engines(engine)
+    empty_result = None
+    last_error = None
+
+    for name in names:
+        started = time.perf_counter()
+        try:
+            pages = _extract_with(get_engine(name), source)
+        except Exception as e:
+            last_error = e
+            continue
+        _record_extraction(name, source, len(pages), started)
+        if any(page.strip() for page in pages):
+            return pages, name
+        if empty_result is None:
+            empty_result = (pages, name)
+
+    if empty_result is not None:
+        return empty_result
+    raise last_error
+
+
+def _record_extraction(engine_name, source, page_count, started):
+    PDF_EXTRACTION_SECONDS.observe(time.perf_counter() - started, engine_name)
+    PDF_PAGES.inc(engine_name, amount=page_count)
+    PDF_BYTES.inc(engine_name, amount=os.path.getsize(source) if isinstance(source, str) else len(source))
+
+
+def open_engine(source, engine=None):
+    """Return ``(engine, page_count)`` for the first engine able to open ``source``.
+
+    Streaming cannot look at the whole text before choosing, so "auto" only
+    falls back when an engine fails to open the document.
+    """
+    last_error = None
+    for name in resolve_engines(engine):
+        candidate = get_engine(name)
+        try:
+            return candidate, candidate.page_count(source)
+        except Exception as e:
+            last_error = e
+    raise last_error
+
+
+def iter_pages(engine, source, page_count):
+    """Yield page texts in order while holding only a bounded window in memory.
+
+    Large documents are extracted in PDF_STREAM_CHUNK_PAGES page chunks on the
+    process pool with at most two chunks per worker in flight.
+    """
+    started = time.perf_counter()
+    extracted = 0
+    try:
+        for page in _iter_pages(engine, source, page_count):
+            extracted += 1
+            yield page
+    finally:
+        _record_extraction(engine.name, source, extracted, started)
+
+
+def _iter_pages(engine, source, page_count):
+    workers = current_app.config['PDF_EXTRACT_WORKERS']
+    if workers <= 1 or page_count < current_app.config['PDF_PARALLEL_MIN_PAGES']:
+        yield from engine.iter_range(source, 0, page_count)
+        return
+
+    chunk_size = current_app.config['PDF_STREAM_CHUNK_PAGES']
+    executor = _get_executor(workers)
+    starts = iter(range(0, page_count, chunk_size))
+    pending = deque()
+
+    def submit_next():
+        start = next(starts, None)
+        if start is not None:
+            pending.append(executor.submit(
+                _extract_page_range, engine.name, source, start, min(start + chunk_size, page_count)
+            ))
+
+    for _ in range(workers * 2):
+        submit_next()
+    try:
+        while pending:
+            pages = pending.popleft().result()
+            submit_next()
+            yield from pages
+    finally:
+        # The client may disconnect mid-stream; don't leave queued chunks behind
+        for future in pending:
+            future.cancel()
+
+
+def join_pages(pages):
+    """Join page texts in a single pass (no quadratic string building)"""
+    return "\n".join(pages).strip()
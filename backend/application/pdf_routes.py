@@ -1,87 +1,90 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, current_app, g, request, jsonify, stream_with_context
+from sqlalchemy.exc import SQLAlchemyError
+from werkzeug.exceptions import RequestEntityTooLarge
 import os
 import tempfile
-import PyPDF2
 import io
-from jose import jwt
 from . import db
+from .auth import public
 from .model import User
+from . import documents
+from . import extraction_cache
+from . import tokens
+from .pdf_engines import available_engines
+from .summarizer import summarize_document
+from .uploads import detach_upload, too_large_message, upload_size, upload_source
+from .pdf_extraction import iter_pages, join_pages, open_engine, resolve_engines
 
 pdf_bp = Blueprint("pdf", __name__)
 
-# JWT Configuration
-SECRET_KEY = os.environ.get('SECRET_KEY', 'your-secret-key-here')
-ALGORITHM = "HS256"
+EMPTY_PDF_ERROR = "No text could be extracted from the PDF. The PDF might be image-based or corrupted."
 
-def verify_token():
-    """Verify JWT token from request"""
-    auth_header = request.headers.get('Authorization')
-    if not auth_header or not auth_header.startswith('Bearer '):
-        return None, jsonify({"error": "Authorization header missing or invalid"}), 401
+def _get_pdf_upload():
+    """Validate the uploaded PDF and requested engine.
+
+    Returns ``(file, requested_engine, engine_names, None)`` or a ready
+    ``(response, status)`` error as the last element.
+    """
+    # Check if file is present (reading the form spools large files to disk)
+    try:
+        if 'pdf' not in request.files:
+            return None, None, None, (jsonify({"error": "No PDF file provided"}), 400)
+    except RequestEntityTooLarge:
+        return None, None, None, (jsonify({"error": too_large_message()}), 413)
+    
+    file = request.files['pdf']
+    
+    if file.filename == '':
+        return None, None, None, (jsonify({"error": "No file selected"}), 400)
+    
+    if not file.filename.lower().endswith('.pdf'):
+        return None, None, None, (jsonify({"error": "File must be a PDF"}), 400)
+    
+    # Check file size (PDF_MAX_UPLOAD_BYTES)
+    if upload_size(file) > current_app.config['PDF_MAX_UPLOAD_BYTES']:
+        return None, None, None, (jsonify({"error": too_large_message()}), 413)
     
-    token = auth_header.split(' ')[1]
+    # Engine can be chosen per request, otherwise PDF_ENGINE applies
+    requested_engine = request.form.get('engine') or request.args.get('engine')
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id = payload.get("sub")
-        if user_id is None:
-            return None, jsonify({"error": "Invalid token"}), 401
-        return user_id, None, None
-    except jwt.JWTError:
-        return None, jsonify({"error": "Invalid token"}), 401
+        engine_names = resolve_engines(requested_engine)
+    except ValueError as e:
+        return None, None, None, (jsonify({"error": str(e)}), 400)
+
+    return file, requested_engine, engine_names, None
 
 @pdf_bp.route("/pdf/extract", methods=["POST"])
 def extract_pdf_text():
     """Extract text from uploaded PDF file"""
     try:
-        # Verify authentication
-        user_id, error_response, status_code = verify_token()
+        file, requested_engine, engine_names, error_response = _get_pdf_upload()
         if error_response:
-            return error_response, status_code
+            return error_response
+
+        # Identical uploads are served from the content-addressed cache
+        source = upload_source(file)
 
-        # Check if file is present
-        if 'pdf' not in request.files:
-            return jsonify({"error": "No PDF file provided"}), 400
-        
-        file = request.files['pdf']
-        
-        if file.filename == '':
-            return jsonify({"error": "No file selected"}), 400
-        
-        if not file.filename.lower().endswith('.pdf'):
-            return jsonify({"error": "File must be a PDF"}), 400
-        
-        # Check file size (10MB limit)
-        file.seek(0, 2)  # Seek to end
-        file_size = file.tell()
-        file.seek(0)  # Reset to beginning
-        
-        if file_size > 10 * 1024 * 1024:  # 10MB
-            return jsonify({"error": "File size must be less than 10MB"}), 400
-        
         # Extract text from PDF
         try:
-            pdf_reader = PyPDF2.PdfReader(file)
-            text = ""
-            
-            for page_num in range(len(pdf_reader.pages)):
-                page = pdf_reader.pages[page_num]
-                text += page.extract_text() + "\n"
-            
-            # Clean up text
-            text = text.strip()
+            pages, engine, word_count, cached = extraction_cache.extract(source, requested_engine, engine_names)
+            text = join_pages(pages)
             
             if not text:
-                return jsonify({"error": "No text could be extracted from the PDF. The PDF might be image-based or corrupted."}), 400
-            
-            # Count words
-            word_count = len(text.split())
+                return jsonify({"error": EMPTY_PDF_ERROR}), 400
             
+            # Kept server-side so summarize/generate calls can send the id instead of the text
+            document_id = _keep_document(
+                lambda: documents.store(g.user_id, text, file.filename, engine, len(pages), word_count)
+            )
             return jsonify({
                 "success": True,
                 "text": text,
                 "wordCount": word_count,
-                "pageCount": len(pdf_reader.pages),
-                "filename": file.filename
+                "pageCount": len(pages),
+                "filename": file.filename,
+                "engine": engine,
+                "cached": cached,
+                "documentId": document_id
             }), 200
             
         except Exception as e:
@@ -90,15 +93,106 @@ def extract_pdf_text():
     except Exception as e:
         return jsonify({"error": f"PDF processing failed: {str(e)}"}), 500
 
+def _keep_document(save):
+    """Run a document store call; returns the new document's id, or None if it was not kept"""
+    try:
+        document = save()
+    except SQLAlchemyError:
+        db.session.rollback()
+        current_app.logger.warning("Could not store extracted document", exc_info=True)
+        return None
+    return document.id if document is not None else None
+
+def _ndjson(record):
+    return current_app.json.dumps(record) + "\n"
+
+@pdf_bp.route("/pdf/extract/stream", methods=["POST"])
+def extract_pdf_text_stream():
+    """Extract text from an uploaded PDF as newline-delimited JSON, one record per page"""
+    try:
+        file, requested_engine, engine_names, error_response = _get_pdf_upload()
+        if error_response:
+            return error_response
+
+        source, spooled = detach_upload(file)
+        digest = extraction_cache.digest(source)
+        cached = extraction_cache.get(digest, engine_names)
+
+        if cached:
+            engine, page_count = cached['engine'], cached['pageCount']
+            pages = iter(cached['pages'])
+        else:
+            try:
+                pdf_engine, page_count = open_engine(source, requested_engine)
+            except Exception as e:
+                if spooled:
+                    spooled.close()
+                return jsonify({"error": f"Failed to extract text from PDF: {str(e)}"}), 400
+            engine = pdf_engine.name
+            pages = iter_pages(pdf_engine, source, page_count)
+
+        filename = file.filename
+
+        def records():
+            cache_writer = None if cached else extraction_cache.writer(digest, engine_names)
+            committed = False
+            document_writer = documents.DocumentWriter()
+            word_count = 0
+            try:
+                try:
+                    for index, text in enumerate(pages):
+                        page_words = len(text.split())
+                        word_count += page_words
+                        if cache_writer:
+                            cache_writer.add_page(text)
+                        document_writer.add_page(text)
+                        yield _ndjson({"type": "page", "page": index + 1, "text": text, "wordCount": page_words})
+                except Exception as e:
+                    yield _ndjson({"type": "error", "error": f"Failed to extract text from PDF: {str(e)}"})
+                    return
+
+                if not word_count:
+                    # Not cached: /pdf/extract shares the entry and would skip the "auto" fallback
+                    yield _ndjson({"type": "error", "error": EMPTY_PDF_ERROR})
+                    return
+
+                if cache_writer:
+                    cache_writer.commit(engine, page_count, word_count)
+                    committed = True
+
+                document_id = _keep_document(
+                    lambda: document_writer.save(g.user_id, filename, engine, page_count, word_count)
+                )
+                yield _ndjson({
+                    "type": "summary",
+                    "success": True,
+                    "wordCount": word_count,
+                    "pageCount": page_count,
+                    "filename": filename,
+                    "engine": engine,
+                    "cached": cached is not None,
+                    "documentId": document_id
+                })
+            finally:
+                # Also reached through GeneratorExit when the client disconnects mid-stream
+                if cache_writer and not committed:
+                    cache_writer.abort()
+                if spooled:
+                    spooled.close()
+
+        return Response(
+            stream_with_context(records()),
+            mimetype="application/x-ndjson",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+
+    except Exception as e:
+        return jsonify({"error": f"PDF processing failed: {str(e)}"}), 500
+
 @pdf_bp.route("/pdf/summarize", methods=["POST"])
 def summarize_pdf():
     """Summarize PDF text using AI"""
     try:
-        # Verify authentication
-        user_id, error_response, status_code = verify_token()
-        if error_response:
-            return error_response, status_code
-
         data = request.get_json()
         if not data:
             return jsonify({"error": "No data provided"}), 400
@@ -110,45 +204,103 @@ def summarize_pdf():
         provider = data.get('provider')
         options = data.get('options', {})
 
-        if not all([text, model, api_key, provider]):
+        # ``documentId`` (from /pdf/extract) can stand in for ``text``
+        if not all([text or data.get('documentId'), model, api_key, provider]):
             return jsonify({"error": "Missing required parameters"}), 400
 
         # Import AI routes to use the API calling functions
         from . import ai_routes
         
-        # Prepare the full prompt
-        full_prompt = f"{prompt}\n\nDocument Text:\n{text}"
-        
-        # Route to appropriate provider
-        if provider == 'openai':
-            result = ai_routes.call_openai_api(model, full_prompt, api_key, options)
-        elif provider == 'google':
-            result = ai_routes.call_google_api(model, full_prompt, api_key, options)
-        elif provider == 'perplexity':
-            result = ai_routes.call_perplexity_api(model, full_prompt, api_key, options)
-        else:
+        if provider not in ai_routes.PROVIDER_FUNCTIONS:
             return jsonify({"error": "Unsupported provider"}), 400
 
-        if result.get('error'):
-            return jsonify({"error": result['error']}), 400
+        document, error_response = documents.resolve_document(data, g.user_id)
+        if error_response:
+            return error_response
+
+        # Large documents can be summarized in the background instead (see /api/jobs)
+        if data.get('async'):
+            body, status = submit_summary_job(g.user_id, data, document=document)
+            return jsonify(body), status
 
-        return jsonify({
-            "success": True,
-            "summary": result.get('content', ''),
-            "model": model,
-            "provider": provider,
-            "wordCount": len(text.split()),
-            "summaryWordCount": len(result.get('content', '').split())
-        }), 200
+        if document is not None:
+            text = documents.text_of(document)
+
+        body, status = summarize_text(text, prompt, model, api_key, provider, options)
+        return jsonify(body), status
 
     except Exception as e:
         return jsonify({"error": f"Summarization failed: {str(e)}"}), 500
 
+def summarize_text(text, prompt, model, api_key, provider, options, on_progress=None):
+    """Summarize document text; returns the ``(body, status)`` of a /pdf/summarize response.
+
+    ``on_progress(stage, completed, total)`` is how background jobs report
+    progress (see jobs.run_summarize); the synchronous route has no use for it.
+    """
+    from . import ai_routes
+
+    # Long documents are summarized chunk by chunk (sized to the model's
+    # token budget), then the parts are combined
+    result = summarize_document(
+        text, prompt,
+        lambda stage_prompt: ai_routes.call_provider(provider, model, stage_prompt, api_key, options),
+        on_progress=on_progress,
+        chunk_tokens=tokens.chunk_budget(provider, model, options, prompt),
+        estimate=lambda chunk: tokens.estimate_tokens(chunk, provider, model)
+    )
+
+    if result.get('error'):
+        return {"error": result['error'], "tokens": result['tokens']}, ai_routes.error_status(result)
+
+    return {
+        "success": True,
+        "summary": result.get('content', ''),
+        "model": model,
+        "provider": provider,
+        "wordCount": len(text.split()),
+        "summaryWordCount": len(result.get('content', '').split()),
+        "cached": result['cached'],
+        "chunks": result['chunks'],
+        "stages": result['stages'],
+        "tokens": result['tokens']
+    }, 200
+
+def submit_summary_job(user_id, data, upload=None, engine=None, document=None):
+    """Queue a background summarization of ``data['text']``, a stored document or an uploaded PDF"""
+    from . import jobs
+
+    text = data.get('text') or ''
+    payload = {
+        "prompt": data.get('prompt') or 'Summarize this document:',
+        "model": data.get('model'),
+        "apiKey": data.get('apiKey'),
+        "provider": data.get('provider'),
+        "options": data.get('options') or {},
+        "engine": engine
+    }
+    if document is not None:
+        # The worker reads the stored text; the job never holds a copy
+        payload["documentId"] = document.id
+        size = document.text_bytes
+    elif upload is not None:
+        size = upload_size(upload)
+    else:
+        payload["text"] = text
+        size = len(text.encode('utf-8'))
+    try:
+        job = jobs.submit(user_id, 'summarize', payload, size, upload)
+    except jobs.QueueFull:
+        return {"error": "Too many jobs are waiting; try again later"}, 503
+    return {"success": True, "jobId": job.id, "status": job.status}, 202
+
 @pdf_bp.route("/pdf/health", methods=["GET"])
+@public
 def pdf_health():
     """Health check for PDF processing service"""
     return jsonify({
         "status": "ok",
         "service": "PDF Processing",
-        "features": ["text_extraction", "ai_summarization"]
+        "features": ["text_extraction", "ai_summarization"],
+        "engines": available_engines()
     })
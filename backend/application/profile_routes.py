@@ -0,0 +1,45 @@
+from flask import Blueprint, Response, jsonify, send_file
+from .auth import public
+from . import profiling
+
+profile_bp = Blueprint("profiles", __name__)
+
+# Profiles describe other users' requests, so every route here takes the
+# admin token (X-Profile-Token) instead of a user token
+
+@profile_bp.route("/profiles", methods=["GET"])
+@public
+def list_profiles():
+    """Stored request profiles, newest first"""
+    denied = profiling.require_admin()
+    if denied:
+        return denied
+    return jsonify({"profiles": profiling.list_profiles()}), 200
+
+@profile_bp.route("/profiles/<profile_id>", methods=["GET"])
+@public
+def get_profile(profile_id):
+    """Metadata and time split of one profile"""
+    denied = profiling.require_admin()
+    if denied:
+        return denied
+    meta = profiling.load_profile(profile_id)
+    if meta is None:
+        return jsonify({"error": "Profile not found"}), 404
+    return jsonify(meta), 200
+
+@profile_bp.route("/profiles/<profile_id>/<fmt>", methods=["GET"])
+@public
+def download_profile(profile_id, fmt):
+    """``collapsed`` stacks (flamegraph.pl / speedscope input) or a cProfile ``pstats`` dump"""
+    denied = profiling.require_admin()
+    if denied:
+        return denied
+    path = profiling.profile_file(profile_id, fmt)
+    if path is None:
+        return jsonify({"error": "Profile not found"}), 404
+    if fmt == 'collapsed':
+        with open(path) as f:
+            return Response(f.read(), mimetype='text/plain')
+    return send_file(path, mimetype='application/octet-stream', as_attachment=True,
+                     download_name=f"{profile_id}.pstats")
@@ -0,0 +1,278 @@
+"""On-demand profiles of single live requests.
+
+A request is profiled when it carries ``X-Profile-Token: <PROFILE_ADMIN_TOKEN>``
+or, on PROFILE_PATHS, with probability PROFILE_SAMPLE_RATE. A sampling thread
+records the request thread's stack every PROFILE_SAMPLE_INTERVAL seconds
+(collapsed stacks, plus the split between PDF parsing, JSON encoding and
+decoding, waiting on providers and other work); in "cprofile" mode a
+cProfile of the thread is kept as well. Only one request is profiled at a
+time, and the newest PROFILE_MAX_PROFILES profiles are kept on disk.
+
+Work handed to pools (map-reduce summaries, hedges, the PDF process pool)
+shows up as time the request thread spends waiting for it. Under the ASGI
+app, routes served on the event loop are handed to Flask when the header
+asks for a profile, and are never picked by PROFILE_SAMPLE_RATE.
+"""
+import cProfile
+import hmac
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+
+from flask import current_app, g, jsonify, request
+
+PROFILE_ID = re.compile(r'^\d{13}-[0-9a-f]{8}$')
+
+# Matched against frame file paths from the innermost frame outwards; the first hit decides
+_CATEGORY_PATTERNS = (
+    ("pdf_parsing", re.compile(r"[/\\](fitz|pymupdf|PyPDF2|pypdf|pdfminer|pdfplumber|pypdfium2)[/\\]")),
+    ("json", re.compile(r"[/\\](json|orjson)[/\\]")),
+    ("provider_wait", re.compile(r"[/\\](httpx|httpcore|h2|h11|anyio)[/\\]|[/\\](ssl|socket|selectors)\.py$")),
+)
+# Application modules a thread or process pool wait is charged to
+_WAIT_OWNERS = (
+    ("pdf_parsing", re.compile(r"application[/\\](pdf_engines|pdf_extraction|extraction_cache)\.py$")),
+    ("provider_wait", re.compile(r"application[/\\](summarizer|routing|ai_routes|call_policy|singleflight)\.py$")),
+)
+_POOL_WAIT = re.compile(r"[/\\](concurrent[/\\]futures|threading\.py$|multiprocessing[/\\])")
+_APPLICATION = re.compile(r"application[/\\]")
+_SHORTEN = re.compile(r"^.*?[/\\](?:site-packages|lib[/\\]python\d+\.\d+)[/\\]|^.*[/\\](?=application[/\\])")
+
+# Profiling is intrusive enough that one request at a time is plenty
+_slot = threading.BoundedSemaphore(1)
+_store_lock = threading.Lock()
+
+
+def _classify(frames):
+    """Category of one sample; ``frames`` are (filename, function) pairs, innermost first"""
+    waiting = False
+    for filename, _ in frames:
+        for category, pattern in _CATEGORY_PATTERNS:
+            if pattern.search(filename):
+                return category
+        if _POOL_WAIT.search(filename):
+            waiting = True
+        elif waiting and _APPLICATION.search(filename):
+            for category, pattern in _WAIT_OWNERS:
+                if pattern.search(filename):
+                    return category
+            return "other"
+    return "other"
+
+
+def _frame_label(filename, function):
+    # Short flamegraph labels: "json/encoder.py:encode", "application/routes.py:login"
+    return f"{_SHORTEN.sub('', filename)}:{function}".replace(";", ",").replace(" ", "_")
+
+
+class StackSampler(threading.Thread):
+    """Samples one thread's stack at a fixed interval until stopped"""
+
+    def __init__(self, thread_id, interval):
+        super().__init__(name="profile-sampler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.categories = Counter()
+        self.samples = 0
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            frames = []
+            while frame is not None:
+                frames.append((frame.f_code.co_filename, frame.f_code.co_name))
+                frame = frame.f_back
+            if not frames:
+                continue
+            self.samples += 1
+            self.stacks[";".join(_frame_label(*entry) for entry in reversed(frames))] += 1
+            self.categories[_classify(frames)] += 1
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+
+def _profile_dir():
+    return current_app.config['PROFILE_DIR'] or os.path.join(current_app.instance_path, 'profiles')
+
+
+def _path(profile_id, extension):
+    return os.path.join(_profile_dir(), f"{profile_id}.{extension}")
+
+
+def _should_profile():
+    """'header' or 'sample' when this request should be profiled, else None"""
+    if is_admin():
+        return 'header'
+    config = current_app.config
+    rate = config['PROFILE_SAMPLE_RATE']
+    if rate > 0 and request.path.startswith(config['PROFILE_PATHS']) and random.random() < rate:
+        return 'sample'
+    return None
+
+
+def _start():
+    trigger = _should_profile()
+    if trigger is None or not _slot.acquire(blocking=False):
+        return
+    config = current_app.config
+    mode = config['PROFILE_MODE']
+    if trigger == 'header':
+        mode = request.headers.get('X-Profile-Mode', mode)
+    profiler = None
+    try:
+        if mode == 'cprofile':
+            profiler = cProfile.Profile()
+            profiler.enable()
+        sampler = StackSampler(threading.get_ident(), config['PROFILE_SAMPLE_INTERVAL'])
+        sampler.start()
+    except Exception:
+        if profiler is not None:
+            profiler.disable()
+        _slot.release()
+        current_app.logger.warning("Could not start request profiler", exc_info=True)
+        return
+    g.profile = {
+        "id": f"{int(time.time() * 1000):013d}-{uuid.uuid4().hex[:8]}",
+        "trigger": trigger,
+        "mode": 'cprofile' if profiler is not None else 'sampling',
+        "started": time.perf_counter(),
+        "startedAt": datetime.now(timezone.utc).isoformat(),
+        "profiler": profiler,
+        "sampler": sampler,
+    }
+
+
+def _tag_response(response):
+    profile = g.get('profile')
+    if profile is not None:
+        profile["status"] = response.status_code
+        response.headers['X-Profile-Id'] = profile["id"]
+    return response
+
+
+def _finish(error):
+    # Runs after a streamed body has been sent, so streams are profiled to their last byte
+    profile = g.pop('profile', None)
+    if profile is None:
+        return
+    try:
+        if profile["profiler"] is not None:
+            profile["profiler"].disable()
+        profile["sampler"].stop()
+        _save(profile, time.perf_counter() - profile["started"], 500 if error else profile.get("status", 200))
+    except Exception:
+        current_app.logger.warning("Could not store request profile", exc_info=True)
+    finally:
+        _slot.release()
+
+
+def _save(profile, duration, status):
+    sampler = profile["sampler"]
+    interval = sampler.interval
+    split = {
+        category: {
+            "seconds": round(count * interval, 4),
+            "share": round(count / sampler.samples, 4),
+        }
+        for category, count in sampler.categories.most_common()
+    }
+    meta = {
+        "id": profile["id"],
+        "method": request.method,
+        "path": request.path,
+        "status": status,
+        "trigger": profile["trigger"],
+        "mode": profile["mode"],
+        "startedAt": profile["startedAt"],
+        "durationMs": round(duration * 1000, 2),
+        "samples": sampler.samples,
+        "intervalMs": interval * 1000,
+        "split": split,
+        "formats": ["collapsed", "pstats"] if profile["profiler"] is not None else ["collapsed"],
+    }
+    with _store_lock:
+        os.makedirs(_profile_dir(), exist_ok=True)
+        with open(_path(profile["id"], 'collapsed'), 'w') as f:
+            f.writelines(f"{stack} {count}\n" for stack, count in sampler.stacks.most_common())
+        if profile["profiler"] is not None:
+            profile["profiler"].dump_stats(_path(profile["id"], 'pstats'))
+        # Metadata last: a profile is listed only once all of its files exist
+        with open(_path(profile["id"], 'json'), 'w') as f:
+            json.dump(meta, f)
+        _trim()
+
+
+def _trim():
+    """Drop the oldest profiles beyond PROFILE_MAX_PROFILES (ids sort by start time)"""
+    ids = sorted(name[:-5] for name in os.listdir(_profile_dir()) if name.endswith('.json'))
+    for profile_id in ids[:max(0, len(ids) - current_app.config['PROFILE_MAX_PROFILES'])]:
+        for extension in ('json', 'collapsed', 'pstats'):
+            try:
+                os.remove(_path(profile_id, extension))
+            except FileNotFoundError:
+                pass
+
+
+def is_admin():
+    """True when the request carries the PROFILE_ADMIN_TOKEN in X-Profile-Token"""
+    token = current_app.config['PROFILE_ADMIN_TOKEN']
+    supplied = request.headers.get('X-Profile-Token')
+    return bool(token and supplied and hmac.compare_digest(supplied, token))
+
+
+def require_admin():
+    """The 403 response for admin-only endpoints, or None when ``is_admin()``"""
+    if is_admin():
+        return None
+    return jsonify({"error": "A valid X-Profile-Token is required"}), 403
+
+
+def list_profiles():
+    """Metadata of the stored profiles, newest first"""
+    directory = _profile_dir()
+    if not os.path.isdir(directory):
+        return []
+    profiles = []
+    for name in sorted(os.listdir(directory), reverse=True):
+        if name.endswith('.json'):
+            meta = load_profile(name[:-5])
+            if meta is not None:
+                profiles.append(meta)
+    return profiles
+
+
+def load_profile(profile_id):
+    if not PROFILE_ID.match(profile_id):
+        return None
+    try:
+        with open(_path(profile_id, 'json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def profile_file(profile_id, extension):
+    """Path of a stored profile's ``collapsed`` or ``pstats`` file, or None"""
+    if not PROFILE_ID.match(profile_id) or extension not in ('collapsed', 'pstats'):
+        return None
+    path = _path(profile_id, extension)
+    return path if os.path.exists(path) else None
+
+
+def init_profiling(app):
+    if not (app.config['PROFILE_ADMIN_TOKEN'] or app.config['PROFILE_SAMPLE_RATE'] > 0):
+        return
+    app.before_request(_start)
+    app.after_request(_tag_response)
+    app.teardown_request(_finish)
@@ -0,0 +1,108 @@
+import asyncio
+import importlib.util
+import threading
+import time
+import weakref
+from urllib.parse import urlsplit
+
+import httpx
+from flask import current_app
+
+from .metrics import PROVIDER_TTFB_SECONDS
+
+# One long-lived client (and therefore one connection pool) per provider host
+_clients = {}
+_clients_lock = threading.Lock()
+
+# Async clients are bound to the event loop that created them
+_async_clients = weakref.WeakKeyDictionary()
+
+# HTTP/2 needs the optional h2 package; fall back to HTTP/1.1 keep-alive without it
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+def _client_settings():
+    """Read pool, keep-alive and timeout settings from the Flask config"""
+    config = current_app.config
+    return {
+        "max_connections": config.get('PROVIDER_POOL_SIZE', 20),
+        "max_keepalive_connections": config.get('PROVIDER_KEEPALIVE_CONNECTIONS', 10),
+        "keepalive_expiry": config.get('PROVIDER_KEEPALIVE_EXPIRY', 60.0),
+        "timeout": config.get('PROVIDER_TIMEOUT', 20.0),
+        "connect_timeout": config.get('PROVIDER_CONNECT_TIMEOUT', 5.0),
+        "http2": config.get('PROVIDER_HTTP2', True) and HTTP2_AVAILABLE,
+    }
+
+
+def _mark_sent(request):
+    request.extensions["sent_at"] = time.perf_counter()
+
+
+def _observe_first_byte(response):
+    # Response hooks run once the headers are in, before the body is read
+    sent_at = response.request.extensions.get("sent_at")
+    if sent_at is not None:
+        PROVIDER_TTFB_SECONDS.observe(time.perf_counter() - sent_at, response.request.url.host)
+
+
+async def _amark_sent(request):
+    _mark_sent(request)
+
+
+async def _aobserve_first_byte(response):
+    _observe_first_byte(response)
+
+
+def _build_client(settings, client_class=httpx.Client):
+    limits = httpx.Limits(
+        max_connections=settings["max_connections"],
+        max_keepalive_connections=settings["max_keepalive_connections"],
+        keepalive_expiry=settings["keepalive_expiry"],
+    )
+    timeout = httpx.Timeout(settings["timeout"], connect=settings["connect_timeout"])
+    if client_class is httpx.AsyncClient:
+        event_hooks = {"request": [_amark_sent], "response": [_aobserve_first_byte]}
+    else:
+        event_hooks = {"request": [_mark_sent], "response": [_observe_first_byte]}
+    return client_class(limits=limits, timeout=timeout, http2=settings["http2"], event_hooks=event_hooks)
+
+
+def get_provider_client(url):
+    """Return the pooled client for the host serving ``url``"""
+    host = urlsplit(url).netloc
+    client = _clients.get(host)
+    if client is not None:
+        return client
+
+    with _clients_lock:
+        client = _clients.get(host)
+        if client is None:
+            client = _build_client(_client_settings())
+            _clients[host] = client
+        return client
+
+
+def close_provider_clients():
+    """Close every pooled client, e.g. on shutdown or after a config change"""
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
+
+
+def get_async_provider_client(url):
+    """Return the pooled ``httpx.AsyncClient`` for ``url``'s host on the running loop"""
+    loop_clients = _async_clients.setdefault(asyncio.get_running_loop(), {})
+    host = urlsplit(url).netloc
+    client = loop_clients.get(host)
+    if client is None:
+        client = _build_client(_client_settings(), httpx.AsyncClient)
+        loop_clients[host] = client
+    return client
+
+
+async def aclose_provider_clients():
+    """Close the async clients owned by the running loop"""
+    loop_clients = _async_clients.pop(asyncio.get_running_loop(), {})
+    for client in loop_clients.values():
+        await client.aclose()
@@ -0,0 +1,219 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app
+
+from . import db
+from .database import aware
+
+# Defaults the provider adapters apply when an option is omitted, so that
+# {} and {"maxTokens": 1000} share one cache entry
+DEFAULT_OPTIONS = {"maxTokens": 1000, "temperature": 0.7}
+
+
+class LRUCache:
+    """Thread-safe in-process LRU with per-entry TTL and a byte budget"""
+
+    def __init__(self, max_entries, max_bytes, ttl):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.total_bytes = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, size, expires_at = entry
+            if expires_at <= time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, size):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, size, time.monotonic() + self.ttl)
+            self.total_bytes += size
+            while self._entries and (
+                len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes
+            ):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self.total_bytes -= size
+
+
+class ResponseCache:
+    """Two-tier cache for provider generations: in-process LRU, then the database"""
+
+    def __init__(self, max_entries, max_bytes, ttl, persistent):
+        self.memory = LRUCache(max_entries, max_bytes, ttl)
+        self.ttl = ttl
+        self.persistent = persistent
+        self.counters = {"hits": 0, "persistentHits": 0, "misses": 0, "bypassed": 0, "stores": 0}
+        self._counter_lock = threading.Lock()
+
+    def count(self, name):
+        with self._counter_lock:
+            self.counters[name] += 1
+
+    def get(self, key):
+        content = self.memory.get(key)
+        if content is not None:
+            self.count("hits")
+            return content
+
+        if self.persistent:
+            content = self._load_persistent(key)
+            if content is not None:
+                self.memory.set(key, content, len(content.encode('utf-8')))
+                self.count("persistentHits")
+                return content
+
+        self.count("misses")
+        return None
+
+    def set(self, key, provider, model, content):
+        self.memory.set(key, content, len(content.encode('utf-8')))
+        if self.persistent:
+            self._store_persistent(key, provider, model, content)
+        self.count("stores")
+
+    def stats(self):
+        with self._counter_lock:
+            counters = dict(self.counters)
+        lookups = counters["hits"] + counters["persistentHits"] + counters["misses"]
+        hits = counters["hits"] + counters["persistentHits"]
+        return {
+            **counters,
+            "hitRate": round(hits / lookups, 4) if lookups else 0.0,
+            "entries": len(self.memory),
+            "bytes": self.memory.total_bytes,
+            "evictions": self.memory.evictions,
+            "persistent": self.persistent,
+        }
+
+    def _load_persistent(self, key):
+        from .model import CachedResponse
+        try:
+            row = db.session.get(CachedResponse, key)
+            if row is None:
+                return None
+            if aware(row.expires_at) <= datetime.now(timezone.utc):
+                db.session.delete(row)
+                db.session.commit()
+                return None
+            return row.content
+        except Exception:
+            db.session.rollback()
+            return None
+
+    def _store_persistent(self, key, provider, model, content):
+        from .model import CachedResponse
+        try:
+            now = datetime.now(timezone.utc)
+            db.session.merge(CachedResponse(
+                key=key,
+                provider=provider,
+                model=model,
+                content=content,
+                created_at=now,
+                expires_at=now + timedelta(seconds=self.ttl)
+            ))
+            db.session.commit()
+        except Exception:
+            # The persistent tier is best effort; never fail a generation over it
+            db.session.rollback()
+
+
+def init_response_cache(app):
+    app.extensions['response_cache'] = ResponseCache(
+        max_entries=app.config['AI_CACHE_MAX_ENTRIES'],
+        max_bytes=app.config['AI_CACHE_MAX_BYTES'],
+        ttl=app.config['AI_CACHE_TTL'],
+        persistent=app.config['AI_CACHE_PERSISTENT'],
+    )
+
+
+def get_response_cache():
+    return current_app.extensions['response_cache']
+
+
+def normalize_prompt(prompt):
+    """Ignore differences in line endings and trailing whitespace"""
+    lines = prompt.replace('\r\n', '\n').replace('\r', '\n').split('\n')
+    return '\n'.join(line.rstrip() for line in lines).strip()
+
+
+def cache_key(provider, model, prompt, options):
+    effective_options = {**DEFAULT_OPTIONS, **options}
+    effective_options.pop('cache', None)
+    material = json.dumps({
+        "provider": provider,
+        "model": model,
+        "prompt": normalize_prompt(prompt),
+        "options": effective_options,
+    }, sort_keys=True, default=str)
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+def is_cacheable(options):
+    """Sampled generations are only cached when the caller opts in with options.cache"""
+    if not current_app.config['AI_CACHE_ENABLED']:
+        return False
+    if 'cache' in options:
+        return bool(options['cache'])
+    try:
+        return float(options.get('temperature', DEFAULT_OPTIONS['temperature'])) <= 0
+    except (TypeError, ValueError):
+        return False
+
+
+def lookup(provider, model, prompt, options):
+    """Return ``(key, content)``; key is None when the cache is bypassed"""
+    if not is_cacheable(options):
+        get_response_cache().count("bypassed")
+        return None, None
+    key = cache_key(provider, model, prompt, options)
+    return key, get_response_cache().get(key)
+
+
+def store(key, provider, model, content):
+    if key is not None and content:
+        get_response_cache().set(key, provider, model, content)
+
+
+def cached_call(provider, model, prompt, options, call):
+    """Run ``call()`` unless an equivalent generation is already cached"""
+    key, content = lookup(provider, model, prompt, options)
+    if content is not None:
+        return {"content": content, "cached": True}
+
+    result = call()
+    # A fallback provider's answer is not cached under the requested model's key
+    if not result.get('error') and not result.get('fallback'):
+        store(key, provider, model, result.get('content', ''))
+    return result
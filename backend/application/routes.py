@@ -1,19 +1,21 @@
-from flask import Blueprint, request, jsonify
-from werkzeug.security import generate_password_hash, check_password_hash
-from jose import jwt
+import hmac
+from flask import Blueprint, Response, current_app, g, request, jsonify
+from sqlalchemy.exc import IntegrityError
 from datetime import datetime, timedelta, timezone
-import os
 from . import db
+from . import passwords
+from . import metrics
+from . import profiling
+from .database import pool_stats, read_session
+from .auth import ALGORITHM, SECRET_KEY, get_user, invalidate_user, public, user_dict
 from .model import User
 
 api_bp = Blueprint("api", __name__)
 
-# JWT Configuration
-SECRET_KEY = os.environ.get('SECRET_KEY', 'your-secret-key-here')
-ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
 def create_access_token(data: dict):
+    from jose import jwt
     to_encode = data.copy()
     expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
@@ -21,18 +23,42 @@ def create_access_token(data: dict):
     return encoded_jwt
 
 @api_bp.route("/health", methods=["GET"])
+@public
 def health_check():
     return jsonify(status="ok")
 
+@api_bp.route("/db/pool", methods=["GET"])
+@public
+def db_pool_stats():
+    """Connection pool usage of the primary and replica engines; takes the admin token (X-Profile-Token)"""
+    denied = profiling.require_admin()
+    if denied:
+        return denied
+    return jsonify(pool_stats()), 200
+
+@api_bp.route("/metrics", methods=["GET"])
+@public
+def prometheus_metrics():
+    """Metrics in the Prometheus text format, for scrapers that send the METRICS_TOKEN as a bearer token"""
+    if not current_app.config['METRICS_ENABLED']:
+        return jsonify({"error": "Metrics are disabled"}), 404
+    token = current_app.config['METRICS_TOKEN']
+    if not token:
+        return jsonify({"error": "Set METRICS_TOKEN to expose metrics"}), 403
+    if not hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {token}"):
+        return jsonify({"error": "Invalid metrics token"}), 401
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 @api_bp.route("/", methods=["GET"])
+@public
 def api_root():
     return jsonify(message="Study Karo API")
 
 @api_bp.route("/auth/register", methods=["POST"])
+@public
 def register():
     try:
         data = request.get_json()
-        print(f"Registration request data: {data}")
         
         # Validate required fields
         if not data or not all(k in data for k in ("name", "email", "password")):
@@ -46,13 +72,14 @@ def register():
         if "@" not in email or "." not in email:
             return jsonify({"error": "Invalid email format"}), 400
         
-        # Check if user already exists
-        existing_user = User.query.filter_by(email=email).first()
+        # Check if user already exists (the unique index still guards against replica lag)
+        with read_session() as session:
+            existing_user = session.query(User.id).filter_by(email=email).first()
         if existing_user:
             return jsonify({"error": "User with this email already exists"}), 409
         
         # Create new user
-        hashed_password = generate_password_hash(password)
+        hashed_password = passwords.hash_password(password)
         new_user = User(
             name=name,
             email=email,
@@ -75,15 +102,20 @@ def register():
             "token": token
         }), 201
         
+    except passwords.Overloaded:
+        return jsonify({"error": "Server is busy, please try again"}), 503, {"Retry-After": "1"}
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({"error": "User with this email already exists"}), 409
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": "Registration failed"}), 500
 
 @api_bp.route("/auth/login", methods=["POST"])
+@public
 def login():
     try:
         data = request.get_json()
-        print(f"Login request data: {data}")
         
         if not data or not all(k in data for k in ("email", "password")):
             return jsonify({"error": "Email and password are required"}), 400
@@ -94,8 +126,16 @@ def login():
         # Find user
         user = User.query.filter_by(email=email).first()
         
-        if not user or not check_password_hash(user.password, password):
+        if not user or not passwords.verify_password(user.password, password):
             return jsonify({"error": "Invalid email or password"}), 401
+
+        # Upgrade the stored hash when the configured scheme or cost has changed
+        if passwords.needs_rehash(user.password):
+            try:
+                user.password = passwords.hash_password(password)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
         
         # Generate token
         token = create_access_token(data={"sub": str(user.id), "email": email})
@@ -110,37 +150,19 @@ def login():
             "token": token
         }), 200
         
+    except passwords.Overloaded:
+        return jsonify({"error": "Server is busy, please try again"}), 503, {"Retry-After": "1"}
     except Exception as e:
         return jsonify({"error": "Login failed"}), 500
 
 @api_bp.route("/auth/me", methods=["GET"])
 def get_current_user():
     try:
-        auth_header = request.headers.get('Authorization')
-        if not auth_header or not auth_header.startswith('Bearer '):
-            return jsonify({"error": "Authorization header missing or invalid"}), 401
-        
-        token = auth_header.split(' ')[1]
-        
-        try:
-            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-            user_id = payload.get("sub")
-            if user_id is None:
-                return jsonify({"error": "Invalid token"}), 401
-        except jwt.JWTError:
-            return jsonify({"error": "Invalid token"}), 401
-        
-        user = User.query.filter_by(id=user_id).first()
+        user = get_user(g.user_id)
         if not user:
             return jsonify({"error": "User not found"}), 404
         
-        return jsonify({
-            "user": {
-                "id": user.id,
-                "name": user.name,
-                "email": user.email
-            }
-        }), 200
+        return jsonify({"user": user}), 200
         
     except Exception as e:
         return jsonify({"error": "Failed to get user info"}), 500
@@ -148,21 +170,7 @@ def get_current_user():
 @api_bp.route("/auth/profile", methods=["PUT"])
 def update_user_profile():
     try:
-        auth_header = request.headers.get('Authorization')
-        if not auth_header or not auth_header.startswith('Bearer '):
-            return jsonify({"error": "Authorization header missing or invalid"}), 401
-        
-        token = auth_header.split(' ')[1]
-        
-        try:
-            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-            user_id = payload.get("sub")
-            if user_id is None:
-                return jsonify({"error": "Invalid token"}), 401
-        except jwt.JWTError:
-            return jsonify({"error": "Invalid token"}), 401
-        
-        user = User.query.filter_by(id=user_id).first()
+        user = User.query.filter_by(id=g.user_id).first()
         if not user:
             return jsonify({"error": "User not found"}), 404
         
@@ -182,14 +190,11 @@ def update_user_profile():
             user.email = data['email'].strip().lower()
         
         db.session.commit()
+        invalidate_user(user.id)
         
         return jsonify({
             "message": "Profile updated successfully",
-            "user": {
-                "id": user.id,
-                "name": user.name,
-                "email": user.email
-            }
+            "user": user_dict(user)
         }), 200
         
     except Exception as e:
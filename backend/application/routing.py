@@ -0,0 +1,304 @@
+import asyncio
+import math
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from flask import current_app
+
+from . import tokens
+from .singleflight import key_owner
+from .metrics import PROVIDER_CALL_SECONDS, model_label
+
+# One provider/model/key combination a generation can be sent to
+Target = namedtuple('Target', ['provider', 'model', 'api_key'])
+
+# Recent successful latencies kept per provider/model for the hedge delay
+LATENCY_WINDOW = 200
+
+
+class LatencyTracker:
+    def __init__(self):
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, provider, model, seconds):
+        with self._lock:
+            self._samples.setdefault((provider, model), deque(maxlen=LATENCY_WINDOW)).append(seconds)
+
+    def percentile(self, provider, model, percentile, min_samples):
+        """Latency percentile in seconds, or None until ``min_samples`` calls have succeeded"""
+        with self._lock:
+            samples = sorted(self._samples.get((provider, model), ()))
+        if not samples or len(samples) < min_samples:
+            return None
+        return samples[min(len(samples) - 1, math.ceil(len(samples) * percentile / 100) - 1)]
+
+    def stats(self):
+        with self._lock:
+            counts = {key: len(samples) for key, samples in self._samples.items()}
+        return {
+            f"{provider}/{model}": {
+                "samples": count,
+                "p50": self.percentile(provider, model, 50, 1),
+                "p95": self.percentile(provider, model, 95, 1),
+            }
+            for (provider, model), count in counts.items()
+        }
+
+
+class CircuitBreaker:
+    """Per provider and API key breaker, so one throttled or revoked key cannot
+    trip the circuit for everyone else on that provider: closed -> open after consecutive transient failures ->
+    half-open after AI_CIRCUIT_RESET seconds, letting one probe call through
+    (another one if the probe has not reported back within the same period)"""
+
+    def __init__(self):
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_started = None
+        self._lock = threading.Lock()
+
+    def allow(self, reset_seconds):
+        with self._lock:
+            now = time.monotonic()
+            if self.state == 'open':
+                if now - self.opened_at < reset_seconds:
+                    return False
+                self.state = 'half-open'
+                self.probe_started = None
+            if self.state == 'half-open':
+                if self.probe_started is not None and now - self.probe_started < reset_seconds:
+                    return False
+                self.probe_started = now
+            return True
+
+    def record(self, transient_failure, threshold):
+        with self._lock:
+            self.probe_started = None
+            if not transient_failure:
+                # Any answer from the provider, even a 4xx, shows it is reachable
+                self.state = 'closed'
+                self.failures = 0
+                return
+            self.failures += 1
+            if self.state == 'half-open' or self.failures >= threshold:
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+
+    def stats(self):
+        with self._lock:
+            return {"state": self.state, "failures": self.failures}
+
+
+latencies = LatencyTracker()
+_breakers = {}
+_breakers_lock = threading.Lock()
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def breaker(target):
+    key = (target.provider, key_owner(target.api_key))
+    with _breakers_lock:
+        return _breakers.setdefault(key, CircuitBreaker())
+
+
+def stats():
+    with _breakers_lock:
+        circuits = list(_breakers.items())
+    # Keys show up only as a short digest prefix
+    return {
+        "circuits": {f"{provider}:{digest[:12]}": circuit.stats() for (provider, digest), circuit in circuits},
+        "latency": latencies.stats(),
+    }
+
+
+def hedge_delay(target):
+    """Seconds to wait on ``target`` before hedging: its observed AI_HEDGE_PERCENTILE
+    latency, or AI_HEDGE_DEFAULT_DELAY until there are enough samples"""
+    config = current_app.config
+    observed = latencies.percentile(
+        target.provider, target.model, config['AI_HEDGE_PERCENTILE'], config['AI_HEDGE_MIN_SAMPLES']
+    )
+    if observed is None:
+        return config['AI_HEDGE_DEFAULT_DELAY']
+    return max(config['AI_HEDGE_MIN_DELAY'], observed)
+
+
+def _record(target, result, started):
+    elapsed = time.perf_counter() - started
+    transient = bool(result.get('error') and result.get('transient'))
+    breaker(target).record(transient, current_app.config['AI_CIRCUIT_FAILURES'])
+    PROVIDER_CALL_SECONDS.observe(
+        elapsed, target.provider, model_label(target.provider, target.model), 'error' if result.get('error') else 'success'
+    )
+    if not result.get('error'):
+        latencies.record(target.provider, target.model, elapsed)
+
+
+def _candidates(primary, fallback, prompt, options):
+    """Targets worth trying, in order: the primary, then the fallback if it is within its token budget"""
+    candidates = [primary]
+    if fallback is not None and not tokens.check_request(fallback.provider, fallback.model, prompt, options)[1]:
+        candidates.append(fallback)
+    return candidates
+
+
+def _admit(queue):
+    """Pop targets off ``queue`` until one whose circuit lets a call through; None if none does.
+
+    Only called right before dispatching, so a half-open circuit's probe slot
+    is never taken by a target that ends up not being called.
+    """
+    reset_seconds = current_app.config['AI_CIRCUIT_RESET']
+    while queue:
+        target = queue.pop(0)
+        if breaker(target).allow(reset_seconds):
+            return target
+    return None
+
+
+def _served(result, target, primary, hedged):
+    result = dict(result)
+    if target != primary:
+        result.update({"provider": target.provider, "model": target.model, "fallback": True})
+    if hedged:
+        result["hedged"] = True
+    return result
+
+
+def _circuit_open(primary):
+    return {
+        "error": f"{primary.provider} is temporarily unavailable after repeated failures",
+        "transient": True,
+        "circuitOpen": True
+    }
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=current_app.config['AI_HEDGE_WORKERS'], thread_name_prefix='hedge'
+            )
+        return _executor
+
+
+def call(primary, prompt, options, functions, fallback=None, hedge=False):
+    """Send a generation to ``primary`` with optional hedging and failover.
+
+    Without ``hedge`` or ``fallback`` this is a plain timed call. Otherwise
+    providers with an open circuit are skipped, an error from one target
+    moves on to the next, and with ``hedge`` a second request (to the
+    fallback, or to the primary again) is started once the first has run
+    past ``hedge_delay``. The first successful answer wins. The losing call
+    cannot be interrupted mid-request on a worker thread; its result is
+    discarded when it completes.
+    """
+    def attempt(target):
+        started = time.perf_counter()
+        result = functions[target.provider](target.model, prompt, target.api_key, options)
+        _record(target, result, started)
+        return target, result
+
+    if not hedge and fallback is None:
+        return attempt(primary)[1]
+
+    queue = _candidates(primary, fallback, prompt, options)
+    first = _admit(queue)
+    if first is None:
+        return _circuit_open(primary)
+
+    if not hedge:
+        target = first
+        while target is not None:
+            served, result = attempt(target)
+            if not result.get('error'):
+                break
+            target = _admit(queue)
+        return _served(result, served, primary, False)
+
+    app = current_app._get_current_object()
+
+    def run(target):
+        with app.app_context():
+            return attempt(target)
+
+    executor = _get_executor()
+    # The hedge goes to the fallback, or to the first target again when there is none left
+    queued = queue or [first]
+    pending = {executor.submit(run, first)}
+    delay = hedge_delay(first)
+    hedged = False
+    last = None
+    while pending:
+        done, pending = wait(pending, timeout=delay if queued else None, return_when=FIRST_COMPLETED)
+        for future in done:
+            target, result = future.result()
+            if not result.get('error'):
+                for loser in pending:
+                    loser.cancel()
+                return _served(result, target, primary, hedged)
+            last = (target, result)
+        # Hedge when the first call is slow, or fail over as soon as it errors
+        if queued and (not done or not pending):
+            target = _admit(queued)
+            if target is not None:
+                pending.add(executor.submit(run, target))
+                hedged = True
+    return _served(last[1], last[0], primary, hedged)
+
+
+async def acall(primary, prompt, options, functions, fallback=None, hedge=False):
+    """Asyncio counterpart of ``call``; the losing request is cancelled outright"""
+    async def attempt(target):
+        started = time.perf_counter()
+        result = await functions[target.provider](target.model, prompt, target.api_key, options)
+        _record(target, result, started)
+        return target, result
+
+    if not hedge and fallback is None:
+        return (await attempt(primary))[1]
+
+    queue = _candidates(primary, fallback, prompt, options)
+    first = _admit(queue)
+    if first is None:
+        return _circuit_open(primary)
+
+    if not hedge:
+        target = first
+        while target is not None:
+            served, result = await attempt(target)
+            if not result.get('error'):
+                break
+            target = _admit(queue)
+        return _served(result, served, primary, False)
+
+    queued = queue or [first]
+    pending = {asyncio.ensure_future(attempt(first))}
+    delay = hedge_delay(first)
+    hedged = False
+    last = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, timeout=delay if queued else None, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                target, result = task.result()
+                if not result.get('error'):
+                    return _served(result, target, primary, hedged)
+                last = (target, result)
+            if queued and (not done or not pending):
+                target = _admit(queued)
+                if target is not None:
+                    pending.add(asyncio.ensure_future(attempt(target)))
+                    hedged = True
+    finally:
+        for task in pending:
+            task.cancel()
+    return _served(last[1], last[0], primary, hedged)
@@ -0,0 +1,245 @@
+import asyncio
+import hashlib
+import json
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+
+from . import db
+from .database import aware
+
+TIMEOUT_ERROR = "Timed out waiting for an identical in-flight request"
+CANCELLED_ERROR = "The identical in-flight request was cancelled before it completed"
+
+
+def key_owner(api_key):
+    """Digest of the caller's API key; raw keys are never stored or compared"""
+    return hashlib.sha256(api_key.encode('utf-8')).hexdigest()
+
+
+def flight_key(key, owner):
+    """Flights are per API key: a follower never receives a result paid for (or refused) under another key"""
+    return hashlib.sha256(f"{key}:{owner}".encode('utf-8')).hexdigest()
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.exception = None
+
+
+class SingleFlight:
+    """Coalesce identical concurrent calls made from threads of this process.
+
+    The first caller for a key (the leader) runs the call; callers arriving
+    while it is in flight wait for its outcome. A leader exception is
+    re-raised in every waiter.
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.counters = {"leaders": 0, "followers": 0, "timeouts": 0}
+
+    def do(self, key, call, timeout):
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._flights[key] = flight
+            self.counters["leaders" if leader else "followers"] += 1
+
+        if leader:
+            try:
+                flight.result = call()
+                return flight.result
+            except BaseException as e:
+                flight.exception = e
+                raise
+            finally:
+                with self._lock:
+                    self._flights.pop(key, None)
+                flight.done.set()
+
+        if not flight.done.wait(timeout):
+            with self._lock:
+                self.counters["timeouts"] += 1
+            return {"error": TIMEOUT_ERROR}
+        if flight.exception is not None:
+            raise flight.exception
+        return {**flight.result, "coalesced": True}
+
+
+class AsyncSingleFlight:
+    """Event-loop counterpart of SingleFlight for the ASGI routes.
+
+    A leader cancelled mid-call (its client disconnected) resolves the flight
+    with an error result instead of propagating the cancellation to waiters.
+    """
+
+    def __init__(self):
+        self._flights = {}
+
+    async def do(self, key, call, timeout):
+        future = self._flights.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._flights[key] = future
+            try:
+                result = await call()
+                future.set_result(result)
+                return result
+            except asyncio.CancelledError:
+                # The leader's client went away; its followers still get an answer
+                future.set_result({"error": CANCELLED_ERROR})
+                raise
+            except BaseException as e:
+                future.set_exception(e)
+                # Mark retrieved so a leader failure with no waiters is not logged
+                future.exception()
+                raise
+            finally:
+                self._flights.pop(key, None)
+
+        try:
+            result = await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            return {"error": TIMEOUT_ERROR}
+        return {**result, "coalesced": True}
+
+
+class DatabaseSingleFlight:
+    """Cross-process coalescing through the inflight_generations table.
+
+    The leader is whoever inserts the row for a key; other processes poll it
+    until the leader records an outcome. Rows from a crashed leader expire
+    and are taken over. Finished rows linger briefly so waiters polling at
+    AI_SINGLEFLIGHT_POLL still find the outcome.
+    """
+
+    def __init__(self):
+        self.identity = f"{socket.gethostname()}:{os.getpid()}"
+
+    def do(self, key, owner, call, timeout):
+        deadline = time.monotonic() + timeout
+        poll = current_app.config['AI_SINGLEFLIGHT_POLL']
+
+        while True:
+            if self._claim(key, owner, timeout):
+                return self._lead(key, call, poll)
+
+            row = self._wait(key, deadline, poll)
+            if row is None:
+                # The leader's row vanished or expired; try to take over
+                if time.monotonic() >= deadline:
+                    return {"error": TIMEOUT_ERROR}
+                time.sleep(poll)
+                continue
+            if row.status == 'running':
+                return {"error": TIMEOUT_ERROR}
+
+            result = json.loads(row.result)
+            if row.status == 'raised':
+                raise RuntimeError(result['error'])
+            return {**result, "coalesced": True}
+
+    def _claim(self, key, owner, timeout):
+        from .model import InflightGeneration
+
+        now = datetime.now(timezone.utc)
+        try:
+            # Also clears rows left by crashed leaders and finished flights
+            InflightGeneration.query.filter(
+                InflightGeneration.expires_at < now
+            ).delete(synchronize_session=False)
+            db.session.add(InflightGeneration(
+                key=key,
+                owner=owner,
+                leader=self.identity,
+                status='running',
+                created_at=now,
+                expires_at=now + timedelta(seconds=timeout)
+            ))
+            db.session.commit()
+            return True
+        except IntegrityError:
+            db.session.rollback()
+            return False
+
+    def _lead(self, key, call, poll):
+        from .model import InflightGeneration
+
+        status = 'done'
+        try:
+            result = call()
+            outcome = result
+            return result
+        except Exception as e:
+            status = 'raised'
+            outcome = {"error": str(e)}
+            raise
+        finally:
+            try:
+                db.session.rollback()
+                row = db.session.get(InflightGeneration, key)
+                if row is not None:
+                    row.status = status
+                    row.result = json.dumps(outcome)
+                    row.expires_at = datetime.now(timezone.utc) + timedelta(seconds=max(1.0, 4 * poll))
+                    db.session.commit()
+            except Exception:
+                db.session.rollback()
+
+    def _wait(self, key, deadline, poll):
+        from .model import InflightGeneration
+
+        while True:
+            db.session.rollback()
+            row = db.session.get(InflightGeneration, key)
+            if row is None or aware(row.expires_at) < datetime.now(timezone.utc):
+                return None
+            if row.status != 'running' or time.monotonic() >= deadline:
+                return row
+            time.sleep(poll)
+
+
+_local = SingleFlight()
+_database = DatabaseSingleFlight()
+
+
+def coalesce(key, api_key, call):
+    """Run ``call()`` once for concurrent identical requests (AI_SINGLEFLIGHT mode)"""
+    mode = current_app.config['AI_SINGLEFLIGHT']
+    if mode == 'off':
+        return call()
+    timeout = current_app.config['AI_SINGLEFLIGHT_WAIT']
+    owner = key_owner(api_key)
+    key = flight_key(key, owner)
+    if mode == 'database':
+        # Threads of this process coalesce locally first; only leaders touch the table
+        return _local.do(key, lambda: _database.do(key, owner, call, timeout), timeout)
+    return _local.do(key, call, timeout)
+
+
+_async_flights = {}
+
+
+async def acoalesce(key, api_key, call):
+    """Asyncio counterpart of ``coalesce`` (in-process, per event loop)"""
+    if current_app.config['AI_SINGLEFLIGHT'] == 'off':
+        return await call()
+    flights = _async_flights.setdefault(asyncio.get_running_loop(), AsyncSingleFlight())
+    return await flights.do(flight_key(key, key_owner(api_key)), call, current_app.config['AI_SINGLEFLIGHT_WAIT'])
+
+
+def stats():
+    """Leader/follower/timeout counters of the in-process coalescer"""
+    with _local._lock:
+        return dict(_local.counters)
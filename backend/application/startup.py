@@ -0,0 +1,38 @@
+"""Hooks for pre-forking servers; gunicorn.conf.py calls them around the fork.
+
+create_app defers heavy imports and opens no connections of its own, so a
+worker that boots on its own starts fast. Under ``--preload`` the master
+imports those modules once instead, and the forked workers share the pages.
+"""
+import importlib
+
+from . import db
+
+
+def preload(app):
+    """Import what create_app leaves for first use: the JWT backend and the PDF engine"""
+    importlib.import_module('jose.jwt')
+    with app.app_context():
+        from .pdf_engines import ENGINES
+        from .pdf_extraction import resolve_engines
+        try:
+            engine = resolve_engines()[0]
+        except ValueError:
+            return
+        importlib.import_module(ENGINES[engine].module)
+
+
+def after_fork(app):
+    """Forget pooled database connections inherited from the master (it may have
+    opened some for create_all); closing them here would close them for the
+    master too, so each worker just opens its own. Then recover background jobs."""
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+    start_jobs(app)
+
+
+def start_jobs(app):
+    """Requeue jobs left by a previous run; once per worker process"""
+    from .jobs import recover_once
+    recover_once(app)
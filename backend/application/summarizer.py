@@ -0,0 +1,245 @@
+import asyncio
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+
+from .tokens import estimate_tokens
+
+# Separators tried in order when a piece of text is too large for one chunk
+SPLIT_PATTERNS = [r'\n\s*\n', r'\n', r' ']
+
+
+def split_text(text, max_tokens, estimate=estimate_tokens):
+    """Split ``text`` into chunks of at most ``max_tokens``, preferring paragraph,
+    then line, then word boundaries"""
+    chunks = []
+    current = []
+    current_tokens = 0
+    for piece in _pieces(text, max_tokens, 0, estimate):
+        # Count the joining newline too, so the packed chunk never exceeds the limit
+        piece_tokens = estimate(piece + "\n")
+        if current and current_tokens + piece_tokens > max_tokens:
+            chunks.append("\n".join(current))
+            current, current_tokens = [], 0
+        current.append(piece)
+        current_tokens += piece_tokens
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+def _pieces(text, max_tokens, level, estimate):
+    for piece in re.split(SPLIT_PATTERNS[level], text):
+        piece = piece.strip()
+        if not piece:
+            continue
+        if estimate(piece) <= max_tokens or level == len(SPLIT_PATTERNS) - 1:
+            yield piece
+        else:
+            yield from _pieces(piece, max_tokens, level + 1, estimate)
+
+
+def single_prompt(prompt, text):
+    return f"{prompt}\n\nDocument Text:\n{text}"
+
+
+def map_prompt(prompt, chunk, index, total):
+    return (
+        f"{prompt}\n\nThis is part {index} of {total} of a longer document. "
+        "Summarize this part on its own, keeping key facts, definitions and figures.\n\n"
+        f"Document Text:\n{chunk}"
+    )
+
+
+def reduce_prompt(prompt, summaries):
+    joined = "\n\n".join(f"Part {index}:\n{summary}" for index, summary in enumerate(summaries, 1))
+    return (
+        f"{prompt}\n\nThe following are summaries of consecutive parts of one document. "
+        "Combine them into a single coherent summary.\n\n"
+        f"Part summaries:\n{joined}"
+    )
+
+
+class SummaryError(Exception):
+    """A provider call failed; ``args[0]`` is the provider error message"""
+
+    def __init__(self, result):
+        super().__init__(result['error'])
+        # Extra flags from the failed call (e.g. tooLarge) are passed through
+        self.result = {key: value for key, value in result.items() if key not in ('error', 'tokens')}
+
+
+class MapReducePlan:
+    """Stages of a chunked summarization, shared by the threaded and asyncio runners.
+
+    Text that fits in one chunk is summarized with a single call. Otherwise the
+    chunks are summarized independently (map), and the partial summaries are
+    combined (reduce), re-chunking them first while they still do not fit.
+    """
+
+    def __init__(self, text, prompt, chunk_tokens, max_depth, on_progress=None, estimate=estimate_tokens):
+        self.text = text
+        self.prompt = prompt
+        self.chunk_tokens = chunk_tokens
+        self.max_depth = max_depth
+        self.on_progress = on_progress
+        self.estimate = estimate
+        self.stages = []
+        self.chunk_count = 1
+        self.prompt_tokens = 0
+        self.calls = 0
+        self.cached_calls = 0
+
+    def report(self, stage, completed, total):
+        if self.on_progress:
+            self.on_progress(stage, completed, total)
+
+    def record_results(self, results):
+        for result in results:
+            self.calls += 1
+            self.cached_calls += bool(result.get('cached'))
+            self.prompt_tokens += (result.get('tokens') or {}).get('prompt', 0)
+
+    def outcome(self, content=None, error=None):
+        outcome = {
+            # Like /ai/generate's flag: true when no provider was actually called
+            "cached": self.calls > 0 and self.cached_calls == self.calls,
+            "chunks": self.chunk_count,
+            "stages": self.stages,
+            "tokens": {"prompt": self.prompt_tokens, "calls": self.calls}
+        }
+        if error:
+            return {"error": error.args[0], **error.result, **outcome}
+        return {"content": content, **outcome}
+
+    def finish_stage(self, stage, calls, started):
+        self.stages.append({
+            "stage": stage,
+            "calls": calls,
+            "seconds": round(time.perf_counter() - started, 3)
+        })
+
+    def first_stage(self):
+        """Prompts for the first stage, or None when one call is enough"""
+        if self.estimate(self.text) <= self.chunk_tokens:
+            return None
+        chunks = split_text(self.text, self.chunk_tokens, self.estimate)
+        self.chunk_count = len(chunks)
+        return [map_prompt(self.prompt, chunk, index, len(chunks)) for index, chunk in enumerate(chunks, 1)]
+
+    def next_stage(self, summaries, depth):
+        """Prompts for the next stage; a single prompt means the final reduce"""
+        combined = reduce_prompt(self.prompt, summaries)
+        if self.estimate(combined) <= self.chunk_tokens or depth >= self.max_depth:
+            return [combined]
+        groups = split_text("\n\n".join(summaries), self.chunk_tokens, self.estimate)
+        return [map_prompt(self.prompt, group, index, len(groups)) for index, group in enumerate(groups, 1)]
+
+
+def summarize_document(text, prompt, call, on_progress=None, chunk_tokens=None, estimate=estimate_tokens):
+    """Summarize ``text`` with ``call(prompt) -> result dict``, fanning out over threads.
+
+    At most SUMMARY_FANOUT provider calls run at once. Returns the provider
+    result dict extended with ``chunks``, per-stage ``stages`` timings and
+    the summed prompt ``tokens``.
+    """
+    config = current_app.config
+    plan = MapReducePlan(
+        text, prompt, chunk_tokens or config['SUMMARY_CHUNK_TOKENS'], config['SUMMARY_MAX_DEPTH'],
+        on_progress, estimate
+    )
+    app = current_app._get_current_object()
+
+    def run_one(stage_prompt):
+        with app.app_context():
+            return call(stage_prompt)
+
+    def run_stage(name, prompts):
+        started = time.perf_counter()
+        plan.report(name, 0, len(prompts))
+        if len(prompts) == 1:
+            results = [call(prompts[0])]
+            plan.report(name, 1, 1)
+        else:
+            with ThreadPoolExecutor(max_workers=config['SUMMARY_FANOUT']) as executor:
+                futures = [executor.submit(run_one, stage_prompt) for stage_prompt in prompts]
+                results = []
+                for future in futures:
+                    results.append(future.result())
+                    plan.report(name, len(results), len(prompts))
+                    if results[-1].get('error'):
+                        for pending in futures:
+                            pending.cancel()
+                        break
+        plan.finish_stage(name, len(prompts), started)
+        plan.record_results(results)
+        for result in results:
+            if result.get('error'):
+                raise SummaryError(result)
+        return [result.get('content', '') for result in results]
+
+    try:
+        prompts = plan.first_stage()
+        if prompts is None:
+            summaries = run_stage("summarize", [single_prompt(prompt, text)])
+        else:
+            summaries = run_stage("map", prompts)
+            depth = 1
+            while True:
+                prompts = plan.next_stage(summaries, depth)
+                final = len(prompts) == 1
+                summaries = run_stage("reduce" if final else f"map-{depth + 1}", prompts)
+                if final:
+                    break
+                depth += 1
+    except SummaryError as e:
+        return plan.outcome(error=e)
+
+    return plan.outcome(content=summaries[0])
+
+
+async def asummarize_document(text, prompt, acall, on_progress=None, chunk_tokens=None, estimate=estimate_tokens):
+    """Asyncio counterpart of ``summarize_document`` for the ASGI routes"""
+    config = current_app.config
+    plan = MapReducePlan(
+        text, prompt, chunk_tokens or config['SUMMARY_CHUNK_TOKENS'], config['SUMMARY_MAX_DEPTH'],
+        on_progress, estimate
+    )
+    semaphore = asyncio.Semaphore(config['SUMMARY_FANOUT'])
+
+    async def run_one(stage_prompt):
+        async with semaphore:
+            return await acall(stage_prompt)
+
+    async def run_stage(name, prompts):
+        started = time.perf_counter()
+        plan.report(name, 0, len(prompts))
+        results = await asyncio.gather(*[run_one(stage_prompt) for stage_prompt in prompts])
+        plan.report(name, len(prompts), len(prompts))
+        plan.finish_stage(name, len(prompts), started)
+        plan.record_results(results)
+        for result in results:
+            if result.get('error'):
+                raise SummaryError(result)
+        return [result.get('content', '') for result in results]
+
+    try:
+        prompts = plan.first_stage()
+        if prompts is None:
+            summaries = await run_stage("summarize", [single_prompt(prompt, text)])
+        else:
+            summaries = await run_stage("map", prompts)
+            depth = 1
+            while True:
+                prompts = plan.next_stage(summaries, depth)
+                final = len(prompts) == 1
+                summaries = await run_stage("reduce" if final else f"map-{depth + 1}", prompts)
+                if final:
+                    break
+                depth += 1
+    except SummaryError as e:
+        return plan.outcome(error=e)
+
+    return plan.outcome(content=summaries[0])
@@ -0,0 +1,95 @@
+import math
+
+from flask import current_app
+
+# (provider, model prefix, characters per token, context window in tokens).
+# Longest matching prefix wins; the ratios are calibrated for English prose.
+MODEL_FAMILIES = [
+    ('openai', 'gpt-3.5', 4.0, 16385),
+    ('openai', 'gpt-4-turbo', 4.0, 128000),
+    ('openai', 'gpt-4o', 4.0, 128000),
+    ('openai', 'gpt-4.1', 4.0, 1047576),
+    ('openai', 'gpt-4', 4.0, 8192),
+    ('openai', 'gpt-5', 4.0, 400000),
+    ('openai', 'o1', 4.0, 200000),
+    ('openai', 'o3', 4.0, 200000),
+    ('openai', 'o4', 4.0, 200000),
+    ('openai', '', 4.0, 128000),
+    ('google', 'gemini-1.5-pro', 4.0, 2097152),
+    ('google', 'gemini', 4.0, 1048576),
+    ('google', '', 4.0, 1048576),
+    ('perplexity', 'sonar-pro', 3.8, 200000),
+    ('perplexity', 'sonar', 3.8, 127072),
+    ('perplexity', '', 3.8, 127072),
+]
+
+DEFAULT_FAMILY = (4.0, 8192)
+
+# Most non-ASCII text (CJK, Devanagari, ...) costs close to a token per character
+NON_ASCII_TOKENS_PER_CHAR = 1.0
+
+# Chat formatting overhead providers add around every prompt
+PROMPT_OVERHEAD_TOKENS = 8
+
+
+def model_family(provider, model):
+    """Return ``(chars_per_token, context_window)`` for a provider/model"""
+    model = (model or '').lower()
+    best = None
+    for family_provider, prefix, ratio, window in MODEL_FAMILIES:
+        if family_provider == provider and model.startswith(prefix):
+            if best is None or len(prefix) > len(best[0]):
+                best = (prefix, ratio, window)
+    if best is None:
+        return DEFAULT_FAMILY
+    return best[1], best[2]
+
+
+def estimate_tokens(text, provider=None, model=None):
+    """Fast local token estimate; no tokenizer tables, linear in len(text)"""
+    ratio, _ = model_family(provider, model)
+    non_ascii = len(text) - len(text.encode('ascii', 'ignore'))
+    return math.ceil((len(text) - non_ascii) / ratio + non_ascii * NON_ASCII_TOKENS_PER_CHAR)
+
+
+def max_output_tokens(options):
+    try:
+        return int(options.get('maxTokens', 1000))
+    except (TypeError, ValueError):
+        return 1000
+
+
+def token_limit(provider, model):
+    """Configured per-request budget (TOKEN_BUDGET), capped by the model's context window"""
+    _, window = model_family(provider, model)
+    budget = current_app.config['TOKEN_BUDGET']
+    return min(window, budget) if budget else window
+
+
+def estimate_request(provider, model, prompt, options):
+    """Token estimate for one outgoing call, in the shape returned to clients"""
+    prompt_tokens = estimate_tokens(prompt, provider, model) + PROMPT_OVERHEAD_TOKENS
+    output_tokens = max_output_tokens(options)
+    return {
+        "prompt": prompt_tokens,
+        "maxOutput": output_tokens,
+        "total": prompt_tokens + output_tokens,
+        "limit": token_limit(provider, model),
+    }
+
+
+def check_request(provider, model, prompt, options):
+    """Return ``(estimate, error)``; error is set when the call would exceed the budget"""
+    estimate = estimate_request(provider, model, prompt, options)
+    if estimate["total"] > estimate["limit"]:
+        return estimate, (
+            f"Prompt is too large for {model}: about {estimate['prompt']} prompt tokens plus "
+            f"{estimate['maxOutput']} output tokens exceeds the {estimate['limit']} token budget"
+        )
+    return estimate, None
+
+
+def chunk_budget(provider, model, options, instructions=''):
+    """Largest chunk (in tokens) a summarization call can carry for this model"""
+    reserved = max_output_tokens(options) + estimate_tokens(instructions, provider, model) + 64
+    return max(256, min(current_app.config['SUMMARY_CHUNK_TOKENS'], token_limit(provider, model) - reserved))
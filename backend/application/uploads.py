@@ -0,0 +1,106 @@
+"""Request body limits and disk-spooled file uploads.
+
+Multipart bodies over MAX_CONTENT_LENGTH, and any other body (JSON text to
+summarize, for instance) over the larger MAX_JSON_LENGTH, are refused from
+the Content-Length header before any of them is read (Werkzeug enforces the
+same limit while reading bodies sent without one). Uploaded files up to UPLOAD_SPOOL_BYTES stay in
+memory; larger ones are streamed to a named temporary file that is removed
+when the request ends, and the PDF engines get its path instead of a copy
+of its bytes.
+"""
+import io
+import os
+import tempfile
+
+from flask import Request, current_app, jsonify, request
+from werkzeug.exceptions import RequestEntityTooLarge
+
+
+def body_limit(mimetype):
+    """Largest body accepted for a request of ``mimetype``"""
+    config = current_app.config
+    return config['MAX_CONTENT_LENGTH'] if mimetype == 'multipart/form-data' else config['MAX_JSON_LENGTH']
+
+
+class UploadRequest(Request):
+    @property
+    def max_content_length(self):
+        if self._max_content_length is not None or not current_app:
+            return super().max_content_length
+        return body_limit(self.mimetype)
+
+    @max_content_length.setter
+    def max_content_length(self, value):
+        self._max_content_length = value
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        spool_bytes = current_app.config['UPLOAD_SPOOL_BYTES']
+        size = content_length or total_content_length
+        if size is not None and size <= spool_bytes:
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+        return tempfile.NamedTemporaryFile('w+b', suffix='.upload', dir=current_app.config['UPLOAD_TMP_DIR'] or None)
+
+
+def _megabytes(size):
+    return f"{size / (1024 * 1024):g}MB"
+
+
+def too_large_message():
+    return f"File size must be less than {_megabytes(current_app.config['PDF_MAX_UPLOAD_BYTES'])}"
+
+
+def upload_size(file):
+    """Size of an uploaded file, without reading it"""
+    stream = file.stream
+    position = stream.tell()
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(position)
+    return size
+
+
+def upload_source(file):
+    """What to hand the PDF engines: the spooled file's path, or the bytes of a small in-memory upload"""
+    stream = file.stream
+    name = getattr(stream, 'name', None)
+    if isinstance(name, str) and os.path.isfile(name):
+        stream.flush()
+        return name
+    stream.seek(0)
+    return stream.read()
+
+
+def detach_upload(file):
+    """Like ``upload_source``, for responses streamed after the request is closed.
+
+    Returns ``(source, handle)``; the caller owns ``handle`` (the spooled
+    file, or None) and closes it, which removes the file, once it is done.
+    """
+    stream = file.stream
+    source = upload_source(file)
+    if not isinstance(source, str):
+        return source, None
+    # Werkzeug closes (and so deletes) request files when the request context is popped
+    file.stream = io.BytesIO()
+    return source, stream
+
+
+def _reject_oversized():
+    limit = request.max_content_length
+    if limit and request.content_length is not None and request.content_length > limit:
+        return _too_large(None)
+    return None
+
+
+def body_too_large_message(limit):
+    return f"Request body must be less than {_megabytes(limit)}"
+
+
+def _too_large(error):
+    return jsonify({"error": body_too_large_message(request.max_content_length)}), 413
+
+
+def init_uploads(app):
+    app.request_class = UploadRequest
+    app.before_request(_reject_oversized)
+    app.register_error_handler(RequestEntityTooLarge, _too_large)
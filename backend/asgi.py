@@ -0,0 +1,4 @@
+from application.asgi import create_asgi_app
+
+# Serve with: uvicorn asgi:app --host 0.0.0.0 --port 5001
+app = create_asgi_app()
@@ -0,0 +1,159 @@
+"""Provider-call concurrency per worker: sync Flask (WSGI) vs the ASGI entry point.
+
+Both modes send the same burst of requests against the local fake provider:
+/api/ai/generate by default, /api/ai/batch calls of several prompts
+(--route batch), or long-document /api/pdf/summarize calls (--route
+summarize); the last two fan out provider calls inside each request. The sync
+mode models N gunicorn sync workers (one request per worker at a time); the
+ASGI mode runs everything in a single event loop. --persistent-cache turns on
+the database tier of the response cache, so concurrent cache lookups within
+one request are exercised too.
+
+    python -m benchmarks.bench_asgi_concurrency --requests 200 --latency 1.0
+    python -m benchmarks.bench_asgi_concurrency --route batch --persistent-cache
+    python -m benchmarks.bench_asgi_concurrency --route summarize --persistent-cache
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.fake_provider import start_fake_provider
+
+
+def _generate_payload(index):
+    # Distinct prompts so the response cache never short-circuits a call
+    return {
+        "model": "gpt-4o-mini",
+        "prompt": f"Benchmark prompt {index}",
+        "apiKey": "benchmark-key",
+        "provider": "openai",
+        "options": {"temperature": 0.7},
+    }
+
+
+def _batch_payload(index):
+    return {
+        "model": "gpt-4o-mini",
+        "prompts": [f"Benchmark prompt {index}.{item}" for item in range(8)],
+        "apiKey": "benchmark-key",
+        "provider": "openai",
+    }
+
+
+def _summarize_payload(index):
+    # Long enough to be split into several chunks summarized concurrently
+    return {
+        "text": " ".join(f"doc{index}-word{word}" for word in range(20000)),
+        "model": "gpt-4o-mini",
+        "apiKey": "benchmark-key",
+        "provider": "openai",
+    }
+
+
+# route name -> (path, request body for request ``index``)
+ROUTES = {
+    "generate": ("/api/ai/generate", _generate_payload),
+    "batch": ("/api/ai/batch", _batch_payload),
+    "summarize": ("/api/pdf/summarize", _summarize_payload),
+}
+
+
+def run_sync(app, headers, total, workers, provider, route):
+    client = app.test_client()
+    path, payload = ROUTES[route]
+    provider.reset_stats()
+
+    def one(index):
+        return client.post(path, json=payload(index), headers=headers).status_code
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        statuses = list(pool.map(one, range(total)))
+    elapsed = time.perf_counter() - started
+    return _report("wsgi-sync", statuses, elapsed, workers, provider)
+
+
+def run_async(asgi_app, headers, total, provider, route):
+    import httpx
+
+    path, payload = ROUTES[route]
+
+    async def burst():
+        transport = httpx.ASGITransport(app=asgi_app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            responses = await asyncio.gather(*[
+                client.post(path, json=payload(index), headers=headers, timeout=None)
+                for index in range(total)
+            ])
+        return [response.status_code for response in responses]
+
+    provider.reset_stats()
+    started = time.perf_counter()
+    statuses = asyncio.run(burst())
+    elapsed = time.perf_counter() - started
+    return _report("asgi", statuses, elapsed, 1, provider)
+
+
+def _report(mode, statuses, elapsed, workers, provider):
+    return {
+        "mode": mode,
+        "workers": workers,
+        "requests": len(statuses),
+        "errors": sum(1 for status in statuses if status != 200),
+        "seconds": round(elapsed, 3),
+        "requestsPerSecond": round(len(statuses) / elapsed, 2),
+        "peakInFlightProviderCalls": provider.peak_in_flight,
+        "inFlightPerWorker": round(provider.peak_in_flight / workers, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200, help="requests per mode")
+    parser.add_argument("--sync-workers", type=int, default=4, help="simulated gunicorn sync workers")
+    parser.add_argument("--latency", type=float, default=1.0, help="fake provider latency in seconds")
+    parser.add_argument("--route", choices=sorted(ROUTES), default="generate", help="endpoint to load")
+    parser.add_argument("--persistent-cache", action="store_true", help="enable the database tier of the AI response cache")
+    parser.add_argument("--database-url", help="default: in-memory SQLite, or a temporary file with --persistent-cache")
+    args = parser.parse_args()
+
+    provider = start_fake_provider(latency=args.latency)
+    os.environ.update(provider.provider_env())
+    if args.database_url is None:
+        # In-memory SQLite is one connection shared by every thread; the persistent tier needs real ones
+        scratch = tempfile.mkdtemp(prefix="bench-asgi-")
+        args.database_url = f"sqlite:///{os.path.join(scratch, 'bench.db')}" if args.persistent_cache else "sqlite://"
+    os.environ["DATABASE_URL"] = args.database_url
+    if args.persistent_cache:
+        os.environ["AI_CACHE_PERSISTENT"] = "true"
+    os.environ.setdefault("DB_CREATE_ALL", "true")
+    os.environ.setdefault("PROVIDER_POOL_SIZE", str(args.requests))
+    os.environ.setdefault("PROVIDER_KEEPALIVE_CONNECTIONS", str(args.requests))
+
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from application import create_app
+    from application.asgi import create_asgi_app
+    from application.routes import create_access_token
+
+    app = create_app()
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': '1', 'email': 'bench@example.com'})}"}
+
+    results = [
+        run_sync(app, headers, args.requests, args.sync_workers, provider, args.route),
+        run_async(create_asgi_app(app), headers, args.requests, provider, args.route),
+    ]
+    print(json.dumps({
+        "route": args.route,
+        "persistentCache": args.persistent_cache,
+        "latency": args.latency,
+        "results": results,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+"""Throughput, latency percentiles and RSS of the main API routes under load.
+
+Starts the local fake provider (see fake_provider.py), serves the app from a
+threaded werkzeug server in this process and drives every scenario at each
+concurrency level over real HTTP connections. The JSON report is tagged with
+the git commit so runs can be compared; --baseline adds the change against an
+earlier report.
+
+    python -m benchmarks.bench_load --concurrency 1,8,32 --requests 200
+    python -m benchmarks.bench_load --scenario ai-generate --error-rate 0.05 --output after.json --baseline before.json
+
+To load an already running server (e.g. gunicorn pointed at
+``python -m benchmarks.fake_provider``), pass its address and process id;
+RSS is then the server's (master and workers), not this process's:
+
+    python -m benchmarks.bench_load --url http://127.0.0.1:5001 --server-pid 1234
+"""
+import argparse
+import contextlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import httpx
+
+from benchmarks.fake_provider import add_behavior_arguments, behavior_options, start_fake_provider
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCENARIOS = ("auth-login", "auth-me", "ai-generate", "ai-generate-stream", "pdf-extract", "pdf-summarize")
+PASSWORD = "benchmark-password"
+
+
+def _rss_bytes(pid):
+    """(current, peak) resident set size of ``pid`` from /proc; (None, None) elsewhere"""
+    values = {}
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith(("VmRSS:", "VmHWM:")):
+                    values[line.split(":")[0]] = int(line.split()[1]) * 1024
+    except OSError:
+        return None, None
+    return values.get("VmRSS"), values.get("VmHWM")
+
+
+def _process_tree(pid):
+    pids = [pid]
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as children:
+            for child in children.read().split():
+                pids.extend(_process_tree(int(child)))
+    except OSError:
+        pass
+    return pids
+
+
+def memory_mb(pids):
+    """Summed current and peak RSS, in MiB, of ``pids`` and all their children"""
+    current = peak = 0
+    for pid in {child for root in pids for child in _process_tree(root)}:
+        rss, hwm = _rss_bytes(pid)
+        if rss is None:
+            return None, None
+        current += rss
+        peak += hwm
+    return round(current / 2 ** 20, 1), round(peak / 2 ** 20, 1)
+
+
+def _percentile(ordered, percent):
+    """Nearest-rank percentile of an already sorted list"""
+    if not ordered:
+        return None
+    rank = max(1, -(-len(ordered) * percent // 100))
+    return ordered[int(rank) - 1]
+
+
+def make_sample_pdf(pages):
+    import fitz
+
+    document = fitz.open()
+    line = "Study Karo load test text: the quick brown fox jumps over the lazy dog."
+    for page_number in range(pages):
+        page = document.new_page()
+        for row in range(40):
+            page.insert_text((40, 50 + row * 18), f"{page_number + 1}.{row} {line}")
+    return document.tobytes()
+
+
+class Scenarios:
+    """Builds the request for the n-th call of each scenario"""
+
+    def __init__(self, args, email, token, pdf):
+        self.args = args
+        self.email = email
+        self.auth = {"Authorization": f"Bearer {token}"}
+        self.pdf = pdf
+        self.summary_text = " ".join(f"word{index % 997}" for index in range(args.summary_words))
+
+    def _generation(self, index):
+        # Distinct prompts and a non-zero temperature keep the response cache out of the measurement
+        return {
+            "model": self.args.model,
+            "prompt": f"Benchmark prompt {index} {uuid.uuid4().hex}",
+            "apiKey": "benchmark-key",
+            "provider": self.args.provider,
+            "options": {"temperature": 0.7},
+        }
+
+    def request(self, name, index):
+        if name == "auth-login":
+            return "POST", "/api/auth/login", {"json": {"email": self.email, "password": PASSWORD}}
+        if name == "auth-me":
+            return "GET", "/api/auth/me", {"headers": self.auth}
+        if name == "ai-generate":
+            return "POST", "/api/ai/generate", {"json": self._generation(index), "headers": self.auth}
+        if name == "ai-generate-stream":
+            return "POST", "/api/ai/generate/stream", {"json": self._generation(index), "headers": self.auth}
+        if name == "pdf-extract":
+            files = {"pdf": (f"bench-{index}.pdf", self.pdf, "application/pdf")}
+            return "POST", "/api/pdf/extract", {"files": files, "headers": self.auth}
+        if name == "pdf-summarize":
+            body = {**self._generation(index), "text": self.summary_text}
+            return "POST", "/api/pdf/summarize", {"json": body, "headers": self.auth}
+        raise ValueError(f"Unknown scenario: {name}")
+
+
+def run_level(client, scenarios, name, concurrency, total, warmup, pids):
+    def one(index):
+        method, path, kwargs = scenarios.request(name, index)
+        started = time.perf_counter()
+        try:
+            # Reading the whole body also times streamed responses to their last event
+            response = client.request(method, path, **kwargs)
+            status = response.status_code
+        except httpx.HTTPError:
+            status = None
+        return status, time.perf_counter() - started
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(warmup)))
+        started = time.perf_counter()
+        samples = list(pool.map(one, range(warmup, warmup + total)))
+        elapsed = time.perf_counter() - started
+
+    latencies = sorted(seconds * 1000 for _, seconds in samples)
+    statuses = {}
+    for status, _ in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    rss_mb, peak_rss_mb = memory_mb(pids)
+    return {
+        "scenario": name,
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": sum(count for status, count in statuses.items() if status == "None" or int(status) >= 400),
+        "statuses": statuses,
+        "seconds": round(elapsed, 3),
+        "requestsPerSecond": round(total / elapsed, 2),
+        "latencyMs": {
+            "p50": round(_percentile(latencies, 50), 2),
+            "p95": round(_percentile(latencies, 95), 2),
+            "p99": round(_percentile(latencies, 99), 2),
+            "max": round(latencies[-1], 2),
+            "mean": round(sum(latencies) / len(latencies), 2),
+        },
+        "rssMb": rss_mb,
+        "peakRssMb": peak_rss_mb,
+    }
+
+
+def start_local_server(args, provider):
+    """Serve create_app() from a threaded werkzeug server; returns (base_url, server)"""
+    os.environ.update(provider.provider_env())
+    os.environ["DATABASE_URL"] = args.database_url
+    os.environ.setdefault("DB_CREATE_ALL", "true")
+    # Measure the routes rather than the per-key rate limit or the caches
+    os.environ.setdefault("AI_RATE_PER_SECOND", "0")
+    os.environ.setdefault("AI_CACHE_ENABLED", "false")
+    os.environ.setdefault("PDF_CACHE_ENABLED", "false")
+    max_concurrency = str(max(args.concurrency))
+    os.environ.setdefault("PROVIDER_POOL_SIZE", max_concurrency)
+    os.environ.setdefault("PROVIDER_KEEPALIVE_CONNECTIONS", max_concurrency)
+    os.environ.setdefault("PASSWORD_HASH_QUEUE", str(max(args.concurrency) * 2))
+
+    sys.path.insert(0, BACKEND_DIR)
+    from werkzeug.serving import WSGIRequestHandler, make_server
+    from application import create_app
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server("127.0.0.1", 0, create_app(), threaded=True, request_handler=QuietHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}", server
+
+
+def sign_up(client):
+    email = f"bench-{uuid.uuid4().hex[:12]}@example.com"
+    response = client.post("/api/auth/register", json={"email": email, "name": "Benchmark", "password": PASSWORD})
+    response.raise_for_status()
+    return email, response.json()["token"]
+
+
+def git_commit():
+    try:
+        completed = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                                   capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return completed.stdout.strip()
+
+
+def compare(results, baseline_path):
+    """Attach the throughput and p95 change against the matching baseline result"""
+    with open(baseline_path) as f:
+        baseline = {(r["scenario"], r["concurrency"]): r for r in json.load(f)["results"]}
+    for result in results:
+        before = baseline.get((result["scenario"], result["concurrency"]))
+        if before is None:
+            continue
+        result["baseline"] = {
+            "requestsPerSecond": before["requestsPerSecond"],
+            "p95Ms": before["latencyMs"]["p95"],
+            "throughputChangePercent": round(
+                (result["requestsPerSecond"] / before["requestsPerSecond"] - 1) * 100, 1
+            ) if before["requestsPerSecond"] else None,
+            "p95ChangePercent": round(
+                (result["latencyMs"]["p95"] / before["latencyMs"]["p95"] - 1) * 100, 1
+            ) if before["latencyMs"]["p95"] else None,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS, help="scenario to run (repeatable; default all)")
+    parser.add_argument("--concurrency", default="1,8,32", help="comma separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=200, help="measured requests per scenario and level")
+    parser.add_argument("--warmup", type=int, default=5, help="unmeasured requests before each level")
+    parser.add_argument("--provider", default="openai", choices=("openai", "google", "perplexity"))
+    parser.add_argument("--model", default="gpt-4o-mini")
+    parser.add_argument("--pdf", help="PDF to upload for pdf-extract (default: a generated one)")
+    parser.add_argument("--pdf-pages", type=int, default=20, help="pages of the generated PDF")
+    parser.add_argument("--summary-words", type=int, default=2000, help="document size for pdf-summarize")
+    parser.add_argument("--database-url", help="database for the local server (default: a temporary SQLite file)")
+    parser.add_argument("--url", help="load this running server instead of starting one")
+    parser.add_argument("--server-pid", type=int, action="append", default=[], help="pid whose RSS to report with --url")
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    parser.add_argument("--baseline", help="earlier JSON report to compare against")
+    add_behavior_arguments(parser)
+    parser.set_defaults(latency=0.2)
+    args = parser.parse_args()
+    args.concurrency = [int(level) for level in args.concurrency.split(",")]
+
+    # The in-process app prints debug lines; keep stdout for the JSON report
+    with tempfile.TemporaryDirectory() as scratch, contextlib.redirect_stdout(sys.stderr):
+        provider = None
+        if args.url:
+            base_url, pids = args.url.rstrip("/"), args.server_pid
+        else:
+            provider = start_fake_provider(**behavior_options(args))
+            args.database_url = args.database_url or f"sqlite:///{os.path.join(scratch, 'bench.db')}"
+            base_url, _ = start_local_server(args, provider)
+            pids = [os.getpid()]
+
+        pdf = open(args.pdf, "rb").read() if args.pdf else make_sample_pdf(args.pdf_pages)
+        limits = httpx.Limits(max_connections=max(args.concurrency), max_keepalive_connections=max(args.concurrency))
+        with httpx.Client(base_url=base_url, limits=limits, timeout=120) as client:
+            email, token = sign_up(client)
+            scenarios = Scenarios(args, email, token, pdf)
+            results = []
+            for name in args.scenario or SCENARIOS:
+                for concurrency in args.concurrency:
+                    if provider is not None:
+                        provider.reset_stats()
+                    result = run_level(client, scenarios, name, concurrency, args.requests, args.warmup, pids)
+                    if provider is not None:
+                        result["provider"] = provider.stats()
+                    results.append(result)
+                    print(f"{name} x{concurrency}: {result['requestsPerSecond']} req/s, "
+                          f"p95 {result['latencyMs']['p95']} ms", file=sys.stderr)
+
+    if args.baseline:
+        compare(results, args.baseline)
+    report = {
+        "commit": git_commit(),
+        "startedAt": datetime.now(timezone.utc).isoformat(),
+        "python": sys.version.split()[0],
+        "cpuCount": os.cpu_count(),
+        "target": args.url or "in-process werkzeug",
+        "provider": behavior_options(args) if not args.url else None,
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
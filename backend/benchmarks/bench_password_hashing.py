@@ -0,0 +1,95 @@
+"""Logins/sec per core for each password hash scheme and cost.
+
+Every configuration is measured twice: password checks on one thread, and
+on the bounded hashing pool with PASSWORD_HASH_WORKERS threads (one per core
+by default) driven by as many concurrent callers. The pool figure divided by
+its workers is the logins/sec one core can serve.
+
+    python -m benchmarks.bench_password_hashing --seconds 3
+    python -m benchmarks.bench_password_hashing --scheme bcrypt:10 --scheme bcrypt:12
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_SCHEMES = ("scrypt:32768", "pbkdf2:600000", "bcrypt:12")
+COST_SETTINGS = {
+    "scrypt": "PASSWORD_SCRYPT_N",
+    "pbkdf2": "PASSWORD_PBKDF2_ITERATIONS",
+    "bcrypt": "PASSWORD_BCRYPT_ROUNDS",
+}
+
+
+def _rate(check, seconds, callers):
+    """Checks per second with ``callers`` threads calling ``check`` for ``seconds``"""
+    deadline = time.perf_counter() + seconds
+
+    def loop():
+        count = 0
+        while time.perf_counter() < deadline:
+            check()
+            count += 1
+        return count
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=callers) as pool:
+        total = sum(pool.map(lambda _: loop(), range(callers)))
+    return total / (time.perf_counter() - started)
+
+
+def measure(app, scheme, cost, seconds):
+    from application import passwords
+
+    app.config["PASSWORD_HASH_SCHEME"] = scheme
+    app.config[COST_SETTINGS[scheme]] = cost
+    workers = app.config["PASSWORD_HASH_WORKERS"]
+
+    def in_context(function):
+        def run():
+            with app.app_context():
+                return function()
+        return run
+
+    with app.app_context():
+        stored = passwords.hash_password_sync("correct horse battery staple")
+
+    single = _rate(in_context(lambda: passwords.verify_password_sync(stored, "correct horse battery staple")),
+                   seconds, 1)
+    pooled = _rate(in_context(lambda: passwords.verify_password(stored, "correct horse battery staple")),
+                   seconds, workers)
+    return {
+        "scheme": scheme,
+        "cost": cost,
+        "hashLength": len(stored),
+        "singleThreadPerSecond": round(single, 1),
+        "poolWorkers": workers,
+        "poolPerSecond": round(pooled, 1),
+        "perCorePerSecond": round(pooled / min(workers, os.cpu_count() or 1), 1),
+        "millisecondsPerLogin": round(1000 / single, 1) if single else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scheme", action="append", metavar="NAME:COST",
+                        help="scheme and cost to measure (repeatable), e.g. bcrypt:12")
+    parser.add_argument("--seconds", type=float, default=3.0, help="measuring time per mode")
+    args = parser.parse_args()
+
+    os.environ.setdefault("DATABASE_URL", "sqlite://")
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from application import create_app
+
+    app = create_app()
+    results = []
+    for spec in args.scheme or DEFAULT_SCHEMES:
+        scheme, cost = spec.split(":")
+        results.append(measure(app, scheme, int(cost), args.seconds))
+    print(json.dumps({"cpuCount": os.cpu_count(), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
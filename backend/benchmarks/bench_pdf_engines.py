@@ -0,0 +1,131 @@
+"""Pages/sec and peak RSS for every installed PDF extraction engine.
+
+Each (engine, file) pair runs in a fresh interpreter so peak RSS is not
+polluted by earlier runs. Without arguments a set of synthetic sample PDFs
+is generated with PyMuPDF.
+
+    python -m benchmarks.bench_pdf_engines [file.pdf | directory ...]
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_SIZES = (10, 100, 300)
+
+
+def _peak_rss_bytes():
+    # VmHWM is reset by exec; ru_maxrss can carry the forking parent's peak on Linux
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is kilobytes on Linux and bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def run_worker(engine_name, path, repeat):
+    """Extract ``path`` with one engine and print a JSON result line"""
+    sys.path.insert(0, BACKEND_DIR)
+    from application.pdf_engines import get_engine
+
+    engine = get_engine(engine_name)
+    baseline_rss = _peak_rss_bytes()
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        page_count = engine.page_count(path)
+        pages = engine.extract_range(path, 0, page_count)
+    elapsed = (time.perf_counter() - started) / repeat
+
+    print(json.dumps({
+        "engine": engine_name,
+        "file": os.path.basename(path),
+        "pages": page_count,
+        "characters": sum(len(page) for page in pages),
+        "seconds": round(elapsed, 4),
+        "pagesPerSecond": round(page_count / elapsed, 1) if elapsed else None,
+        "peakRssMb": round(_peak_rss_bytes() / 2 ** 20, 1),
+        "extractionRssMb": round((_peak_rss_bytes() - baseline_rss) / 2 ** 20, 1),
+    }))
+
+
+def make_samples(directory):
+    import fitz
+
+    paths = []
+    line = "Study Karo benchmark text: the quick brown fox jumps over the lazy dog."
+    for page_total in SAMPLE_SIZES:
+        document = fitz.open()
+        for page_number in range(page_total):
+            page = document.new_page()
+            for row in range(40):
+                page.insert_text((40, 50 + row * 18), f"{page_number + 1}.{row} {line}")
+        path = os.path.join(directory, f"sample_{page_total}_pages.pdf")
+        document.save(path)
+        paths.append(path)
+    return paths
+
+
+def collect_pdfs(arguments):
+    paths = []
+    for argument in arguments:
+        if os.path.isdir(argument):
+            paths.extend(
+                os.path.join(argument, name) for name in sorted(os.listdir(argument))
+                if name.lower().endswith(".pdf")
+            )
+        else:
+            paths.append(argument)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="*", help="PDF files or directories of PDFs")
+    parser.add_argument("--engines", help="comma separated engine names (default: all installed)")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--worker", nargs=2, metavar=("ENGINE", "PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker[0], args.worker[1], args.repeat)
+        return
+
+    sys.path.insert(0, BACKEND_DIR)
+    from application.pdf_engines import available_engines
+
+    engines = args.engines.split(",") if args.engines else available_engines()
+    with tempfile.TemporaryDirectory() as sample_dir:
+        paths = collect_pdfs(args.paths) if args.paths else make_samples(sample_dir)
+        results = []
+        for path in paths:
+            for engine_name in engines:
+                completed = subprocess.run(
+                    [sys.executable, "-m", "benchmarks.bench_pdf_engines",
+                     "--worker", engine_name, path, "--repeat", str(args.repeat)],
+                    cwd=BACKEND_DIR, capture_output=True, text=True
+                )
+                if completed.returncode != 0:
+                    results.append({
+                        "engine": engine_name,
+                        "file": os.path.basename(path),
+                        "error": completed.stderr.strip().splitlines()[-1:],
+                    })
+                    continue
+                results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    print(json.dumps({"results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
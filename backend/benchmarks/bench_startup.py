@@ -0,0 +1,104 @@
+"""Startup time of create_app, with import time per module.
+
+Every run is a fresh interpreter started with ``-X importtime``; the report
+holds the median over runs of the total start-up time, the create_app call,
+and the self/cumulative import time of the slowest modules and of every
+application module. With --budget-ms the exit status is 1 when the median
+start-up exceeds the budget, so a CI step can catch regressions.
+
+    python -m benchmarks.bench_startup --runs 5
+    python -m benchmarks.bench_startup --budget-ms 800 --top 15
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WORKER = """
+import json, time
+started = time.perf_counter()
+from application import create_app
+imported = time.perf_counter()
+create_app()
+finished = time.perf_counter()
+print(json.dumps({"importMs": (imported - started) * 1000, "createAppMs": (finished - imported) * 1000}))
+"""
+
+
+def parse_importtime(stderr):
+    """{module: (self_us, cumulative_us)} from ``-X importtime`` output"""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+
+def run_once(extra_env):
+    env = {**os.environ, "DATABASE_URL": "sqlite://", "DB_CREATE_ALL": "false", **extra_env}
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", WORKER],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True
+    )
+    timings = json.loads(completed.stdout.strip().splitlines()[-1])
+    return timings, parse_importtime(completed.stderr)
+
+
+def _median_ms(values):
+    return round(statistics.median(values) / 1000, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=20, help="slowest modules to list by self time")
+    parser.add_argument("--budget-ms", type=float, help="fail when the median start-up exceeds this")
+    parser.add_argument("--env", action="append", default=[], metavar="NAME=VALUE",
+                        help="extra environment for the measured interpreter (repeatable)")
+    args = parser.parse_args()
+
+    extra_env = dict(item.split("=", 1) for item in args.env)
+    runs = [run_once(extra_env) for _ in range(args.runs)]
+
+    per_module = {}
+    for _, modules in runs:
+        for name, times in modules.items():
+            per_module.setdefault(name, []).append(times)
+
+    def module_entry(name):
+        samples = per_module[name]
+        return {
+            "module": name,
+            "selfMs": _median_ms([self_us for self_us, _ in samples]),
+            "cumulativeMs": _median_ms([cumulative_us for _, cumulative_us in samples]),
+        }
+
+    slowest = sorted(per_module, key=lambda name: statistics.median(s for s, _ in per_module[name]), reverse=True)
+    import_ms = statistics.median(timings["importMs"] for timings, _ in runs)
+    create_app_ms = statistics.median(timings["createAppMs"] for timings, _ in runs)
+    startup_ms = import_ms + create_app_ms
+    report = {
+        "runs": args.runs,
+        "startupMs": round(startup_ms, 2),
+        "importMs": round(import_ms, 2),
+        "createAppMs": round(create_app_ms, 2),
+        "modulesImported": len(per_module),
+        "application": [module_entry(name) for name in sorted(per_module) if name.startswith("application")],
+        "slowestBySelf": [module_entry(name) for name in slowest[:args.top]],
+    }
+    if args.budget_ms is not None:
+        report["budgetMs"] = args.budget_ms
+        report["withinBudget"] = startup_ms <= args.budget_ms
+    print(json.dumps(report, indent=2))
+    if args.budget_ms is not None and startup_ms > args.budget_ms:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""Local stand-in for the OpenAI, Gemini and Perplexity HTTP APIs.
+
+Point the backend at it with OPENAI_BASE_URL, GOOGLE_BASE_URL and
+PERPLEXITY_BASE_URL so benchmarks never spend real API credits.
+
+Latency can vary with --jitter, a share of requests can fail with
+--error-rate (rate-limit and server errors the backend retries or reports),
+and streaming requests get --stream-chunks server-sent events spaced
+--chunk-delay seconds apart.
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeProviderServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, address, latency=0.5, jitter=0.0, error_rate=0.0, error_status=503,
+                 stream_chunks=20, chunk_delay=0.02):
+        super().__init__(address, FakeProviderHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.stream_chunks = stream_chunks
+        self.chunk_delay = chunk_delay
+        self.errors_sent = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.requests_served = 0
+        self._lock = threading.Lock()
+
+    def handle_error(self, request, client_address):
+        # Clients hanging up mid-response (a cancelled hedge, an aborted stream) are expected under load
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def provider_env(self):
+        """Environment overrides that route every provider to this server"""
+        return {
+            "OPENAI_BASE_URL": f"{self.base_url}/v1",
+            "GOOGLE_BASE_URL": f"{self.base_url}/v1beta",
+            "PERPLEXITY_BASE_URL": self.base_url,
+        }
+
+    def track(self, delta):
+        with self._lock:
+            self.in_flight += delta
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            if delta < 0:
+                self.requests_served += 1
+
+    def reset_stats(self):
+        with self._lock:
+            self.peak_in_flight = self.in_flight
+            self.requests_served = 0
+            self.errors_sent = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requestsServed": self.requests_served,
+                "errorsSent": self.errors_sent,
+                "peakInFlight": self.peak_in_flight,
+            }
+
+    def response_delay(self):
+        return max(0.0, self.latency + random.uniform(-self.jitter, self.jitter))
+
+    def should_fail(self):
+        if self.error_rate <= 0 or random.random() >= self.error_rate:
+            return False
+        with self._lock:
+            self.errors_sent += 1
+        return True
+
+
+class FakeProviderHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        gemini = "/models/" in self.path
+        self.server.track(1)
+        try:
+            time.sleep(self.server.response_delay())
+            if self.server.should_fail():
+                headers = {"Retry-After": "1"} if self.server.error_status == 429 else {}
+                self._send_json({"error": {"message": "Fake provider error"}}, self.server.error_status, headers)
+            elif gemini and "streamGenerateContent" in self.path:
+                self._send_stream(lambda text: {"candidates": [{"content": {"parts": [{"text": text}]}}]}, done=False)
+            elif body.get("stream"):
+                self._send_stream(lambda text: {"choices": [{"delta": {"content": text}}]}, done=True)
+            elif gemini:
+                self._send_json({"candidates": [{"content": {"parts": [{"text": "Fake Gemini reply"}]}}]})
+            else:
+                self._send_json({"choices": [{"message": {"content": f"Fake reply from {body.get('model')}"}}]})
+        finally:
+            self.server.track(-1)
+
+    def _send_stream(self, event, done):
+        """Server-sent events in HTTP/1.1 chunks, one token per event"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for index in range(self.server.stream_chunks):
+            if index:
+                time.sleep(self.server.chunk_delay)
+            self._write_chunk(f"data: {json.dumps(event(f'token{index} '))}\n\n")
+        if done:
+            self._write_chunk("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _write_chunk(self, text):
+        data = text.encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _send_json(self, payload, status=200, headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def start_fake_provider(host="127.0.0.1", port=0, latency=0.5, **behavior):
+    """Start the server on a background thread and return it; ``behavior`` takes the
+    FakeProviderServer options (jitter, error_rate, error_status, stream_chunks, chunk_delay)"""
+    server = FakeProviderServer((host, port), latency=latency, **behavior)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def add_behavior_arguments(parser):
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds per response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="latency varies uniformly by +/- this")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests that fail (0-1)")
+    parser.add_argument("--error-status", type=int, default=503, help="status of failed requests, e.g. 429")
+    parser.add_argument("--stream-chunks", type=int, default=20, help="events per streamed response")
+    parser.add_argument("--chunk-delay", type=float, default=0.02, help="seconds between streamed events")
+
+
+def behavior_options(args):
+    return {
+        "latency": args.latency,
+        "jitter": args.jitter,
+        "error_rate": args.error_rate,
+        "error_status": args.error_status,
+        "stream_chunks": args.stream_chunks,
+        "chunk_delay": args.chunk_delay,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8085)
+    add_behavior_arguments(parser)
+    args = parser.parse_args()
+
+    server = FakeProviderServer((args.host, args.port), **behavior_options(args))
+    for name, value in server.provider_env().items():
+        print(f"export {name}={value}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+# gunicorn -c gunicorn.conf.py
+import gc
+import os
+
+from application import _env_flag
+
+
+wsgi_app = "run:app"
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5001')
+workers = int(os.environ.get('GUNICORN_WORKERS', 2 * (os.cpu_count() or 1) + 1))
+# A login holds its request thread for the whole password hash; the hash pool
+# (PASSWORD_HASH_WORKERS) only limits how many run at once, not how many threads wait
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+# Load the app once in the master and fork workers from it, so imported code is shared copy-on-write
+preload_app = _env_flag('GUNICORN_PRELOAD', True)
+
+
+def when_ready(server):
+    if not preload_app:
+        return
+    from application.startup import preload
+    preload(server.app.wsgi())
+    # Move everything allocated so far out of the collector's reach: collections in the
+    # workers would otherwise touch (and so copy) every shared page holding these objects
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    if not preload_app:
+        return
+    from application.startup import after_fork
+    after_fork(server.app.wsgi())
+
+
+def post_worker_init(worker):
+    # Without --preload the app is only loaded in the worker, so post_fork has nothing to work with
+    if preload_app:
+        return
+    from application.startup import start_jobs
+    start_jobs(worker.wsgi)
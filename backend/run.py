@@ -1,5 +1,11 @@
+import os
+
 from application import create_app
 
+if __name__ == "__main__":
+    # The development server creates missing tables itself; see DB_CREATE_ALL in create_app
+    os.environ.setdefault('DB_CREATE_ALL', 'true')
+
 app = create_app()
 
 if __name__ == "__main__":